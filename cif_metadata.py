@@ -0,0 +1,150 @@
+import argparse
+from concurrent.futures import ProcessPoolExecutor
+from dataclasses import dataclass
+from functools import lru_cache
+from io import BytesIO
+from pathlib import Path
+from typing import Sequence, Union, Tuple, Optional, Iterable
+
+import numpy as np
+from ase.io import read
+
+from ami.archive import IndexedArchive
+from ami.path_list import read_path_list
+from raspa import find_minimum_image
+
+
+def describe_cif(source: Union[str, Path, bytes], cutoff: float) -> Optional[Tuple[np.ndarray, Tuple[int, int, int], int]]:
+    """Returns (cell, supercell multiplicities, number of atoms) for a CIF file, or the content of one,
+    'None' if it cannot be parsed.
+    """
+    try:
+        atoms = read(BytesIO(source) if isinstance(source, bytes) else str(source), format="cif")
+        cell = np.array(atoms.cell)
+        return cell, find_minimum_image(cell, cutoff), len(atoms)
+    except Exception:
+        return None
+
+
+@lru_cache(maxsize=1)
+def _open_archive(path: str) -> IndexedArchive:
+    return IndexedArchive.open(path)
+
+
+def describe_archive_entry(path: str, i: int, cutoff: float) -> Optional[Tuple[np.ndarray, Tuple[int, int, int], int]]:
+    """Same as `describe_cif` for entry `i` of the archive at `path`, opened once per process."""
+    return describe_cif(_open_archive(path)[i], cutoff)
+
+
+@dataclass(frozen=True, slots=True)
+class CifMetadata:
+    """Per-framework metadata derived from CIF files, indexed like the CIF list.
+
+    Computed once per library (in parallel) and stored in a single `.npz` file so that calculators and
+    schedulers can look entries up in O(1) instead of parsing CIF files on the fly.
+    Frameworks that could not be parsed are flagged in `valid` and can be excluded before screening starts.
+    """
+    cells: np.ndarray
+    supercells: np.ndarray
+    n_atoms: np.ndarray
+    volumes: np.ndarray
+    valid: np.ndarray
+    cutoff: float
+
+    @classmethod
+    def from_cif_list(cls, paths: Sequence[Union[str, Path]], cutoff: float = 16.0, max_workers: Optional[int] = None,
+                      chunksize: int = 64):
+        n = len(paths)
+        with ProcessPoolExecutor(max_workers=max_workers) as pool:
+            return cls._from_described(n, pool.map(describe_cif, paths, [cutoff] * n, chunksize=chunksize), cutoff)
+
+    @classmethod
+    def from_archive(cls, path: Union[str, Path], cutoff: float = 16.0, max_workers: Optional[int] = None,
+                     chunksize: int = 64):
+        """Same as `from_cif_list` for the CIFs packed in an `ami.archive` file, indexed like its entries.
+        CIFs are read from the archive itself, the original files are not needed.
+        """
+        archive = IndexedArchive.open(path)
+        n = len(archive)
+        archive.close()
+        with ProcessPoolExecutor(max_workers=max_workers) as pool:
+            described = pool.map(describe_archive_entry, [str(path)] * n, range(n), [cutoff] * n, chunksize=chunksize)
+            return cls._from_described(n, described, cutoff)
+
+    @classmethod
+    def _from_described(cls, n: int, described: Iterable[Optional[Tuple[np.ndarray, Tuple[int, int, int], int]]],
+                        cutoff: float):
+        cells = np.zeros((n, 3, 3), dtype=float)
+        supercells = np.zeros((n, 3), dtype=np.int16)
+        n_atoms = np.zeros(n, dtype=np.int32)
+        valid = np.zeros(n, dtype=bool)
+        for i, desc in enumerate(described):
+            if desc is None:
+                continue
+            cells[i], supercells[i], n_atoms[i] = desc
+            valid[i] = True
+        volumes = np.abs(np.linalg.det(cells))
+        return cls(cells=cells, supercells=supercells, n_atoms=n_atoms, volumes=volumes, valid=valid, cutoff=cutoff)
+
+    @classmethod
+    def from_list_in_file(cls, path: Union[str, Path], **kwargs):
+        return cls.from_cif_list(read_path_list(path), **kwargs)
+
+    @classmethod
+    def load(cls, path: Union[str, Path]):
+        with np.load(path) as data:
+            return cls(
+                cells=data["cells"],
+                supercells=data["supercells"],
+                n_atoms=data["n_atoms"],
+                volumes=data["volumes"],
+                valid=data["valid"],
+                cutoff=float(data["cutoff"])
+            )
+
+    def save(self, path: Union[str, Path]) -> None:
+        with Path(path).open(mode="wb") as fd:
+            np.savez(
+                fd,
+                cells=self.cells,
+                supercells=self.supercells,
+                n_atoms=self.n_atoms,
+                volumes=self.volumes,
+                valid=self.valid,
+                cutoff=self.cutoff
+            )
+
+    def invalid(self) -> np.ndarray:
+        """Indices of frameworks whose CIF could not be parsed."""
+        return np.flatnonzero(~self.valid)
+
+    def simulated_atoms(self) -> np.ndarray:
+        """Number of framework atoms in the simulated supercell, a proxy for the cost of a simulation."""
+        return self.n_atoms * np.prod(self.supercells, axis=1, dtype=np.int64)
+
+    def cost_features(self) -> np.ndarray:
+        """Features of the cost of a simulation, shape (n, 2): log of simulated atoms and of the supercell volume."""
+        multiplicity = np.prod(self.supercells, axis=1, dtype=np.int64)
+        atoms = np.maximum(self.simulated_atoms(), 1)
+        volume = np.maximum(self.volumes * multiplicity, 1.0)
+        return np.column_stack((np.log(atoms), np.log(volume)))
+
+    def __len__(self) -> int:
+        return len(self.valid)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Precompute CIF metadata for a list of CIF files.")
+    parser.add_argument('cif_list', type=str, help='File listing the paths to the CIF files.')
+    parser.add_argument('output', type=str, help='Output `.npz` file.')
+    parser.add_argument('-j', type=int, help='Number of processes.', default=None)
+    parser.add_argument('-c', type=float, help='Cutoff used to compute supercells.', default=16.0)
+    parser.add_argument('--archive', action='store_true', help='`cif_list` is an archive packed with `python -m ami.archive`.')
+    args = parser.parse_args()
+
+    if args.archive:
+        metadata = CifMetadata.from_archive(args.cif_list, cutoff=args.c, max_workers=args.j)
+    else:
+        metadata = CifMetadata.from_list_in_file(args.cif_list, cutoff=args.c, max_workers=args.j)
+    metadata.save(args.output)
+    print(F'{len(metadata)} frameworks, {len(metadata.invalid())} invalid.')
@@ -1,6 +1,6 @@
 from .calculator import CalculatorInterface, OpaqueParameters, OpaqueResults
 from .data_manager import DataManagerInterface, Index, StateMachineInterface, SurrogateProviderInterface, \
-    TruthProviderInterface
+    TruthProviderInterface, PersistenceInterface
 from .event_loop import EventLoopInterface
 from .factory import FactoryInterface
 from .ranker import RankerInterface
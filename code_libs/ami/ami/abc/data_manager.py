@@ -1,9 +1,11 @@
 import abc
-from typing import Sequence, Collection, Tuple
+from typing import Sequence, Collection, Tuple, Mapping
+
+import numpy as np
 
 from ami.abc.calculator import OpaqueParameters
 from ami.abc.surrogate import Feature, Target
-from ami.option import Option
+from ami.option import Option, Some
 from ami.result import Result
 
 Index = int
@@ -18,6 +20,9 @@ class StateMachineInterface(abc.ABC):
     1. self.reset and default value is (not done, available, not failed)
     2. self.select transforms state to (not done, not available, not failed)
     3. self.set transforms state to (done, not available, failed/not failed)
+
+    Sequences returned by 'list_*' and '*_indices' may be read-only views of internal state, valid until the next
+    transition: copy them to modify or keep them.
     """
 
     @abc.abstractmethod
@@ -44,6 +49,39 @@ class StateMachineInterface(abc.ABC):
     def __len__(self) -> int:
         """Returns the number of samples managed by the state machine."""
 
+    def select_many(self, indices: Sequence[Index]) -> None:
+        """Same as 'select' for all 'indices'. Implementations should override this with a bulk operation."""
+        for index in indices:
+            self.select(index)
+
+    def set_many(self, indices: Sequence[Index], success: Collection[bool]) -> None:
+        """Same as 'set' for all 'indices'. Implementations should override this with a bulk operation."""
+        for index, ok in zip(indices, np.broadcast_to(success, np.shape(indices))):
+            self.set(index, bool(ok))
+
+    def is_available(self, index: Index) -> bool:
+        """'True' if 'index' is not done and not running, else 'False'."""
+        return bool(self.list_available()[index])
+
+    def available_indices(self) -> Sequence[Index]:
+        """Returns sorted indices which are not done and not running."""
+        return np.flatnonzero(self.list_available())
+
+    def done_indices(self, include_failures=False) -> Sequence[Index]:
+        """Returns sorted indices whose calculation is done."""
+        return np.flatnonzero(self.list_done(include_failures))
+
+    def counts(self) -> Mapping[str, int]:
+        """Returns the number of 'available', 'running', 'done' (including failures) and 'failed' samples."""
+        available = int(np.sum(self.list_available()))
+        done = int(np.sum(self.list_done(include_failures=True)))
+        succeeded = int(np.sum(self.list_done(include_failures=False)))
+        return {"available": available, "running": len(self) - available - done, "done": done,
+                "failed": done - succeeded}
+
+    def flush(self) -> None:
+        """Makes state changes durable. Does nothing by default."""
+
 
 class SurrogateProviderInterface(abc.ABC):
     @abc.abstractmethod
@@ -58,6 +96,11 @@ class SurrogateProviderInterface(abc.ABC):
     def set_target(self, index: Index, value: Option[Target]) -> None:
         """Sets internal target value to 'value' if Some(value). Ignore otherwise."""
 
+    def set_targets(self, indices: Sequence[Index], values: Sequence[Target]) -> None:
+        """Sets internal target values at 'indices'. Implementations should override this with a bulk operation."""
+        for index, value in zip(indices, values):
+            self.set_target(index, Some(value))
+
     @abc.abstractmethod
     def __len__(self) -> int:
         """Returns the number of samples managed by the surrogate provider."""
@@ -82,6 +125,9 @@ class TruthProviderInterface(abc.ABC):
     def parameters(self, index: Index, state: StateMachineInterface) -> Option[OpaqueParameters]:
         """Returns parameters at index 'index'. They must be bytes-like and will be decoded by the calculator."""
 
+    def prefetch(self, indices: Sequence[Index]) -> None:
+        """Hints that parameters at 'indices' will soon be requested. Does nothing by default."""
+
     @abc.abstractmethod
     def __len__(self) -> int:
         """Returns the number of samples managed by the truth provider."""
@@ -97,12 +143,87 @@ class StatelessTruthProviderInterface(abc.ABC):
         """Returns the number of samples managed by the truth provider."""
 
 
+class PersistenceInterface(abc.ABC):
+    """Append-only log of results, written as they are reported."""
+
+    @abc.abstractmethod
+    def append_valid_result(self, index: Index, value: Target) -> None:
+        """Logs the successful result 'value' of the calculation at 'index'."""
+
+    @abc.abstractmethod
+    def append_invalid_result(self, index: Index) -> None:
+        """Logs the failure of the calculation at 'index'."""
+
+    def append_results(self, indices: Sequence[Index], values: Sequence[Target], success: Collection[bool]) -> None:
+        """Logs several results at once, 'values' at failed indices are ignored.
+        Implementations should override this with a single write.
+        """
+        for index, value, ok in zip(indices, values, success):
+            if ok:
+                self.append_valid_result(index, value)
+            else:
+                self.append_invalid_result(index)
+
+    def started(self, index: Index) -> None:
+        """Notes that the calculation at 'index' was dispatched. Does nothing by default."""
+
+    def cancelled(self, index: Index) -> None:
+        """Notes that the calculation at 'index' was cancelled and is available again. Does nothing by default."""
+
+    def flush(self) -> None:
+        """Makes logged results durable. Does nothing by default."""
+
+    def close(self) -> None:
+        """Flushes and releases the log, nothing is logged afterwards. Flushes by default."""
+        self.flush()
+
+
 class DataManagerInterface(StatelessSurrogateProviderInterface, StatelessTruthProviderInterface, abc.ABC):
 
     @abc.abstractmethod
     def available_for_calculation(self) -> Sequence[Index]:
-        """Returns a sequence of bools: True if no truth calculation is done or is running, else False."""
+        """Returns sorted indices for which no truth calculation is done or is running.
+        May be a read-only view, valid until the next change of state (see 'StateMachineInterface').
+        """
 
     @abc.abstractmethod
     def set_result(self, index: Index, value: Option[Target]) -> Result[..., Exception]:
         """Reports the result of a truth simulation."""
+
+    @abc.abstractmethod
+    def set_results(self, indices: Sequence[Index], targets: Sequence[Target],
+                    success: Collection[bool] = True) -> Result[int, Exception]:
+        """Ingests known results (e.g. prior data) at indices which were never dispatched, in one pass.
+
+        'targets' at failed indices ('success' is 'False') are ignored. Indices which are not available are skipped.
+        Returns the number of results ingested.
+        """
+
+    def is_available(self, index: Index) -> bool:
+        """'True' if no truth calculation is done or is running for 'index', else 'False'."""
+        return index in set(self.available_for_calculation())
+
+    def prefetch(self, indices: Sequence[Index]) -> None:
+        """Hints that parameters at 'indices' will soon be requested. Does nothing by default."""
+
+    def record_ranks(self, ranks: Sequence[Index]) -> None:
+        """Called with each new ranking of available indices, best first. Does nothing by default."""
+
+    def interrupted(self) -> Sequence[Index]:
+        """Returns indices whose calculation was interrupted, e.g. by a crash of a resumed run. Empty by default."""
+        return ()
+
+    def cancel(self, index: Index) -> None:
+        """Makes the running calculation at 'index' available again, e.g. once preempted."""
+        raise NotImplementedError(f"'{type(self).__name__}' cannot cancel calculations.")
+
+    def features(self, indices: Sequence[Index]) -> Sequence[Feature]:
+        """Returns features of 'indices' as passed to rankers, the indices themselves by default."""
+        return indices
+
+    def flush(self) -> None:
+        """Makes results and state reported so far durable, e.g. at the end of a run. Does nothing by default."""
+
+    def close(self) -> None:
+        """Flushes and releases logs and state, nothing is reported afterwards. Flushes by default."""
+        self.flush()
@@ -21,3 +21,9 @@ class RankerInterface(SchemaProviderInterface, abc.ABC):
     @abc.abstractmethod
     def fit(self, x: Sequence[Feature], y: Sequence[Target]) -> None:
         """Passes known data to the object, always called before self.rank."""
+
+    def fit_cost(self, x: Sequence[Feature], runtime: Sequence[float]) -> None:
+        """Passes observed wall times (in seconds) of calculations, called before self.rank when any is known.
+
+        Rankers ignoring the cost of calculations need not override it.
+        """
@@ -19,6 +19,17 @@ class SchedulerInterface(abc.ABC):
     def set_ranks(self, ranks: Option[Sequence[Index]]):
         """Sets ranking of internal indices. If 'Nothing', assume there is not change."""
 
+    def preempted(self) -> Sequence[Index]:
+        """Returns running indices which the latest ranking no longer justifies, to be cancelled. Empty by default.
+
+        Each index is only returned once.
+        """
+        return ()
+
+    def set_cancelled(self, index: Index) -> None:
+        """The calculation at 'index' was cancelled before completion and is available again."""
+        raise NotImplementedError(f"'{type(self).__name__}' cannot cancel calculations.")
+
     @abc.abstractmethod
     def needs_new_ranking(self) -> bool:
         """'True' if the scheduler wants new rankings to be estimated, else 'False'."""
@@ -34,6 +45,12 @@ class SchedulerInterface(abc.ABC):
             True
         """
 
+    def set_remaining(self, remaining: int) -> None:
+        """Sets the number of jobs left to dispatch, called before each 'next'.
+
+        Schedulers ignoring the budget need not override it.
+        """
+
     @abc.abstractmethod
     def next(self) -> Index:
         """Returns the next "best" index using current surrogate rankings."""
@@ -1,4 +1,5 @@
 import abc
+from typing import FrozenSet
 
 from ami.abc.calculator import CalculatorInterface
 from ami.abc.factory import FactoryInterface
@@ -15,3 +16,7 @@ class WorkerFactoryInterface(FactoryInterface[WorkerInterface], abc.ABC):
     @abc.abstractmethod
     def set_truth(self, truth: CalculatorInterface) -> None:
         """Sets the underlying truth source to 'truth'."""
+
+    @abc.abstractmethod
+    def set_affinity(self, cpus: FrozenSet[int], ranker_cpus: FrozenSet[int]) -> None:
+        """Sets the cores truth calculations and rankings are pinned to, empty sets meaning no pinning."""
@@ -1,8 +1,10 @@
 import abc
 from concurrent.futures import Future
-from typing import ContextManager
+from typing import ContextManager, Optional
 
+from ami.abc.calculator import CalculatorInterface
 from ami.abc.factory import FactoryInterface
+from ami.abc.ranker import RankerInterface
 from ami.abc.worker_factory import WorkerFactoryInterface
 from ami.serialized_opaque import SerializedOpaque
 from ami.surrogate_input import SurrogateInput
@@ -13,16 +15,35 @@ Index = int
 class WorkerExecutorInterface(abc.ABC):
 
     @abc.abstractmethod
-    def submit_fit_and_rank(self, inp: SurrogateInput) -> Future:
+    def submit_fit_and_rank(self, inp: SurrogateInput, ranker: Optional[RankerInterface] = None) -> Future:
         """Returns a 'Future' that wraps a 'Optional[Sequence[Index]]'.
 
         The sequence are indices mapping 'inp.unknown_x' ordered from best to worst.
         If no update is required, the 'Future' wraps 'None'.
+        If given, 'ranker' is used instead of the worker's own ranker.
         """
 
     @abc.abstractmethod
-    def submit_job(self, inp: SerializedOpaque) -> Future:
-        """Returns results from a truth calculation wrapped in a 'Future'."""
+    def submit_job(self, inp: SerializedOpaque, truth: Optional[CalculatorInterface] = None) -> Future:
+        """Returns results from a truth calculation wrapped in a 'Future'.
+
+        If given, 'truth' is used instead of the worker's own truth source.
+        """
+
+    def cancel(self, future: Future) -> bool:
+        """Asks the job behind 'future' to stop, returns 'False' if it cannot be cancelled (the default).
+
+        A cancelled job still completes its 'Future', usually with an exception.
+        """
+        return False
+
+    def capacity(self, running: int) -> Optional[int]:
+        """Number of slots to keep busy given 'running' futures, 'None' for the size of the pool (the default).
+
+        Pools resized while running return their current size: running jobs above it are not stopped,
+        their slots are just not refilled.
+        """
+        return None
 
 
 class WorkerPoolInterface(ContextManager, abc.ABC):
@@ -0,0 +1,103 @@
+"""Single-file archive of many small files with an offset index, read by random access through 'mmap'.
+
+Layout (little endian)
+----------------------
+
+    MAGIC | blob 0 | blob 1 | ... | index | names | footer
+
+* each blob is the (optionally zlib compressed) content of one file,
+* 'index' is an array of 'ENTRY' records (offset, stored length, original length, compressed flag),
+* 'names' are the original paths, utf8 encoded and separated by newlines,
+* 'footer' is 'FOOTER' packing (index offset, number of entries, names offset, names length, MAGIC).
+"""
+
+import argparse
+import mmap
+import struct
+import zlib
+from dataclasses import dataclass
+from pathlib import Path
+from typing import Sequence, Union, List
+
+import numpy as np
+
+from ami.path_list import read_path_list
+
+MAGIC = b"AMIARC01"
+ENTRY = np.dtype([("offset", "<u8"), ("length", "<u8"), ("size", "<u8"), ("compressed", "u1")])
+FOOTER = struct.Struct("<QQQQ8s")
+
+
+def pack(paths: Sequence[Union[str, Path]], output: Union[str, Path], compress: bool = False, level: int = 6) -> int:
+    """Packs files listed in 'paths' into the archive 'output', in order. Returns the number of entries.
+
+    With 'compress', each entry is compressed unless it would not get smaller.
+    """
+    index = np.zeros(len(paths), dtype=ENTRY)
+    with Path(output).open(mode="wb") as fd:
+        fd.write(MAGIC)
+        for i, path in enumerate(paths):
+            data = Path(path).read_bytes()
+            stored = zlib.compress(data, level) if compress else data
+            compressed = compress and len(stored) < len(data)
+            if not compressed:
+                stored = data
+            index[i] = (fd.tell(), len(stored), len(data), compressed)
+            fd.write(stored)
+        index_offset = fd.tell()
+        fd.write(index.tobytes())
+        names = "\n".join(str(p) for p in paths).encode("utf8")
+        names_offset = fd.tell()
+        fd.write(names)
+        fd.write(FOOTER.pack(index_offset, len(paths), names_offset, len(names), MAGIC))
+    return len(paths)
+
+
+@dataclass(frozen=True, slots=True)
+class IndexedArchive:
+    """Read-only random access to an archive written by 'pack'."""
+    path: Path
+    buffer: mmap.mmap
+    index: np.ndarray
+
+    @classmethod
+    def open(cls, path: Union[str, Path]):
+        path = Path(path)
+        with path.open(mode="rb") as fd:
+            # The mapping stays valid once the file is closed.
+            buffer = mmap.mmap(fd.fileno(), 0, access=mmap.ACCESS_READ)
+        if buffer[:len(MAGIC)] != MAGIC or len(buffer) < len(MAGIC) + FOOTER.size:
+            raise ValueError(f"'{path}' is not an archive.")
+        index_offset, size, _, _, magic = FOOTER.unpack_from(buffer, len(buffer) - FOOTER.size)
+        if magic != MAGIC:
+            raise ValueError(f"'{path}' is truncated or corrupted.")
+        index = np.frombuffer(buffer, dtype=ENTRY, count=size, offset=index_offset).copy()
+        return cls(path=path, buffer=buffer, index=index)
+
+    def __getitem__(self, i: int) -> bytes:
+        offset, length, _, compressed = self.index[i]
+        data = self.buffer[offset:offset + length]
+        return zlib.decompress(data) if compressed else data
+
+    def names(self) -> List[str]:
+        _, size, names_offset, names_length, _ = FOOTER.unpack_from(self.buffer, len(self.buffer) - FOOTER.size)
+        if size == 0:
+            return []
+        return self.buffer[names_offset:names_offset + names_length].decode("utf8").split("\n")
+
+    def __len__(self) -> int:
+        return len(self.index)
+
+    def close(self) -> None:
+        self.buffer.close()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Packs files listed in a text file into a single indexed archive.")
+    parser.add_argument('file_list', type=str, help='File listing the paths of the files to pack, one per line.')
+    parser.add_argument('output', type=str, help='Output archive.')
+    parser.add_argument('-z', action='store_true', help='Compress entries.')
+    args = parser.parse_args()
+
+    file_paths = read_path_list(args.file_list)
+    print(f"{pack(file_paths, args.output, compress=args.z)} files packed.")
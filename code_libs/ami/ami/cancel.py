@@ -0,0 +1,38 @@
+"""Cooperative cancellation of running truth calculations.
+
+Each job gets a token: a path which the main process creates to ask for the job to stop.
+Workers run calculations within 'scope(token)'; long running calculators poll 'cancelled()'
+(e.g. while waiting on an external process) and raise 'Cancelled' once it returns 'True'.
+"""
+
+import os
+from contextlib import contextmanager
+from pathlib import Path
+from typing import Optional, Union, Iterator
+
+_current: Optional[str] = None
+
+
+class Cancelled(Exception):
+    """Raised by calculators which stopped because their job was cancelled."""
+
+
+@contextmanager
+def scope(token: Optional[Union[str, Path]]) -> Iterator[None]:
+    """Makes 'token' the token of the calculation running within the context."""
+    global _current
+    previous, _current = _current, None if token is None else str(token)
+    try:
+        yield
+    finally:
+        _current = previous
+
+
+def cancelled() -> bool:
+    """'True' if the calculation running in this process was cancelled."""
+    return _current is not None and os.path.exists(_current)
+
+
+def cancel(token: Union[str, Path]) -> None:
+    """Asks the calculation holding 'token' to stop."""
+    Path(token).touch()
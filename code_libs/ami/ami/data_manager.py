@@ -1,25 +1,115 @@
-from dataclasses import dataclass, MISSING
+import csv
+import hashlib
+import os
+from concurrent.futures import Future, ThreadPoolExecutor
+from dataclasses import dataclass, field, MISSING
 from io import IOBase
 from pathlib import Path
-from typing import Collection, Sequence, Tuple, List, Union
+from typing import Collection, Sequence, Tuple, List, Union, Optional, Mapping, MutableMapping, Set
 
 import numpy as np
 
 import ami.abc
 from ami.abc import Target, Feature
 from ami.abc.calculator import OpaqueParameters
+from ami.archive import IndexedArchive
+import ami.journal
 from ami.option import Option, Nothing, Some
+from ami.path_list import parse_path_list
 from ami.result import Result, Ok
 from ami.schema import Schema
 
 Index = int
 
 
+def index_dtype(size: int) -> np.dtype:
+    """Smallest integer type able to index 'size' samples, halving index arrays of libraries under 2**31."""
+    return np.dtype(np.int32) if size < 2 ** 31 else np.dtype(np.int64)
+
+
+@dataclass(slots=True)
+class StateIndex:
+    """Incrementally maintained indices of each state of an 'InMemoryStateMachine'.
+
+    Events cost O(1) whatever the number of samples: sorted available indices are only rebuilt,
+    by deleting/inserting pending changes, when requested after a change.
+    """
+    available: np.ndarray = None
+    taken: Set[Index] = field(default_factory=set)
+    returned: Set[Index] = field(default_factory=set)
+    running: Set[Index] = field(default_factory=set)
+    succeeded: Set[Index] = field(default_factory=set)
+    failed: Set[Index] = field(default_factory=set)
+    n_available: int = 0
+
+    @classmethod
+    def from_masks(cls, available: np.ndarray, done: np.ndarray, failed: np.ndarray):
+        return cls(
+            available=np.flatnonzero(available).astype(index_dtype(len(available))),
+            running=set(np.flatnonzero(~available & ~done).tolist()),
+            succeeded=set(np.flatnonzero(done & ~failed).tolist()),
+            failed=set(np.flatnonzero(failed).tolist()),
+            n_available=int(np.sum(available))
+        )
+
+    def take(self, index: Index) -> None:
+        """available -> running"""
+        if index in self.returned:
+            self.returned.discard(index)
+        else:
+            self.taken.add(index)
+        self.running.add(index)
+        self.n_available -= 1
+
+    def finish(self, index: Index, success: bool) -> None:
+        """running -> done"""
+        self.running.discard(index)
+        (self.succeeded if success else self.failed).add(index)
+
+    def give_back(self, index: Index) -> None:
+        """* -> available, 'index' must not be available already."""
+        self.running.discard(index)
+        self.succeeded.discard(index)
+        self.failed.discard(index)
+        if index in self.taken:
+            self.taken.discard(index)
+        else:
+            self.returned.add(index)
+        self.n_available += 1
+
+    def available_indices(self) -> np.ndarray:
+        if self.taken:
+            taken = np.fromiter(self.taken, dtype=int, count=len(self.taken))
+            taken.sort()
+            self.available = np.delete(self.available, np.searchsorted(self.available, taken))
+            self.taken.clear()
+        if self.returned:
+            returned = np.fromiter(self.returned, dtype=int, count=len(self.returned))
+            returned.sort()
+            self.available = np.insert(self.available, np.searchsorted(self.available, returned), returned)
+            self.returned.clear()
+        return self.available
+
+    def done_indices(self, include_failures=False) -> np.ndarray:
+        done = self.succeeded | self.failed if include_failures else self.succeeded
+        indices = np.fromiter(done, dtype=int, count=len(done))
+        indices.sort()
+        return indices
+
+
 @dataclass(slots=True, frozen=True)
 class InMemoryStateMachine(ami.abc.StateMachineInterface):
+    """Boolean masks of each state, plus incrementally maintained indices and counts.
+
+    'list_*' methods return read-only views of internal masks, no copy nor computation is involved,
+    and 'available_indices' a read-only view of the sorted available indices. Views follow later transitions
+    (masks) or are replaced by them (indices): callers keeping them across transitions must copy them.
+    """
     available: np.ndarray[bool] = MISSING
     done: np.ndarray[bool] = MISSING
     failed: np.ndarray[bool] = MISSING
+    succeeded: np.ndarray[bool] = field(init=False, default=None)
+    _index: StateIndex = field(init=False, default=None)
 
     @classmethod
     def from_size(cls, size: int):
@@ -34,45 +124,216 @@ class InMemoryStateMachine(ami.abc.StateMachineInterface):
         assert len(self) == len(self.done)
         assert len(self) == len(self.available)
         assert np.sum((~self.done) & self.failed) == 0
+        # Done samples are never available.
+        self.available[self.done] = False
+        object.__setattr__(self, "succeeded", self.done & ~self.failed)
+        object.__setattr__(self, "_index", StateIndex.from_masks(self.available, self.done, self.failed))
 
     def _is_selectable(self, index: Index) -> bool:
-        print("SINGLE INDEX:", index)
-        return (not self.done[index]) and (self.available[index]) and (not self.failed[index])
+        return bool(self.available[index])
 
     def _is_settable(self, index: Index) -> bool:
-        return (not self.done[index]) and (not self.available[index]) and (not self.failed[index])
+        return (not self.done[index]) and (not self.available[index])
 
     def select(self, index: Index) -> None:
         if not self._is_selectable(index):
             raise RuntimeError(f"Tried to select unselectable item at index '{index}'.")
         self.available[index] = False
+        self._index.take(index)
 
     def set(self, index: Index, success: bool) -> None:
         if not self._is_settable(index):
             raise RuntimeError(f"Tried to set unsettable item at index '{index}'.")
         self.done[index] = True
         self.failed[index] = not success
+        self.succeeded[index] = success
+        self._index.finish(index, success)
 
     def reset(self, index: Index) -> None:
+        if self.available[index]:
+            return
         self.done[index] = False
         self.failed[index] = False
+        self.succeeded[index] = False
         self.available[index] = True
+        self._index.give_back(index)
+
+    def select_many(self, indices: Sequence[Index]) -> None:
+        indices = np.asarray(indices, dtype=int)
+        if not np.all(self.available[indices]) or len(np.unique(indices)) != len(indices):
+            raise RuntimeError(f"Tried to select unselectable items at indices '{indices[~self.available[indices]]}'.")
+        self.available[indices] = False
+        for index in indices.tolist():
+            self._index.take(index)
+
+    def set_many(self, indices: Sequence[Index], success: Collection[bool]) -> None:
+        indices = np.asarray(indices, dtype=int)
+        success = np.broadcast_to(np.asarray(success, dtype=bool), indices.shape)
+        settable = ~self.done[indices] & ~self.available[indices]
+        if not np.all(settable):
+            raise RuntimeError(f"Tried to set unsettable items at indices '{indices[~settable]}'.")
+        self.done[indices] = True
+        self.failed[indices] = ~success
+        self.succeeded[indices] = success
+        for index, ok in zip(indices.tolist(), success.tolist()):
+            self._index.finish(index, ok)
 
     def list_done(self, include_failures=False) -> Collection[bool]:
-        if include_failures:
-            # All done, failed or not
-            return self.done
-        else:
-            # All not failed
-            return (~self.failed) & self.done
+        # All done, failed or not, else all not failed
+        return _read_only(self.done if include_failures else self.succeeded)
 
     def list_available(self) -> Collection[bool]:
-        return (~self.done) & self.available
+        return _read_only(self.available)
+
+    def running_indices(self) -> Sequence[Index]:
+        return sorted(self._index.running)
+
+    def is_available(self, index: Index) -> bool:
+        return bool(self.available[index])
+
+    def available_indices(self) -> Sequence[Index]:
+        return _read_only(self._index.available_indices())
+
+    def done_indices(self, include_failures=False) -> Sequence[Index]:
+        return self._index.done_indices(include_failures)
+
+    def counts(self) -> Mapping[str, int]:
+        index = self._index
+        return {"available": index.n_available, "running": len(index.running),
+                "done": len(index.succeeded) + len(index.failed), "failed": len(index.failed)}
 
     def __len__(self) -> int:
         return len(self.done)
 
 
+AVAILABLE, RUNNING, SUCCEEDED, FAILED = 0, 1, 2, 3
+
+
+@dataclass(slots=True, frozen=True)
+class CompactStateMachine(ami.abc.StateMachineInterface):
+    """Single 'uint8' state code per sample, optionally memory-mapped from a '.npy' file.
+
+    Codes take one byte per sample instead of the four boolean masks of 'InMemoryStateMachine', but the same
+    incrementally maintained indices come on top: sorted available indices ('int32' below 2**31 samples, 4 bytes
+    per available sample) and sets of running and done indices (tens of bytes per running or done sample).
+    That is about 5 bytes per sample while most samples are available. 'list_*' masks are computed on request.
+    With a file, state survives the process: samples left running by a previous process are made available again.
+    """
+    codes: np.ndarray = MISSING
+    _index: StateIndex = field(init=False, default=None)
+
+    @classmethod
+    def from_size(cls, size: int, path: Optional[Union[str, Path]] = None):
+        if path is None:
+            return cls(codes=np.zeros(size, dtype=np.uint8))
+        path = Path(path)
+        if not path.exists():
+            return cls(codes=np.lib.format.open_memmap(path, mode="w+", dtype=np.uint8, shape=(size,)))
+        codes = np.load(path, mmap_mode="r+")
+        if codes.dtype != np.uint8 or codes.shape != (size,):
+            raise ValueError(f"'{path}' holds {codes.shape} '{codes.dtype}' states, expected ({size},) 'uint8'.")
+        return cls(codes=codes)
+
+    def __post_init__(self):
+        self.codes[self.codes == RUNNING] = AVAILABLE
+        object.__setattr__(self, "_index", StateIndex.from_masks(
+            available=self.codes == AVAILABLE,
+            done=self.codes >= SUCCEEDED,
+            failed=self.codes == FAILED
+        ))
+
+    def select(self, index: Index) -> None:
+        if self.codes[index] != AVAILABLE:
+            raise RuntimeError(f"Tried to select unselectable item at index '{index}'.")
+        self.codes[index] = RUNNING
+        self._index.take(index)
+
+    def set(self, index: Index, success: bool) -> None:
+        if self.codes[index] != RUNNING:
+            raise RuntimeError(f"Tried to set unsettable item at index '{index}'.")
+        self.codes[index] = SUCCEEDED if success else FAILED
+        self._index.finish(index, success)
+
+    def reset(self, index: Index) -> None:
+        if self.codes[index] == AVAILABLE:
+            return
+        self.codes[index] = AVAILABLE
+        self._index.give_back(index)
+
+    def select_many(self, indices: Sequence[Index]) -> None:
+        indices = np.asarray(indices, dtype=int)
+        selectable = self.codes[indices] == AVAILABLE
+        if not np.all(selectable) or len(np.unique(indices)) != len(indices):
+            raise RuntimeError(f"Tried to select unselectable items at indices '{indices[~selectable]}'.")
+        self.codes[indices] = RUNNING
+        for index in indices.tolist():
+            self._index.take(index)
+
+    def set_many(self, indices: Sequence[Index], success: Collection[bool]) -> None:
+        indices = np.asarray(indices, dtype=int)
+        success = np.broadcast_to(np.asarray(success, dtype=bool), indices.shape)
+        settable = self.codes[indices] == RUNNING
+        if not np.all(settable):
+            raise RuntimeError(f"Tried to set unsettable items at indices '{indices[~settable]}'.")
+        self.codes[indices] = np.where(success, SUCCEEDED, FAILED)
+        for index, ok in zip(indices.tolist(), success.tolist()):
+            self._index.finish(index, ok)
+
+    def list_done(self, include_failures=False) -> Collection[bool]:
+        return self.codes >= SUCCEEDED if include_failures else self.codes == SUCCEEDED
+
+    def list_available(self) -> Collection[bool]:
+        return self.codes == AVAILABLE
+
+    def running_indices(self) -> Sequence[Index]:
+        return sorted(self._index.running)
+
+    def is_available(self, index: Index) -> bool:
+        return self.codes[index] == AVAILABLE
+
+    def available_indices(self) -> Sequence[Index]:
+        return _read_only(self._index.available_indices())
+
+    def done_indices(self, include_failures=False) -> Sequence[Index]:
+        return self._index.done_indices(include_failures)
+
+    def counts(self) -> Mapping[str, int]:
+        index = self._index
+        return {"available": index.n_available, "running": len(index.running),
+                "done": len(index.succeeded) + len(index.failed), "failed": len(index.failed)}
+
+    def flush(self) -> None:
+        """Writes memory-mapped states to disk, does nothing when held in memory."""
+        if isinstance(self.codes, np.memmap):
+            self.codes.flush()
+
+    def __len__(self) -> int:
+        return len(self.codes)
+
+
+def _as_results(indices: Sequence[Index], targets: Sequence[Target], success: Collection[bool]
+                ) -> Tuple[np.ndarray, np.ndarray, np.ndarray]:
+    indices = np.asarray(indices, dtype=int)
+    targets = np.asarray(targets, dtype=float)
+    success = np.broadcast_to(np.asarray(success, dtype=bool), indices.shape)
+    assert indices.shape == targets.shape
+    return indices, targets, success
+
+
+def _first_available(indices: np.ndarray, available: np.ndarray) -> np.ndarray:
+    """Mask of 'indices' which are available, keeping only the first occurrence of duplicates."""
+    keep = np.zeros(len(indices), dtype=bool)
+    _, first = np.unique(indices, return_index=True)
+    keep[first] = True
+    return keep & available[indices]
+
+
+def _read_only(array: np.ndarray) -> np.ndarray:
+    view = array.view()
+    view.flags.writeable = False
+    return view
+
+
 @dataclass(slots=True, frozen=True)
 class IndexedSingleFloatTargetSurrogateProvider(ami.abc.SurrogateProviderInterface):
     features: np.ndarray = MISSING
@@ -95,11 +356,11 @@ class IndexedSingleFloatTargetSurrogateProvider(ami.abc.SurrogateProviderInterfa
         assert len(self.features) == len(self)
 
     def known(self, state: ami.abc.StateMachineInterface) -> Tuple[Sequence[Feature], Sequence[Target]]:
-        done: Collection[bool] = state.list_done(include_failures=False)
+        done: Sequence[Index] = state.done_indices(include_failures=False)
         return self.features[done], self.targets[done]
 
     def unknown(self, state: ami.abc.StateMachineInterface) -> Sequence[Feature]:
-        available: Collection[bool] = state.list_available()
+        available: Sequence[Index] = state.available_indices()
         return self.features[available]
 
     def set_target(self, index: Index, value: Option[Target]) -> None:
@@ -109,6 +370,9 @@ class IndexedSingleFloatTargetSurrogateProvider(ami.abc.SurrogateProviderInterfa
             case Nothing:
                 pass
 
+    def set_targets(self, indices: Sequence[Index], values: Sequence[Target]) -> None:
+        self.targets[np.asarray(indices, dtype=int)] = values
+
     def __len__(self):
         return len(self.features)
 
@@ -116,18 +380,196 @@ class IndexedSingleFloatTargetSurrogateProvider(ami.abc.SurrogateProviderInterfa
         return self._schema
 
 
+TARGET_RECORD = np.dtype([("index", "<i8"), ("target", "<f8")])
+
+
+@dataclass(slots=True, frozen=True)
+class SparseSingleFloatTargetSurrogateProvider(ami.abc.SurrogateProviderInterface):
+    """Same as 'IndexedSingleFloatTargetSurrogateProvider' but features are the indices themselves
+    and only known targets are stored, in a dictionary (about 100 bytes per known target).
+    'unknown' copies the available indices of the state machine into a new 'int64' array on each call,
+    i.e. 8 bytes per available sample for as long as a ranking holds on to it.
+
+    With a 'writer', targets are also appended as 'TARGET_RECORD's to a file, read back by 'from_file'.
+    """
+    size: int = MISSING
+    targets: MutableMapping[Index, Target] = MISSING
+    _schema: ami.abc.SchemaInterface = MISSING
+    writer: Optional[IOBase] = None
+
+    @classmethod
+    def from_size_and_schema(cls, size: int):
+        schema = Schema(input_schema=[('index', int)], output_schema=[('target', float)])
+        return cls(size=size, targets={}, _schema=schema)
+
+    @classmethod
+    def from_file(cls, size: int, path: Union[str, Path]):
+        path = Path(path)
+        records = np.fromfile(path, dtype=TARGET_RECORD) if path.exists() else np.empty(0, dtype=TARGET_RECORD)
+        # A crash may leave a partial record behind: truncate it before appending.
+        with path.open(mode="ab") as fd:
+            fd.truncate(records.nbytes)
+        targets = dict(zip(records["index"].tolist(), records["target"].tolist()))
+        schema = Schema(input_schema=[('index', int)], output_schema=[('target', float)])
+        return cls(size=size, targets=targets, _schema=schema, writer=path.open(mode="ab"))
+
+    def known(self, state: ami.abc.StateMachineInterface) -> Tuple[Sequence[Feature], Sequence[Target]]:
+        done = np.asarray(state.done_indices(include_failures=False), dtype=int)
+        targets = np.fromiter((self.targets[i] for i in done.tolist()), dtype=float, count=len(done))
+        return done, targets
+
+    def unknown(self, state: ami.abc.StateMachineInterface) -> Sequence[Feature]:
+        return np.asarray(state.available_indices(), dtype=int)
+
+    def set_target(self, index: Index, value: Option[Target]) -> None:
+        match value:
+            case Some(v):
+                self.targets[int(index)] = v
+                if self.writer is not None:
+                    self.writer.write(np.array((index, v), dtype=TARGET_RECORD).tobytes())
+                    self.writer.flush()
+            case Nothing:
+                pass
+
+    def set_targets(self, indices: Sequence[Index], values: Sequence[Target]) -> None:
+        indices = np.asarray(indices, dtype=int)
+        values = np.asarray(values, dtype=float)
+        self.targets.update(zip(indices.tolist(), values.tolist()))
+        if self.writer is not None:
+            records = np.empty(len(indices), dtype=TARGET_RECORD)
+            records["index"], records["target"] = indices, values
+            self.writer.write(records.tobytes())
+            self.writer.flush()
+
+    def __len__(self):
+        return self.size
+
+    def schema(self) -> ami.abc.SchemaInterface:
+        return self._schema
+
+
+def compact_state_and_surrogate(size: int, compact: bool = False, state_file: Optional[Union[str, Path]] = None
+                                ) -> Tuple[ami.abc.StateMachineInterface, ami.abc.SurrogateProviderInterface]:
+    """Dense boolean masks and targets by default, else 'CompactStateMachine' and 'SparseSingleFloatTargetSurrogateProvider'.
+
+    With 'state_file', states are memory-mapped from it and targets kept in '<state_file>.targets',
+    so that both are picked up again by the next run.
+    """
+    if not compact and state_file is None:
+        return InMemoryStateMachine.from_size(size), IndexedSingleFloatTargetSurrogateProvider.from_size_and_schema(size)
+    if state_file is None:
+        return CompactStateMachine.from_size(size), SparseSingleFloatTargetSurrogateProvider.from_size_and_schema(size)
+    state_file = Path(state_file)
+    targets_file = state_file.with_name(state_file.name + ".targets")
+    return (CompactStateMachine.from_size(size, state_file),
+            SparseSingleFloatTargetSurrogateProvider.from_file(size, targets_file))
+
+
+def missing_files(filenames: Sequence[Path], max_workers: int = 32, chunksize: int = 1024) -> np.ndarray:
+    """Indices of 'filenames' which do not exist, checked in parallel (mostly useful on network filesystems)."""
+    chunks = [range(i, min(i + chunksize, len(filenames))) for i in range(0, len(filenames), chunksize)]
+
+    def check(chunk: range) -> List[Index]:
+        return [i for i in chunk if not filenames[i].exists()]
+
+    with ThreadPoolExecutor(max_workers=max_workers) as pool:
+        missing = [i for found in pool.map(check, chunks) for i in found]
+    return np.asarray(missing, dtype=int)
+
+
+def validated_missing(list_path: Path, raw: bytes, filenames: Sequence[Path], max_workers: int = 32,
+                      cache_dir: Optional[Path] = None) -> np.ndarray:
+    """Same as 'missing_files' but cached in a '<list>.validated.npz' sidecar keyed by the hash of the list.
+
+    Restarting with an unchanged list skips the validation altogether. The sidecar is written next to the list,
+    or in 'cache_dir' if given. If it cannot be written (e.g. read-only shared library), the result is not cached.
+    The key covers the list, not the files: files deleted after the sidecar was written are not found missing
+    until the list changes (or the sidecar is removed). Reading them later fails their index only, see 'ami.mp.runner'.
+    """
+    folder = list_path.parent if cache_dir is None else Path(cache_dir)
+    sidecar = folder / (list_path.name + ".validated.npz")
+    key = hashlib.sha1(raw).hexdigest()
+    if sidecar.exists():
+        try:
+            with np.load(sidecar) as cached:
+                if str(cached["key"]) == key:
+                    return cached["missing"]
+        except (OSError, ValueError, KeyError):
+            pass
+    missing = missing_files(filenames, max_workers)
+    tmp = sidecar.with_name(f".{sidecar.name}.{os.getpid()}")
+    try:
+        folder.mkdir(parents=True, exist_ok=True)
+        with tmp.open(mode="wb") as fd:
+            np.savez(fd, key=key, missing=missing)
+        os.replace(tmp, sidecar)
+    except OSError:
+        tmp.unlink(missing_ok=True)
+    return missing
+
+
+@dataclass(slots=True)
+class FilePrefetcher:
+    """Reads files in background threads ahead of their use.
+
+    Only the files of the latest 'prefetch' call are kept: stale reads are cancelled or dropped.
+    """
+    max_workers: int = 1
+    _pool: Optional[ThreadPoolExecutor] = None
+    _pending: MutableMapping[Path, Future] = field(default_factory=dict)
+
+    def prefetch(self, paths: Sequence[Path]) -> None:
+        if self._pool is None:
+            self._pool = ThreadPoolExecutor(max_workers=self.max_workers, thread_name_prefix="ami-prefetch")
+        wanted = set(paths)
+        for path in [p for p in self._pending if p not in wanted]:
+            self._pending.pop(path).cancel()
+        for path in paths:
+            if path not in self._pending:
+                self._pending[path] = self._pool.submit(path.read_bytes)
+
+    def read(self, path: Path) -> bytes:
+        future = self._pending.pop(path, None)
+        if future is None or future.cancelled():
+            return path.read_bytes()
+        return future.result()
+
+
 @dataclass(slots=True, frozen=True)
 class FileStreamerTruthProvider(ami.abc.TruthProviderInterface):
+    """Streams file contents as 'cif_content'.
+
+    'metadata' maps parameter names to per-index sequences (e.g. precomputed supercells)
+    which are passed along with the file contents.
+    With 'pass_paths', only the absolute path is passed (as 'cif_path') and workers read files themselves.
+    Otherwise, a 'prefetcher' can read files hinted by 'prefetch' in the background.
+    'missing' lists indices whose file did not exist when the provider was created.
+    """
     filenames: List[Path]
     _schema: ami.abc.SchemaInterface
+    metadata: Mapping[str, Sequence] = field(default_factory=dict)
+    pass_paths: bool = False
+    prefetcher: Optional[FilePrefetcher] = None
+    missing: Sequence[Index] = ()
 
     def parameters(self, index: Index, state: ami.abc.StateMachineInterface) -> Option[OpaqueParameters]:
         if index >= len(self):
             return Nothing
         state.select(index)
         fpath = self.filenames[index]
-        data = fpath.read_bytes()
-        return Some({"cif_content": data, "subdir": str(index)})
+        if self.pass_paths:
+            content = {"cif_path": str(fpath.absolute())}
+        elif self.prefetcher is not None:
+            content = {"cif_content": self.prefetcher.read(fpath)}
+        else:
+            content = {"cif_content": fpath.read_bytes()}
+        extra = {name: values[index] for name, values in self.metadata.items()}
+        return Some({**content, "subdir": str(index), **extra})
+
+    def prefetch(self, indices: Sequence[Index]) -> None:
+        if self.pass_paths or self.prefetcher is None:
+            return
+        self.prefetcher.prefetch([self.filenames[i] for i in indices if i < len(self)])
 
     def __len__(self) -> int:
         return len(self.filenames)
@@ -136,28 +578,96 @@ class FileStreamerTruthProvider(ami.abc.TruthProviderInterface):
         return self._schema
 
     @classmethod
-    def from_list_in_file(cls, path: Union[str, Path], schema: ami.abc.SchemaInterface):
-        filenames = []
-        with Path(path).open(mode="r") as fd:
-            for line in fd:
-                p = Path(line.strip())
-                #FIXME: do proper logging here
-                assert p.exists()
-                filenames.append(p)
-        return cls(filenames=filenames, _schema=schema)
+    def from_list_in_file(cls, path: Union[str, Path], schema: ami.abc.SchemaInterface,
+                          metadata: Optional[Mapping[str, Sequence]] = None,
+                          pass_paths: bool = False,
+                          prefetch_workers: int = 0,
+                          validation_workers: int = 32,
+                          cache_dir: Optional[Union[str, Path]] = None):
+        """Reads file paths, one per line, from 'path' (see 'ami.path_list').
+
+        Files are checked for existence in parallel with 'validation_workers' threads and missing ones
+        are listed in 'missing' (see 'validated_missing', cached in 'cache_dir' if given).
+        'validation_workers=0' skips the check.
+        """
+        path = Path(path)
+        raw = path.read_bytes()
+        filenames = parse_path_list(raw, str(path))
+        missing = validated_missing(path, raw, filenames, validation_workers, cache_dir) if validation_workers > 0 else ()
+        metadata = {} if metadata is None else dict(metadata)
+        for values in metadata.values():
+            assert len(values) == len(filenames)
+        prefetcher = FilePrefetcher(prefetch_workers) if prefetch_workers > 0 else None
+        return cls(filenames=filenames, _schema=schema, metadata=metadata, pass_paths=pass_paths,
+                   prefetcher=prefetcher, missing=tuple(int(i) for i in missing))
 
 
 @dataclass(slots=True, frozen=True)
-class CsvPersistence:
+class ArchiveTruthProvider(ami.abc.TruthProviderInterface):
+    """Serves 'cif_content' by random access into a single 'ami.archive' file.
+
+    Drop-in replacement for 'FileStreamerTruthProvider' for libraries too large to be kept as individual files.
+    'missing' lists indices whose entry is empty.
+    """
+    archive: IndexedArchive
+    _schema: ami.abc.SchemaInterface
+    metadata: Mapping[str, Sequence] = field(default_factory=dict)
+    missing: Sequence[Index] = ()
+
+    def parameters(self, index: Index, state: ami.abc.StateMachineInterface) -> Option[OpaqueParameters]:
+        if index >= len(self):
+            return Nothing
+        state.select(index)
+        extra = {name: values[index] for name, values in self.metadata.items()}
+        return Some({"cif_content": self.archive[index], "subdir": str(index), **extra})
+
+    def __len__(self) -> int:
+        return len(self.archive)
+
+    def schema(self) -> ami.abc.SchemaInterface:
+        return self._schema
+
+    @classmethod
+    def from_archive(cls, path: Union[str, Path], schema: ami.abc.SchemaInterface,
+                     metadata: Optional[Mapping[str, Sequence]] = None):
+        archive = IndexedArchive.open(path)
+        metadata = {} if metadata is None else dict(metadata)
+        for values in metadata.values():
+            assert len(values) == len(archive)
+        missing = np.flatnonzero(archive.index["size"] == 0)
+        return cls(archive=archive, _schema=schema, metadata=metadata, missing=tuple(int(i) for i in missing))
+
+
+def complete_lines_size(path: Union[str, Path]) -> int:
+    """Size in bytes of the file at 'path' up to the end of its last complete line."""
+    with Path(path).open(mode="rb") as fd:
+        data = fd.read()
+    return data.rfind(b"\n") + 1
+
+
+@dataclass(slots=True, frozen=True)
+class CsvPersistence(ami.abc.PersistenceInterface):
+    """One '<index>,<value>' line per result, failures, dispatches ('#started,<index>')
+    and cancellations ('#cancelled,<index>') are commented out.
+    """
     writer: IOBase
+    header: bool = True
 
     @classmethod
-    def from_filename(cls, path: Union[str, Path]):
+    def from_filename(cls, path: Union[str, Path], append: bool = False):
+        """Creates a file at 'path', or with 'append', appends to an existing one."""
         path = Path(path)
+        size = complete_lines_size(path) if append and path.exists() else 0
+        if size > 0:
+            # Drops a partial line left by a crash, later lines would be appended to it.
+            os.truncate(path, size)
+            return cls(path.open(mode="a"), header=False)
         writer = path.open(mode="w")
         return cls(writer)
 
     def __post_init__(self):
+        if not self.header:
+            return
         headers = (
             "#AMI0.0.1",
         )
@@ -165,9 +675,7 @@ class CsvPersistence:
             print(line, file=self.writer)
 
     def __del__(self):
-        if not self.writer.closed:
-            self.writer.flush()
-            self.writer.close()
+        self.close()
 
     def append_valid_result(self, index: Index, value):
         print(f"{index:d},{value}", file=self.writer)
@@ -175,6 +683,129 @@ class CsvPersistence:
 
     def append_invalid_result(self, index: Index):
         print(f"#{index:d},", file=self.writer)
+        self.writer.flush()
+
+    def append_results(self, indices: Sequence[Index], values: Sequence[Target], success: Collection[bool]) -> None:
+        lines = (f"{i:d},{v}" if ok else f"#{i:d}," for i, v, ok in zip(indices, values, success))
+        self.writer.write("".join(line + "\n" for line in lines))
+        self.writer.flush()
+
+    def started(self, index: Index) -> None:
+        print(f"#started,{index:d}", file=self.writer)
+        self.writer.flush()
+
+    def cancelled(self, index: Index) -> None:
+        print(f"#cancelled,{index:d}", file=self.writer)
+        self.writer.flush()
+
+    def flush(self) -> None:
+        self.writer.flush()
+
+    def close(self) -> None:
+        if not self.writer.closed:
+            self.writer.flush()
+            self.writer.close()
+
+
+@dataclass(slots=True, frozen=True)
+class ResultsLog:
+    """Results read back from a 'CsvPersistence' or 'JournalPersistence' log, in the order they were reported.
+
+    'in_flight' lists indices dispatched but never reported.
+    """
+    indices: np.ndarray
+    values: np.ndarray
+    succeeded: np.ndarray
+    in_flight: np.ndarray
+
+    @classmethod
+    def read(cls, path: Union[str, Path]):
+        path = Path(path)
+        with path.open(mode="rb") as fd:
+            magic = fd.read(len(ami.journal.MAGIC))
+        if magic == ami.journal.MAGIC:
+            return cls.from_journal(path)
+        return cls.from_csv(path)
+
+    @classmethod
+    def from_journal(cls, path: Union[str, Path]):
+        records = ami.journal.read_journal(path)
+        done = records[np.isin(records["status"], (ami.journal.SUCCEEDED, ami.journal.FAILED))]
+        return cls(
+            indices=done["index"],
+            values=done["value"],
+            succeeded=done["status"] == ami.journal.SUCCEEDED,
+            in_flight=ami.journal.in_flight(records)
+        )
+
+    @classmethod
+    def from_table(cls, path: Union[str, Path], index: str = "index", target: str = "target"):
+        """Reads prior results from a CSV table with a header, e.g. to seed a campaign.
+        Rows with an empty or 'nan' target are failures.
+        """
+        with Path(path).open(mode="r", newline="") as fd:
+            rows = [(int(row[index]), float(row[target] or "nan")) for row in csv.DictReader(fd)]
+        indices = np.asarray([i for i, _ in rows], dtype=int)
+        values = np.asarray([v for _, v in rows], dtype=float)
+        return cls(indices=indices, values=values, succeeded=~np.isnan(values), in_flight=np.empty(0, dtype=int))
+
+    @classmethod
+    def from_csv(cls, path: Union[str, Path]):
+        indices, values, succeeded = [], [], []
+        running: MutableMapping[Index, None] = {}
+        with Path(path).open(mode="r") as fd:
+            for line in fd:
+                if not line.endswith("\n"):
+                    # Partial line left by a crash while writing.
+                    break
+                line = line.strip()
+                if not line or line.startswith("#AMI"):
+                    continue
+                if line.startswith("#started,"):
+                    running[int(line.split(",")[1])] = None
+                    continue
+                if line.startswith("#cancelled,"):
+                    running.pop(int(line.split(",")[1]), None)
+                    continue
+                index, value = line.lstrip("#").split(",")
+                ok = not line.startswith("#")
+                indices.append(int(index))
+                values.append(float(value) if ok else np.nan)
+                succeeded.append(ok)
+                running.pop(int(index), None)
+        return cls(
+            indices=np.asarray(indices, dtype=int),
+            values=np.asarray(values, dtype=float),
+            succeeded=np.asarray(succeeded, dtype=bool),
+            in_flight=np.asarray(list(running), dtype=int)
+        )
+
+
+def open_persistence(path: Union[str, Path], journal: bool = False, append: bool = False, **journal_options
+                     ) -> ami.abc.PersistenceInterface:
+    """'CsvPersistence' writing to 'path', or with 'journal', 'JournalPersistence' writing next to it
+    with a '.journal' suffix (see 'python -m ami.journal' to export it to CSV). 'append' keeps existing results.
+
+    'journal_options' ('group', 'interval', 'fsync_interval') set group commit and syncing of the journal.
+    """
+    path = Path(path)
+    if journal:
+        return ami.journal.JournalPersistence.from_filename(path.with_suffix(".journal"), append=append,
+                                                            **journal_options)
+    return CsvPersistence.from_filename(path, append=append)
+
+
+def results_log_path(path: Union[str, Path], journal: bool = False) -> Path:
+    """Path of the log written by 'open_persistence(path, journal)'."""
+    path = Path(path)
+    return path.with_suffix(".journal") if journal else path
+
+
+def _read_log_to_resume(path: Union[str, Path], journal: bool, resume: bool) -> Optional[ResultsLog]:
+    log_path = results_log_path(path, journal)
+    if not resume or not log_path.exists() or log_path.stat().st_size == 0:
+        return None
+    return ResultsLog.read(log_path)
 
 
 @dataclass(slots=True, frozen=True)
@@ -182,31 +813,123 @@ class InMemoryDataManager(ami.abc.DataManagerInterface):
     state: ami.abc.StateMachineInterface = MISSING
     surrogate: ami.abc.SurrogateProviderInterface = MISSING
     truth: ami.abc.TruthProviderInterface = MISSING
-    io: CsvPersistence = MISSING
+    io: ami.abc.PersistenceInterface = MISSING
+    _interrupted: Tuple[Index, ...] = ()
 
     @classmethod
     def from_indexed_list_in_file(cls, 
                                   path: Union[str, Path], 
                                   calc_schema: ami.abc.SchemaInterface,
                                   surrogate_schema: ami.abc.SchemaInterface,
-                                  csv_filename: Union[str, Path]='AMI.out'
+                                  csv_filename: Union[str, Path]='AMI.out',
+                                  metadata: Optional[Mapping[str, Sequence]] = None,
+                                  pass_paths: bool = False,
+                                  prefetch_workers: int = 0,
+                                  validation_workers: int = 32,
+                                  cache_dir: Optional[Union[str, Path]] = None,
+                                  compact: bool = False,
+                                  state_file: Optional[Union[str, Path]] = None,
+                                  journal: bool = False,
+                                  resume: bool = False,
+                                  **journal_options
                                   ):
+        """See 'FileStreamerTruthProvider.from_list_in_file' for 'validation_workers' and 'cache_dir',
+        'compact_state_and_surrogate' for 'compact' and 'state_file', 'open_persistence' for 'journal'
+        and 'journal_options'.
+
+        With 'resume', results already in the log are restored (see 'replay') and new ones appended to it.
+        """
         path = Path(path)
         assert path.exists()
-        truth = FileStreamerTruthProvider.from_list_in_file(path, calc_schema)
+        truth = FileStreamerTruthProvider.from_list_in_file(path, calc_schema, metadata, pass_paths, prefetch_workers,
+                                                            validation_workers, cache_dir)
         size = len(truth)
-        surrogate = IndexedSingleFloatTargetSurrogateProvider.from_size_and_schema(size)
-        state = InMemoryStateMachine.from_size(size)
-        io = CsvPersistence.from_filename(csv_filename)
-        return cls(
+        state, surrogate = compact_state_and_surrogate(size, compact, state_file)
+        log = _read_log_to_resume(csv_filename, journal, resume)
+        io = open_persistence(csv_filename, journal, append=resume, **journal_options)
+        manager = cls(
+            state=state,
+            surrogate=surrogate,
+            truth=truth,
+            io=io,
+            _interrupted=() if log is None else tuple(log.in_flight.tolist())
+        )
+        if log is not None:
+            manager.replay(log)
+        manager.exclude(truth.missing)
+        return manager
+
+    @classmethod
+    def from_archive(cls,
+                     path: Union[str, Path],
+                     calc_schema: ami.abc.SchemaInterface,
+                     surrogate_schema: ami.abc.SchemaInterface,
+                     csv_filename: Union[str, Path]='AMI.out',
+                     metadata: Optional[Mapping[str, Sequence]] = None,
+                     compact: bool = False,
+                     state_file: Optional[Union[str, Path]] = None,
+                     journal: bool = False,
+                     resume: bool = False,
+                     **journal_options
+                     ):
+        """Same as 'from_indexed_list_in_file' for files packed in an 'ami.archive' file.
+        Entries are not validated one by one, the archive holding every file: empty ones are excluded.
+        """
+        truth = ArchiveTruthProvider.from_archive(path, calc_schema, metadata)
+        state, surrogate = compact_state_and_surrogate(len(truth), compact, state_file)
+        log = _read_log_to_resume(csv_filename, journal, resume)
+        manager = cls(
             state=state,
             surrogate=surrogate,
             truth=truth,
-            io=io
+            io=open_persistence(csv_filename, journal, append=resume, **journal_options),
+            _interrupted=() if log is None else tuple(log.in_flight.tolist())
         )
+        if log is not None:
+            manager.replay(log)
+        manager.exclude(truth.missing)
+        return manager
+
+    def _ingest(self, indices: np.ndarray, values: np.ndarray, succeeded: np.ndarray
+                ) -> Tuple[np.ndarray, np.ndarray, np.ndarray]:
+        """Sets results without logging them, straight from available to done. Returns what was kept."""
+        keep = _first_available(indices, self.state.list_available())
+        indices, values, succeeded = indices[keep], values[keep], succeeded[keep]
+        self.state.select_many(indices)
+        self.state.set_many(indices, succeeded)
+        self.surrogate.set_targets(indices[succeeded], values[succeeded])
+        return indices, values, succeeded
+
+    def replay(self, log: ResultsLog) -> None:
+        """Restores results from 'log' without logging them again. Indices already done are skipped."""
+        self._ingest(log.indices, log.values, log.succeeded)
+
+    def set_results(self, indices: Sequence[Index], targets: Sequence[Target],
+                    success: Collection[bool] = True) -> Result[int, Exception]:
+        indices, values, succeeded = self._ingest(*_as_results(indices, targets, success))
+        self.io.append_results(indices, values, succeeded)
+        return Ok(len(indices))
+
+    def interrupted(self) -> Sequence[Index]:
+        return self._interrupted
+
+    def cancel(self, index: Index) -> None:
+        self.state.reset(index)
+        self.io.cancelled(index)
 
     def available_for_calculation(self) -> Sequence[Index]:
-        return np.flatnonzero(self.state.list_available())
+        return self.state.available_indices()
+
+    def is_available(self, index: Index) -> bool:
+        return self.state.is_available(index)
+
+    def exclude(self, indices: Sequence[Index]) -> None:
+        """Marks 'indices' as failed before any calculation, e.g. for invalid inputs. Skips unavailable indices."""
+        for index in indices:
+            if not self.state.is_available(index):
+                continue
+            self.state.select(index)
+            self.set_result(index, Nothing)
 
     def set_result(self, index: Index, value: Option[Target]) -> Result[..., Exception]:
         self.surrogate.set_target(index, value)
@@ -230,4 +953,329 @@ class InMemoryDataManager(ami.abc.DataManagerInterface):
         return len(self.state)
 
     def parameters(self, index: Index) -> Option[OpaqueParameters]:
-        return self.truth.parameters(index, self.state)
+        params = self.truth.parameters(index, self.state)
+        match params:
+            case Some(_):
+                self.io.started(index)
+        return params
+
+    def prefetch(self, indices: Sequence[Index]) -> None:
+        self.truth.prefetch(indices)
+
+    def flush(self) -> None:
+        self.state.flush()
+        self.io.flush()
+
+    def close(self) -> None:
+        self.state.flush()
+        self.io.close()
+
+
+@dataclass(slots=True, frozen=True)
+class FidelityStateView(ami.abc.StateMachineInterface):
+    """Exposes a 'MultiFidelityStateMachine' as a single fidelity state machine, e.g. for truth providers."""
+    parent: "MultiFidelityStateMachine"
+    fidelity: int
+
+    def select(self, index: Index) -> None:
+        self.parent.select(index, self.fidelity)
+
+    def set(self, index: Index, success: bool) -> None:
+        self.parent.set(index, success, self.fidelity)
+
+    def reset(self, index: Index) -> None:
+        self.parent.levels[self.fidelity].reset(index)
+
+    def list_done(self, include_failures=False) -> Collection[bool]:
+        return self.parent.levels[self.fidelity].list_done(include_failures)
+
+    def list_available(self) -> Collection[bool]:
+        return self.parent.list_available()
+
+    def __len__(self) -> int:
+        return len(self.parent)
+
+
+@dataclass(slots=True, frozen=True)
+class MultiFidelityStateMachine(ami.abc.StateMachineInterface):
+    """Keeps one 'InMemoryStateMachine' per fidelity, the last fidelity being the reference one.
+
+    An index is available as long as it is not running at any fidelity and its reference value is unknown:
+    having a cheap result does not prevent an index from being scheduled again at a higher fidelity.
+    Methods default to the reference fidelity when 'fidelity' is None.
+    """
+    levels: Tuple[InMemoryStateMachine, ...] = MISSING
+
+    @classmethod
+    def from_size(cls, size: int, n_fidelities: int):
+        return cls(levels=tuple(InMemoryStateMachine.from_size(size) for _ in range(n_fidelities)))
+
+    def __post_init__(self):
+        assert len(self.levels) > 0
+        for level in self.levels:
+            assert len(level) == len(self)
+
+    @property
+    def top(self) -> int:
+        return len(self.levels) - 1
+
+    def _level(self, fidelity: Optional[int]) -> InMemoryStateMachine:
+        return self.levels[self.top if fidelity is None else fidelity]
+
+    def at(self, fidelity: Optional[int] = None) -> FidelityStateView:
+        return FidelityStateView(self, self.top if fidelity is None else fidelity)
+
+    def select(self, index: Index, fidelity: Optional[int] = None) -> None:
+        if not self.is_available(index):
+            raise RuntimeError(f"Tried to select unselectable item at index '{index}'.")
+        self._level(fidelity).select(index)
+
+    def is_available(self, index: Index) -> bool:
+        if self._level(None).done[index]:
+            return False
+        return all(level.available[index] or level.done[index] for level in self.levels)
+
+    def available_indices(self) -> Sequence[Index]:
+        available = self._level(None).available_indices()
+        running = [i for level in self.levels[:-1] for i in level.running_indices()]
+        if not running:
+            return available
+        return available[~np.isin(available, running)]
+
+    def set(self, index: Index, success: bool, fidelity: Optional[int] = None) -> None:
+        self._level(fidelity).set(index, success)
+
+    def reset(self, index: Index) -> None:
+        for level in self.levels:
+            level.reset(index)
+
+    def list_done(self, include_failures=False, fidelity: Optional[int] = None) -> Collection[bool]:
+        return self._level(fidelity).list_done(include_failures)
+
+    def list_available(self) -> Collection[bool]:
+        idle = np.ones(len(self), dtype=bool)
+        for level in self.levels:
+            idle &= level.available | level.done
+        return idle & ~self._level(None).done
+
+    def __len__(self) -> int:
+        return len(self.levels[0])
+
+
+@dataclass(slots=True, frozen=True)
+class IndexedMultiFidelityTargetSurrogateProvider(ami.abc.SurrogateProviderInterface):
+    """Holds one float target per index and per fidelity.
+
+    Known features are (index, fidelity) pairs so that surrogates can learn the correlation between fidelities,
+    unknown features are plain indices for which the reference fidelity is to be predicted.
+    """
+    features: np.ndarray = MISSING
+    targets: np.ndarray = MISSING
+    _schema: ami.abc.SchemaInterface = MISSING
+
+    @classmethod
+    def from_size_and_schema(cls, size: int, n_fidelities: int):
+        features = np.arange(size, dtype=int)
+        targets = np.empty((size, n_fidelities), dtype=float)
+        schema = Schema(input_schema=[('index', int), ('fidelity', int)], output_schema=[('target', float)])
+        return cls(
+            features=features,
+            targets=targets,
+            _schema=schema
+        )
+
+    def __post_init__(self):
+        assert len(self.features) == len(self.targets)
+        assert self.targets.ndim == 2
+
+    def known(self, state: MultiFidelityStateMachine) -> Tuple[Sequence[Feature], Sequence[Target]]:
+        x, y = [], []
+        for fidelity in range(self.targets.shape[1]):
+            done = state.levels[fidelity].done_indices(include_failures=False)
+            features = self.features[done]
+            x.append(np.column_stack((features, np.full(len(features), fidelity, dtype=int))))
+            y.append(self.targets[done, fidelity])
+        return np.concatenate(x), np.concatenate(y)
+
+    def unknown(self, state: MultiFidelityStateMachine) -> Sequence[Feature]:
+        available: Sequence[Index] = state.available_indices()
+        return self.features[available]
+
+    def set_target(self, index: Index, value: Option[Target], fidelity: Optional[int] = None) -> None:
+        match value:
+            case Some(v):
+                self.targets[index, -1 if fidelity is None else fidelity] = v
+            case Nothing:
+                pass
+
+    def paired(self, state: MultiFidelityStateMachine, fidelity: int) -> Tuple[Sequence[Target], Sequence[Target]]:
+        """Returns (targets at 'fidelity', reference targets) for indices successfully done at both."""
+        both = state.list_done(fidelity=fidelity) & state.list_done()
+        return self.targets[both, fidelity], self.targets[both, -1]
+
+    def __len__(self):
+        return len(self.features)
+
+    def schema(self) -> ami.abc.SchemaInterface:
+        return self._schema
+
+
+@dataclass(slots=True, frozen=True)
+class MultiFidelityDataManager(ami.abc.DataManagerInterface):
+    """Data manager tracking results at several fidelities, the last one being the reference.
+
+    Each fidelity logs its results to its own file: the reference fidelity uses 'csv_filename'
+    and lower fidelities insert '.fidelity<n>' before its suffix.
+    """
+    state: MultiFidelityStateMachine = MISSING
+    surrogate: IndexedMultiFidelityTargetSurrogateProvider = MISSING
+    truth: ami.abc.TruthProviderInterface = MISSING
+    io: Tuple[ami.abc.PersistenceInterface, ...] = MISSING
+    _interrupted: Tuple[Index, ...] = ()
+
+    @classmethod
+    def from_indexed_list_in_file(cls,
+                                  path: Union[str, Path],
+                                  calc_schema: ami.abc.SchemaInterface,
+                                  surrogate_schema: ami.abc.SchemaInterface,
+                                  n_fidelities: int = 2,
+                                  csv_filename: Union[str, Path]='AMI.out',
+                                  metadata: Optional[Mapping[str, Sequence]] = None,
+                                  pass_paths: bool = False,
+                                  prefetch_workers: int = 0,
+                                  validation_workers: int = 32,
+                                  cache_dir: Optional[Union[str, Path]] = None,
+                                  journal: bool = False,
+                                  resume: bool = False,
+                                  **journal_options
+                                  ):
+        """See 'FileStreamerTruthProvider.from_list_in_file' for 'validation_workers' and 'cache_dir',
+        'open_persistence' for 'journal' and 'journal_options'.
+        """
+        path = Path(path)
+        assert path.exists()
+        truth = FileStreamerTruthProvider.from_list_in_file(path, calc_schema, metadata, pass_paths, prefetch_workers,
+                                                            validation_workers, cache_dir)
+        size = len(truth)
+        surrogate = IndexedMultiFidelityTargetSurrogateProvider.from_size_and_schema(size, n_fidelities)
+        state = MultiFidelityStateMachine.from_size(size, n_fidelities)
+        csv_filename = Path(csv_filename)
+        filenames = [csv_filename.with_suffix(f".fidelity{f}{csv_filename.suffix}") for f in range(n_fidelities - 1)]
+        filenames.append(csv_filename)
+        logs = [_read_log_to_resume(name, journal, resume) for name in filenames]
+        io = tuple(open_persistence(name, journal, append=resume, **journal_options) for name in filenames)
+        interrupted = {i for log in logs if log is not None for i in log.in_flight.tolist()}
+        manager = cls(
+            state=state,
+            surrogate=surrogate,
+            truth=truth,
+            io=io,
+            _interrupted=tuple(sorted(interrupted))
+        )
+        # Lower fidelities first: an index done at the reference fidelity cannot be selected any more.
+        for fidelity, log in enumerate(logs):
+            if log is not None:
+                manager.replay(log, fidelity)
+        manager.exclude(truth.missing)
+        return manager
+
+    @property
+    def n_fidelities(self) -> int:
+        return len(self.state.levels)
+
+    def available_for_calculation(self) -> Sequence[Index]:
+        return self.state.available_indices()
+
+    def exclude(self, indices: Sequence[Index]) -> None:
+        """Marks 'indices' as failed at the reference fidelity before any calculation. Skips unavailable indices."""
+        for index in indices:
+            if not self.state.is_available(index):
+                continue
+            self.state.select(index)
+            self.set_result(index, Nothing)
+
+    def is_available(self, index: Index) -> bool:
+        return self.state.is_available(index)
+
+    def _ingest(self, indices: np.ndarray, values: np.ndarray, succeeded: np.ndarray, fidelity: int
+                ) -> Tuple[np.ndarray, np.ndarray, np.ndarray]:
+        """Sets results at 'fidelity' without logging them, straight from available to done. Returns what was kept."""
+        level = self.state.levels[fidelity]
+        keep = np.zeros(len(indices), dtype=bool)
+        for i, (index, value, ok) in enumerate(zip(indices.tolist(), values.tolist(), succeeded.tolist())):
+            if not (self.state.is_available(index) and level.is_available(index)):
+                continue
+            self.state.select(index, fidelity)
+            self.state.set(index, ok, fidelity)
+            if ok:
+                self.surrogate.set_target(index, Some(value), fidelity)
+            keep[i] = True
+        return indices[keep], values[keep], succeeded[keep]
+
+    def replay(self, log: ResultsLog, fidelity: int) -> None:
+        """Restores results at 'fidelity' from 'log' without logging them again. Indices already done are skipped."""
+        self._ingest(log.indices, log.values, log.succeeded, fidelity)
+
+    def set_results(self, indices: Sequence[Index], targets: Sequence[Target], success: Collection[bool] = True,
+                    fidelity: Optional[int] = None) -> Result[int, Exception]:
+        fidelity = self.state.top if fidelity is None else fidelity
+        indices, values, succeeded = self._ingest(*_as_results(indices, targets, success), fidelity)
+        self.io[fidelity].append_results(indices, values, succeeded)
+        return Ok(len(indices))
+
+    def interrupted(self) -> Sequence[Index]:
+        return self._interrupted
+
+    def cancel(self, index: Index, fidelity: Optional[int] = None) -> None:
+        """Makes the calculation running at 'fidelity' available again, results at other fidelities are kept."""
+        fidelity = self.state.top if fidelity is None else fidelity
+        self.state.levels[fidelity].reset(index)
+        self.io[fidelity].cancelled(index)
+
+    def is_done(self, index: Index, fidelity: int) -> bool:
+        """'True' if a calculation at 'fidelity' already finished for 'index', successful or not."""
+        return bool(self.state.list_done(include_failures=True, fidelity=fidelity)[index])
+
+    def set_result(self, index: Index, value: Option[Target], fidelity: Optional[int] = None) -> Result[..., Exception]:
+        fidelity = self.state.top if fidelity is None else fidelity
+        self.surrogate.set_target(index, value, fidelity)
+        match value:
+            case Some(v):
+                self.state.set(index, True, fidelity)
+                self.io[fidelity].append_valid_result(index, v)
+            case Nothing:
+                self.state.set(index, False, fidelity)
+                self.io[fidelity].append_invalid_result(index)
+        return Ok(())
+
+    def paired(self, fidelity: int) -> Tuple[Sequence[Target], Sequence[Target]]:
+        return self.surrogate.paired(self.state, fidelity)
+
+    def unknown(self) -> Sequence[Feature]:
+        return self.surrogate.unknown(self.state)
+
+    def known(self) -> Tuple[Sequence[Feature], Sequence[Target]]:
+        return self.surrogate.known(self.state)
+
+    def __len__(self) -> int:
+        return len(self.state)
+
+    def prefetch(self, indices: Sequence[Index]) -> None:
+        self.truth.prefetch(indices)
+
+    def flush(self) -> None:
+        for io in self.io:
+            io.flush()
+
+    def close(self) -> None:
+        for io in self.io:
+            io.close()
+
+    def parameters(self, index: Index, fidelity: Optional[int] = None) -> Option[OpaqueParameters]:
+        fidelity = self.state.top if fidelity is None else fidelity
+        match self.truth.parameters(index, self.state.at(fidelity)):
+            case Some(params):
+                self.io[fidelity].started(index)
+                return Some({**params, "fidelity": fidelity})
+            case Nothing:
+                return Nothing
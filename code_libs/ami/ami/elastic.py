@@ -0,0 +1,79 @@
+"""Number of worker slots changing while a campaign runs.
+
+Slots are resized by signals ('SIGUSR1' adds one, 'SIGUSR2' removes one), by writing the number of slots
+to a control file, or by following the load average of the node. Shrinking never stops running jobs:
+slots are drained as their jobs complete.
+"""
+
+import os
+import signal
+from dataclasses import dataclass, field
+from pathlib import Path
+from time import monotonic
+from typing import Optional
+
+
+@dataclass(slots=True)
+class ElasticCapacity:
+    """Current number of worker slots, between 'min_slots' and 'max_slots'.
+
+    Triggers are checked at most every 'interval' seconds, the latest one wins:
+
+    * 'control_file', read whenever it is modified, holds the number of slots;
+    * with 'load_average', slots are set to the cores left by other processes on the node, 'cores_per_job' each:
+      'cores' minus the one minute load average not caused by the campaign's own jobs;
+    * once 'install_signals' is called, 'SIGUSR1' and 'SIGUSR2' add and remove one slot (applied at the next check).
+    """
+    slots: int
+    max_slots: int
+    min_slots: int = 1
+    control_file: Optional[Path] = None
+    load_average: bool = False
+    cores: int = field(default_factory=lambda: len(os.sched_getaffinity(0)))
+    cores_per_job: int = 1
+    interval: float = 5.0
+    _delta: int = 0
+    _mtime: Optional[float] = None
+    _checked: float = field(default_factory=lambda: float("-inf"))
+
+    def __post_init__(self):
+        self.slots = self._clamp(self.slots)
+
+    def _clamp(self, slots: int) -> int:
+        return max(self.min_slots, min(self.max_slots, int(slots)))
+
+    def install_signals(self) -> None:
+        """Resizes on 'SIGUSR1' (one more slot) and 'SIGUSR2' (one fewer), from the main thread only."""
+        signal.signal(signal.SIGUSR1, lambda signum, frame: self._signalled(1))
+        signal.signal(signal.SIGUSR2, lambda signum, frame: self._signalled(-1))
+
+    def _signalled(self, delta: int) -> None:
+        self._delta += delta
+        # Applied at the next check, whatever the interval.
+        self._checked = float("-inf")
+
+    def current(self, running: int) -> int:
+        """Number of slots, given the number of jobs 'running' (used by the load average policy)."""
+        now = monotonic()
+        if now - self._checked < self.interval:
+            return self.slots
+        self._checked = now
+        if self.load_average:
+            external = max(os.getloadavg()[0] - running * self.cores_per_job, 0.0)
+            self.slots = self._clamp((self.cores - external) // self.cores_per_job)
+        if self.control_file is not None:
+            self._read_control_file()
+        if self._delta:
+            self.slots, self._delta = self._clamp(self.slots + self._delta), 0
+        return self.slots
+
+    def _read_control_file(self) -> None:
+        try:
+            mtime = self.control_file.stat().st_mtime
+            if mtime == self._mtime:
+                return
+            self._mtime = mtime
+            self.slots = self._clamp(int(self.control_file.read_text().strip()))
+        except (OSError, ValueError):
+            # Missing or being written: tried again at the next check.
+            pass
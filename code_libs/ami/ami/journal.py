@@ -0,0 +1,186 @@
+"""Append-only binary journal of results, one fixed-size 'RECORD' per reported result.
+
+Layout (little endian)
+----------------------
+
+    MAGIC | record 0 | record 1 | ...
+
+A record holds the index, its status ('SUCCEEDED' or 'FAILED'), the target value ('nan' on failure),
+the time (since the epoch) at which the calculation was dispatched and reported, and the runtime in between.
+Dispatches are logged as well, with status 'RUNNING', so that calculations in flight can be told apart,
+and so are cancellations, with status 'CANCELLED'.
+A record cut short by a crash is ignored by 'read_journal'.
+"""
+
+import argparse
+import os
+import threading
+import time
+from dataclasses import dataclass, field
+from pathlib import Path
+from typing import Union, Optional, MutableMapping, List, Sequence, Collection
+
+import numpy as np
+
+import ami.abc
+from ami.abc import Index, Target
+
+MAGIC = b"AMIJNL01"
+RECORD = np.dtype([
+    ("index", "<i8"),
+    ("status", "u1"),
+    ("value", "<f8"),
+    ("started", "<f8"),
+    ("finished", "<f8"),
+    ("runtime", "<f8"),
+])
+RUNNING, SUCCEEDED, FAILED, CANCELLED = 1, 2, 3, 4
+
+
+@dataclass(slots=True)
+class JournalPersistence(ami.abc.PersistenceInterface):
+    """Appends results to a journal with group commit.
+
+    Records are buffered and written in one system call once 'group' of them are pending, or at the latest
+    'interval' seconds after a record was buffered (by a background timer, even if no other result comes).
+    'fsync_interval' sets how often written records are forced to disk: 'None' leaves it to the OS,
+    '0' syncs every write, otherwise at most once every 'fsync_interval' seconds.
+    """
+    fd: int
+    group: int = 1
+    interval: float = 1.0
+    fsync_interval: Optional[float] = None
+    _buffer: List[bytes] = field(default_factory=list)
+    _started: MutableMapping[Index, float] = field(default_factory=dict)
+    _last_write: float = field(default_factory=time.monotonic)
+    _last_sync: float = field(default_factory=time.monotonic)
+    _lock: threading.RLock = field(default_factory=threading.RLock)
+    _timer: Optional[threading.Timer] = None
+
+    @classmethod
+    def from_filename(cls, path: Union[str, Path], append: bool = False, **kwargs):
+        """Creates a journal at 'path', or with 'append', appends to an existing one."""
+        path = Path(path)
+        if append and path.exists() and path.stat().st_size > 0:
+            count = len(read_journal(path))
+            fd = os.open(path, os.O_WRONLY | os.O_APPEND)
+            # Drops a partial record left by a crash.
+            os.ftruncate(fd, len(MAGIC) + count * RECORD.itemsize)
+            return cls(fd=fd, **kwargs)
+        fd = os.open(path, os.O_WRONLY | os.O_CREAT | os.O_TRUNC | os.O_APPEND, 0o644)
+        os.write(fd, MAGIC)
+        return cls(fd=fd, **kwargs)
+
+    def started(self, index: Index) -> None:
+        self._started[index] = time.time()
+        self._append(index, RUNNING, np.nan)
+
+    def cancelled(self, index: Index) -> None:
+        self._append(index, CANCELLED, np.nan)
+
+    def append_valid_result(self, index: Index, value: Target) -> None:
+        self._append(index, SUCCEEDED, value)
+
+    def append_invalid_result(self, index: Index) -> None:
+        self._append(index, FAILED, np.nan)
+
+    def append_results(self, indices: Sequence[Index], values: Sequence[Target], success: Collection[bool]) -> None:
+        records = np.empty(len(indices), dtype=RECORD)
+        records["index"] = indices
+        records["status"] = np.where(success, SUCCEEDED, FAILED)
+        records["value"] = np.where(success, values, np.nan)
+        records["started"] = records["finished"] = time.time()
+        records["runtime"] = 0.0
+        with self._lock:
+            self._buffer.append(records.tobytes())
+            self._write()
+
+    def _append(self, index: Index, status: int, value: float) -> None:
+        finished = time.time()
+        started = self._started[index] if status == RUNNING else self._started.pop(index, finished)
+        record = np.array((index, status, value, started, finished, finished - started), dtype=RECORD)
+        with self._lock:
+            self._buffer.append(record.tobytes())
+            if len(self._buffer) >= self.group or time.monotonic() - self._last_write >= self.interval:
+                self._write()
+            elif self._timer is None:
+                self._timer = threading.Timer(self.interval, self._write_pending)
+                self._timer.daemon = True
+                self._timer.start()
+
+    def _write_pending(self) -> None:
+        with self._lock:
+            if self.fd >= 0:
+                self._write()
+
+    def _write(self) -> None:
+        with self._lock:
+            if self._timer is not None:
+                self._timer.cancel()
+                self._timer = None
+            if self._buffer:
+                # O_APPEND: a single write of whole records never interleaves with partial records.
+                os.write(self.fd, b"".join(self._buffer))
+                self._buffer.clear()
+            now = time.monotonic()
+            self._last_write = now
+            if self.fsync_interval is not None and now - self._last_sync >= self.fsync_interval:
+                os.fsync(self.fd)
+                self._last_sync = now
+
+    def flush(self) -> None:
+        with self._lock:
+            self._write()
+            if self.fsync_interval is not None:
+                os.fsync(self.fd)
+
+    def close(self) -> None:
+        with self._lock:
+            if self.fd >= 0:
+                self.flush()
+                os.close(self.fd)
+                self.fd = -1
+
+    def __del__(self):
+        self.close()
+
+
+def read_journal(path: Union[str, Path]) -> np.ndarray:
+    """Returns all complete records of the journal at 'path' as a structured 'RECORD' array."""
+    with Path(path).open(mode="rb") as fd:
+        if fd.read(len(MAGIC)) != MAGIC:
+            raise ValueError(f"'{path}' is not a results journal.")
+        raw = fd.read()
+    count = len(raw) // RECORD.itemsize
+    return np.frombuffer(raw, dtype=RECORD, count=count).copy()
+
+
+def in_flight(records: np.ndarray) -> np.ndarray:
+    """Indices whose latest record is a dispatch, i.e. calculations interrupted before being reported."""
+    latest = records[::-1]
+    _, first = np.unique(latest["index"], return_index=True)
+    latest = latest[first]
+    return latest["index"][latest["status"] == RUNNING]
+
+
+def export_csv(records: np.ndarray, path: Union[str, Path]) -> None:
+    """Writes 'records' in the format of 'CsvPersistence', failures being commented out."""
+    with Path(path).open(mode="w") as fd:
+        print("#AMI0.0.1", file=fd)
+        for index, status, value in zip(records["index"], records["status"], records["value"]):
+            if status == SUCCEEDED:
+                print(f"{index:d},{value}", file=fd)
+            elif status == FAILED:
+                print(f"#{index:d},", file=fd)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Exports a results journal to CSV.")
+    parser.add_argument('journal', type=str, help='Results journal.')
+    parser.add_argument('output', type=str, help='Output CSV file.')
+    args = parser.parse_args()
+
+    journal = read_journal(args.journal)
+    export_csv(journal, args.output)
+    done = np.isin(journal["status"], (SUCCEEDED, FAILED))
+    print(f"{int(np.sum(done))} results, {int(np.sum(journal['status'] == FAILED))} failed.")
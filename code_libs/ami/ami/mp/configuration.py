@@ -1,9 +1,12 @@
 from dataclasses import dataclass
+from pathlib import Path
+from typing import Optional
 
 import ami
 import ami.abc.scheduler_factory
 import ami.abc.worker_factory
 import ami.mp.runner
+import ami.trace
 
 
 @dataclass(slots=True, frozen=True)
@@ -33,6 +36,10 @@ class Configuration:
         Storage backend.
     ranker: ami.abc.RankerInterface
         Acquisition function used to transform data to rank.
+    speculate: float, optional
+        Percentile of past runtimes beyond which jobs get a speculative duplicate, see 'ami.mp.runner.Runner'.
+    trace: Path, optional
+        Folder of the trace of the run, see 'ami.trace'.
 
 
     """
@@ -46,11 +53,17 @@ class Configuration:
     truth: ami.abc.calculator.CalculatorInterface
     initial_ranker: ami.abc.ranker.RankerInterface
     ranker: ami.abc.ranker.RankerInterface
+    speculate: Optional[float] = None
+    trace: Optional[Path] = None
 
     def build(self) -> ami.mp.runner.Runner:
+        if self.trace is not None:
+            # Before the pool starts, for workers to inherit it.
+            ami.trace.enable(self.trace)
         worker_pool = self._configure_worker_pool()
         scheduler = self._build_scheduler(worker_pool)
-        return ami.mp.runner.Runner(scheduler=scheduler, worker_pool=worker_pool)
+        return ami.mp.runner.Runner(scheduler=scheduler, worker_pool=worker_pool, speculate=self.speculate,
+                                    data=self.data)
 
     def _build_scheduler(self, worker_pool: ami.abc.WorkerPoolInterface) -> ami.abc.SchedulerInterface:
         scheduler_builder = self.scheduler
@@ -0,0 +1,248 @@
+from concurrent.futures import Future, wait, FIRST_COMPLETED
+from dataclasses import dataclass, field
+from pathlib import Path
+from typing import Optional, Sequence, Hashable, MutableMapping, List, Tuple, Any
+
+import numpy as np
+
+import ami.abc
+import ami.trace
+from ami.abc import Index
+from ami.option import Option, Some, Nothing
+
+
+@dataclass(slots=True, frozen=True)
+class CampaignConfiguration:
+    """Defines one campaign of a 'MultiplexConfiguration'.
+
+    Parameters
+    ----------
+
+    scheduler: ami.abc.SchedulerFactoryInterface
+        Scheduler factory of this campaign.
+    data: ami.abc.DataManagerInterface
+        Storage backend of this campaign.
+    initial_ranker: ami.abc.RankerInterface
+        Ranker used before any result is known.
+    ranker: ami.abc.RankerInterface
+        Acquisition function of this campaign, used by shared workers in place of their own.
+    budget: int
+        Number of results to collect.
+    weight: float
+        Share of the worker slots, relative to other campaigns.
+    truth: ami.abc.CalculatorInterface, optional
+        Truth source of this campaign, defaults to the shared one.
+    keys: Sequence[Hashable], optional
+        Identity of each index across campaigns (e.g. CIF paths): a key is only calculated once
+        by campaigns sharing the same truth source. Without keys, nothing is shared.
+    """
+    scheduler: ami.abc.SchedulerFactoryInterface
+    data: ami.abc.DataManagerInterface
+    initial_ranker: ami.abc.RankerInterface
+    ranker: ami.abc.RankerInterface
+    budget: int
+    weight: float = 1.0
+    truth: Optional[ami.abc.CalculatorInterface] = None
+    keys: Optional[Sequence[Hashable]] = None
+
+
+@dataclass(slots=True)
+class Campaign:
+    """Scheduling state of a campaign within a 'MultiplexRunner'."""
+    scheduler: ami.abc.SchedulerInterface
+    ranker: ami.abc.RankerInterface
+    budget: int
+    weight: float = 1.0
+    truth: Optional[ami.abc.CalculatorInterface] = None
+    keys: Optional[Sequence[Hashable]] = None
+    # Flushed once the runner is done, if set.
+    data: Optional[ami.abc.DataManagerInterface] = None
+    running: int = 0
+    dispatched: int = 0
+    ranker_indices: Optional[Sequence[Index]] = None
+
+    def key(self, index: Index) -> Hashable:
+        # Results are only shared between campaigns using the same truth source.
+        if self.keys is None:
+            return id(self), index
+        return id(self.truth), self.keys[index]
+
+    def exhausted(self) -> bool:
+        return self.dispatched >= self.budget
+
+    def share(self) -> Tuple[float, float]:
+        return self.running / self.weight, self.dispatched / self.weight
+
+
+@dataclass(slots=True, frozen=True)
+class MultiplexRunner:
+    """Runs several campaigns over a single worker pool.
+
+    Each free slot goes to the campaign using the smallest share of slots relative to its weight
+    (ties going to the campaign with the fewest dispatched calculations relative to its weight).
+    A key requested by several campaigns is calculated once: campaigns asking for a key already running
+    wait for the same calculation, those asking for a key already calculated get the result straight away.
+    Data managers of the campaigns are flushed once done, so that buffered results are written.
+    With tracing enabled (see 'ami.trace'), the trace is exported and summarised once done.
+    """
+    campaigns: Sequence[Campaign]
+    worker_pool: ami.abc.WorkerPoolInterface
+    # Seconds between checks of the pool capacity, for pools resized while running.
+    poll: float = 1.0
+    _subscribers: MutableMapping[Future, List[Tuple[Campaign, Index]]] = field(init=False, default_factory=dict)
+    _running: MutableMapping[Hashable, Future] = field(init=False, default_factory=dict)
+    _results: MutableMapping[Hashable, Option[Any]] = field(init=False, default_factory=dict)
+
+    def run(self) -> None:
+        try:
+            self._run()
+        finally:
+            for campaign in self.campaigns:
+                if campaign.data is not None:
+                    campaign.data.flush()
+
+    def _run(self) -> None:
+        n = len(self.worker_pool)
+        with self.worker_pool as pool:
+            not_done = set()
+            while True:
+                capacity = pool.capacity(len(not_done))
+                while len(not_done) < (n if capacity is None else capacity):
+                    future = self._schedule(pool)
+                    if future is None:
+                        break
+                    not_done.add(future)
+                if not not_done:
+                    break
+                timeout = None if capacity is None else self.poll
+                done, not_done = wait(not_done, timeout=timeout, return_when=FIRST_COMPLETED)
+                for future in done:
+                    self._report(pool, future)
+            ami.trace.finish()
+
+    def _next_campaign(self) -> Optional[Campaign]:
+        candidates = [c for c in self.campaigns if not c.exhausted()]
+        if not candidates:
+            return None
+        return min(candidates, key=Campaign.share)
+
+    def _schedule(self, pool: ami.abc.WorkerExecutorInterface) -> Optional[Future]:
+        """Submits a job to a free slot, returns 'None' when no campaign has anything left to submit."""
+        while (campaign := self._next_campaign()) is not None:
+            if campaign.ranker_indices is None and campaign.scheduler.needs_new_ranking():
+                campaign.ranker_indices, inp = campaign.scheduler.ranker_inputs()
+                future = pool.submit_fit_and_rank(inp, ranker=campaign.ranker)
+                self._subscribers[future] = [(campaign, -1)]
+                campaign.running += 1
+                return future
+
+            campaign.scheduler.set_remaining(campaign.budget - campaign.dispatched)
+            index = campaign.scheduler.next()
+            try:
+                inp = campaign.scheduler.parameters(index)
+            except OSError:
+                # Input deleted or unreadable since it was validated: fails this index only, off budget.
+                campaign.scheduler.set_result(index, Nothing)
+                continue
+            campaign.dispatched += 1
+            key = campaign.key(index)
+            if key in self._results:
+                campaign.scheduler.set_result(index, self._results[key])
+                continue
+            if key in self._running:
+                self._subscribers[self._running[key]].append((campaign, index))
+                continue
+            future = pool.submit_job(inp, truth=campaign.truth)
+            self._subscribers[future] = [(campaign, index)]
+            self._running[key] = future
+            campaign.running += 1
+            return future
+        return None
+
+    def _report(self, pool: ami.abc.WorkerExecutorInterface, future: Future) -> None:
+        subscribers = self._subscribers.pop(future)
+        try:
+            res = future.result()
+            value = Some(res) if res is not None else Nothing
+        except Exception:
+            value = Nothing
+        pool.release(future)
+
+        owner, index = subscribers[0]
+        owner.running -= 1
+        if index == -1:
+            match value:
+                case Some(sequence):
+                    local_rank = np.asarray(sequence, dtype=int)
+                    local_idx = np.asarray(owner.ranker_indices, dtype=int)
+                    owner.scheduler.set_ranks(local_idx[local_rank])
+            owner.ranker_indices = None
+            return
+
+        key = owner.key(index)
+        del self._running[key]
+        self._results[key] = value
+        for campaign, index in subscribers:
+            campaign.scheduler.set_result(index, value)
+
+
+@dataclass(slots=True, frozen=True)
+class MultiplexConfiguration:
+    """Defines several campaigns sharing a worker pool and, by default, a truth source.
+
+    Parameters
+    ----------
+
+    worker: ami.abc.WorkerFactoryInterface
+        Worker factory.
+    pool: ami.abc.WorkerPoolFactoryInterface
+        WorkerPool factory.
+    truth: ami.abc.CalculatorInterface
+        Truth source shared by campaigns which do not define theirs.
+    campaigns: Sequence[CampaignConfiguration]
+        Campaigns to run.
+    trace: Path, optional
+        Folder of the trace of the run, see 'ami.trace'.
+    """
+    worker: ami.abc.worker_factory.WorkerFactoryInterface
+    pool: ami.abc.worker_pool.WorkerPoolFactoryInterface
+    truth: ami.abc.calculator.CalculatorInterface
+    campaigns: Sequence[CampaignConfiguration]
+    trace: Optional[Path] = None
+
+    def build(self) -> MultiplexRunner:
+        if self.trace is not None:
+            ami.trace.enable(self.trace)
+        worker_pool = self._configure_worker_pool()
+        campaigns = [
+            Campaign(
+                scheduler=self._build_scheduler(c, worker_pool),
+                ranker=c.ranker,
+                budget=c.budget,
+                weight=c.weight,
+                truth=c.truth,
+                keys=c.keys,
+                data=c.data
+            )
+            for c in self.campaigns
+        ]
+        return MultiplexRunner(campaigns=campaigns, worker_pool=worker_pool)
+
+    def _build_scheduler(self, campaign: CampaignConfiguration,
+                         worker_pool: ami.abc.WorkerPoolInterface) -> ami.abc.SchedulerInterface:
+        scheduler_builder = campaign.scheduler
+        scheduler_builder.set_ranker_schema(campaign.initial_ranker.schema())
+        scheduler_builder.set_truth_schema((self.truth if campaign.truth is None else campaign.truth).schema())
+        scheduler_builder.set_data_manager(campaign.data)
+        scheduler_builder.set_worker_pool(worker_pool)
+        scheduler_builder.set_initial_ranker(campaign.initial_ranker)
+        return scheduler_builder.build().unwrap()
+
+    def _configure_worker_pool(self) -> ami.abc.worker_pool.WorkerPoolInterface:
+        pool = self.pool
+        worker_factory = self.worker
+        worker_factory.set_truth(self.truth)
+        # Each campaign passes its own ranker along with its inputs.
+        worker_factory.set_ranker(self.campaigns[0].ranker)
+        pool.set_worker_factory(worker_factory)
+        return pool.build().unwrap()
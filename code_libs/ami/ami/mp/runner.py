@@ -2,12 +2,15 @@ from collections.abc import MutableMapping
 from concurrent.futures import Future, Executor
 from concurrent.futures import wait, FIRST_COMPLETED
 from dataclasses import dataclass, field
-from typing import Optional, Sequence
+from time import perf_counter, time
+from typing import Optional, Sequence, Set, List
 
 import numpy as np
 
 import ami.abc.scheduler_factory
 import ami.abc.worker_factory
+import ami.serialized_opaque
+import ami.trace
 from ami.abc import Index
 
 
@@ -18,6 +21,18 @@ class RunnerContextHelper:
     scheduler: ami.abc.scheduler.SchedulerInterface
     map: MutableMapping[Future, Index] = field(init=False, default_factory=dict)
     ranker_indices: Optional[Sequence[int]] = field(init=False, default=None)
+    cancelled: Set[Future] = field(init=False, default_factory=set)
+    # Straggler mitigation: a job running for longer than this percentile of past runtimes is duplicated.
+    speculate: Optional[float] = None
+    min_runtimes: int = 5
+    started: MutableMapping[Future, float] = field(init=False, default_factory=dict)
+    inputs: MutableMapping[Future, ami.serialized_opaque.SerializedOpaque] = field(init=False, default_factory=dict)
+    runtimes: List[float] = field(init=False, default_factory=list)
+    # Futures of indices running several times, and indices already reported by one of them.
+    copies: MutableMapping[Index, Set[Future]] = field(init=False, default_factory=dict)
+    settled: Set[Index] = field(init=False, default_factory=set)
+    # Submission times, with tracing enabled.
+    submitted: MutableMapping[Future, float] = field(init=False, default_factory=dict)
 
     def schedule(self) -> Optional[Future]:
 
@@ -36,16 +51,55 @@ class RunnerContextHelper:
 
             future = self.pool.submit_fit_and_rank(inp)
             self.map[future] = -1
+            if ami.trace.enabled():
+                self.submitted[future] = time()
             return future
 
         # Submits normal job
-        idx = self.scheduler.next()
-        inp = self.scheduler.parameters(idx)
-        future = self.pool.submit_job(inp)
-        self.map[future] = idx
+        self.scheduler.set_remaining(self.counter)
+        while True:
+            idx = self.scheduler.next()
+            try:
+                inp = self.scheduler.parameters(idx)
+                break
+            except OSError:
+                # Input deleted or unreadable since it was validated: fails this index only, off budget.
+                from ami.option import Nothing
+                self.scheduler.set_result(idx, Nothing)
+        future = self._submit(idx, inp)
         self.counter -= 1
         return future
 
+    def _submit(self, index: Index, inp: ami.serialized_opaque.SerializedOpaque) -> Future:
+        future = self.pool.submit_job(inp)
+        self.map[future] = index
+        if ami.trace.enabled():
+            self.submitted[future] = time()
+        if self.speculate is not None:
+            self.started[future] = perf_counter()
+            self.inputs[future] = inp
+        return future
+
+    def straggler(self) -> Optional[Future]:
+        """Submits a duplicate of the oldest job running for longer than the 'speculate' percentile of past runtimes.
+
+        Duplicates get another 'seed' parameter and do not count against the budget: the first copy to complete wins,
+        the others are cancelled. Returns 'None' if no job needs a duplicate.
+        """
+        if self.speculate is None or len(self.runtimes) < self.min_runtimes:
+            return None
+        limit = np.percentile(self.runtimes, self.speculate)
+        now = perf_counter()
+        for future, start in self.started.items():
+            index = self.map[future]
+            if now - start <= limit or index in self.copies:
+                continue
+            inp = self.inputs[future]
+            duplicate = self._submit(index, {**inp, "seed": int(inp.get("seed") or 0) + 1})
+            self.copies[index] = {future, duplicate}
+            return duplicate
+        return None
+
     def report(self, future: Future) -> None:
         """Reports a result back directly from a future."""
         from ami.option import Some, Nothing
@@ -58,9 +112,14 @@ class RunnerContextHelper:
             value = Nothing
 
         self.pool.release(future)
+        submitted = self.submitted.pop(future, None)
+        if submitted is not None:
+            # Submission to completion, including waiting for the executor and the result to be reported.
+            ami.trace.record("job" if index >= 0 else "fit_and_rank", submitted, time(), category="runner",
+                             index=index, ok=value is not Nothing, cancelled=future in self.cancelled)
 
         if index >= 0:
-            self.scheduler.set_result(index, value)
+            self._report_job(future, index, value)
 
         if index == -1:
             assert self.ranker_indices is not None
@@ -73,6 +132,51 @@ class RunnerContextHelper:
                 case Nothing:
                     self.scheduler.set_ranks(Nothing)
             self.ranker_indices = None
+            self.preempt()
+
+    def _report_job(self, future: Future, index: Index, value) -> None:
+        from ami.option import Nothing
+        cancelled = future in self.cancelled
+        self.cancelled.discard(future)
+        start = self.started.pop(future, None)
+        self.inputs.pop(future, None)
+
+        copies = self.copies.get(index, set())
+        copies.discard(future)
+        if not copies:
+            self.copies.pop(index, None)
+        if index in self.settled:
+            # Another copy was reported already.
+            if not copies:
+                self.settled.discard(index)
+            return
+        if copies:
+            if value is Nothing:
+                # Another copy may still succeed.
+                return
+            # First copy to complete wins.
+            for other in copies:
+                if self.pool.cancel(other):
+                    self.cancelled.add(other)
+            self.settled.add(index)
+
+        if cancelled and value is Nothing:
+            # Preempted: the index goes back to the pool of candidates, the job does not count.
+            self.scheduler.set_cancelled(index)
+            self.counter += 1
+            return
+        if start is not None and value is not Nothing:
+            self.runtimes.append(perf_counter() - start)
+        self.scheduler.set_result(index, value)
+
+    def preempt(self) -> None:
+        """Cancels running calculations the scheduler no longer wants, their slots are refilled once they stop."""
+        preempted = set(self.scheduler.preempted())
+        if not preempted:
+            return
+        for future, index in list(self.map.items()):
+            if index in preempted and self.pool.cancel(future):
+                self.cancelled.add(future)
 
 
 @dataclass(slots=True, frozen=True)
@@ -94,26 +198,52 @@ class Runner:
         Scheduler.
     worker_pool: ami.abc.WorkerPoolInterface
         Worker pool.
+    speculate: float, optional
+        Percentile of past runtimes beyond which a running job gets a speculative duplicate, when a slot is idle.
+    poll: float
+        With 'speculate', seconds between checks for stragglers. Also seconds between checks
+        of the pool capacity, for pools resized while running (see 'ami.elastic').
+    data: ami.abc.DataManagerInterface, optional
+        Data manager of the campaign, flushed once done (or on error) so that buffered results are written.
+
+    With tracing enabled (see 'ami.trace'), the trace is exported and summarised once done.
 
     """
     from time import sleep
     scheduler: ami.abc.scheduler.SchedulerInterface
     worker_pool: ami.abc.worker_pool.WorkerPoolInterface
+    speculate: Optional[float] = None
+    poll: float = 1.0
+    data: Optional[ami.abc.data_manager.DataManagerInterface] = None
 
     def run(self, counter: int) -> None:
+        try:
+            self._run(counter)
+        finally:
+            if self.data is not None:
+                self.data.flush()
+
+    def _run(self, counter: int) -> None:
         n = len(self.worker_pool)
         with self.worker_pool as pool:
-            ctx = RunnerContextHelper(counter, pool, self.scheduler)
+            ctx = RunnerContextHelper(counter, pool, self.scheduler, speculate=self.speculate)
 
-            # Initialize the pool
-            done = set()
-            not_done = set(ctx.schedule() for _ in range(min(n, counter)))
+            not_done = set()
             # Runs until count is reached.
-            while len(not_done) > 0:
-                done, not_done = wait(not_done, return_when=FIRST_COMPLETED)
+            while True:
+                # Fills free slots, up to the current size of elastic pools: slots above it are drained.
+                capacity = pool.capacity(len(not_done))
+                slots = n if capacity is None else capacity
+                while len(not_done) < slots and (fut := ctx.schedule()) is not None:
+                    not_done.add(fut)
+                # Idle slots (e.g. once the budget is spent) are used to duplicate stragglers.
+                while len(not_done) < slots and (fut := ctx.straggler()) is not None:
+                    not_done.add(fut)
+                if not not_done:
+                    break
+                timeout = None if self.speculate is None and capacity is None else self.poll
+                done, not_done = wait(not_done, timeout=timeout, return_when=FIRST_COMPLETED)
                 for fut in done:
                     ctx.report(fut)
-                    fut = ctx.schedule()
-                    if fut is not None:
-                        not_done.add(fut)
+            ami.trace.finish()
 
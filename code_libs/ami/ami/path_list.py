@@ -0,0 +1,26 @@
+"""Lists of file paths, one per line, indexed by line: the path on line 'i + 1' is sample 'i'.
+
+Shared by everything reading such a list (truth providers, 'ami.archive', CIF metadata) so that
+they all agree on indices. Surrounding whitespace and trailing blank lines are ignored; a blank line
+before the last path is an error, as dropping it would shift the indices of all later samples.
+"""
+
+from pathlib import Path
+from typing import List, Union
+
+
+def parse_path_list(raw: Union[bytes, str], source: str = "<list>") -> List[Path]:
+    """Paths listed in 'raw', utf8 encoded if bytes. 'source' names the list in errors."""
+    text = raw.decode("utf8") if isinstance(raw, bytes) else raw
+    lines = [line.strip() for line in text.splitlines()]
+    while lines and not lines[-1]:
+        lines.pop()
+    for number, line in enumerate(lines, start=1):
+        if not line:
+            raise ValueError(f"Line {number} of '{source}' is blank, paths are indexed by line.")
+    return [Path(line) for line in lines]
+
+
+def read_path_list(path: Union[str, Path]) -> List[Path]:
+    """Paths listed in the file at 'path', see 'parse_path_list'."""
+    return parse_path_list(Path(path).read_bytes(), str(path))
@@ -1,5 +1,6 @@
 from dataclasses import dataclass, field
-from typing import Tuple, Sequence, Optional
+from time import perf_counter
+from typing import Tuple, Sequence, Optional, MutableMapping, List, Callable
 
 import numpy as np
 
@@ -18,13 +19,42 @@ class InternalState:
     dirty_count: int = 0
     threshold: int = 0
     ranked_unknown_indices: Sequence[Index] = ()
+    # Served before ranked indices, whatever the ranking.
+    priority: List[Index] = field(default_factory=list)
+    # Jobs left to dispatch, if known.
+    remaining: Optional[int] = None
+    # Running indices to cancel.
+    preempted: List[Index] = field(default_factory=list)
 
     def next(self) -> Index:
+        if self.priority:
+            return self.priority.pop(0)
         assert len(self.ranked_unknown_indices) > self.ptr
         idx = self.ranked_unknown_indices[self.ptr]
         self.ptr += 1
         return idx
 
+    def upcoming(self, n: int) -> Sequence[Index]:
+        upcoming = self.ranked_unknown_indices[self.ptr:self.ptr + n]
+        if self.priority:
+            upcoming = (self.priority + list(upcoming))[:n]
+        return upcoming
+
+    def window(self, n: int, is_available: Callable[[Index], bool]) -> List[Index]:
+        """The next 'n' available indices in serving order, without consuming them."""
+        window = []
+        for index in self.priority:
+            if len(window) == n:
+                return window
+            if is_available(index) and index not in window:
+                window.append(index)
+        for index in self.ranked_unknown_indices[self.ptr:]:
+            if len(window) == n:
+                break
+            if is_available(index) and index not in window:
+                window.append(index)
+        return window
+
     def reset(self, ranks: Sequence[Index]):
         self.dirty_count = 0
         self.ptr = 0
@@ -49,24 +79,74 @@ class SerialScheduler(ami.abc.SchedulerInterface):
     surrogate_schema: ami.abc.SchemaProviderInterface
     truth_schema: ami.abc.SchemaProviderInterface
     threshold: int = 0
+    lookahead: int = 0
+    rerank_on_start: bool = False
+    # Predicted cost of each index (any unit, e.g. simulated atoms). Once at most 'makespan_horizon' jobs are left, they are dispatched
+    # longest first among the next 'remaining + makespan_slack' ranked candidates, the 'makespan_slack' most expensive
+    # ones skipped (see '_next_available').
+    job_costs: Sequence[float] = ()
+    makespan_horizon: int = 0
+    makespan_slack: int = 0
+    # Running calculations with at least 'preempt_rank' available indices ranked ahead of them are preempted.
+    preempt_rank: int = 0
     _state: InternalState = field(init=False, default_factory=InternalState)
+    _dispatched: MutableMapping[Index, float] = field(init=False, default_factory=dict)
+    _runtimes: MutableMapping[Index, float] = field(init=False, default_factory=dict)
 
     def __post_init__(self):
+        # Calculations interrupted by a previous run are resubmitted first.
+        self._state.priority.extend(int(i) for i in self.data_manager.interrupted())
         idx, ranker_input = self.ranker_inputs()
         self.initial_ranker.fit(ranker_input.known_x, ranker_input.known_y)
         local_rank = self.initial_ranker.rank(ranker_input.unknown_x)
         glob_rank = np.asarray(idx)[np.asarray(local_rank)]
         self.set_ranks(glob_rank)
         self._state.set_threshold(self.threshold)
+        if self.rerank_on_start:
+            # e.g. when resuming: ranks existing results with the actual ranker before anything else.
+            self._state.dirty_count = self.threshold + 1
 
     def set_result(self, index: Index, value: Option[SerializedOpaque]):
+        start = self._dispatched.pop(index, None)
+        if start is not None and value is not Nothing:
+            # Wall times of failed calculations say little about the cost of a successful one.
+            self._runtimes[index] = perf_counter() - start
         self.data_manager.set_result(index, value)
         self._state.set_dirty()
 
+    def set_results(self, indices: Sequence[Index], targets: Sequence[float], success=True):
+        """Ingests known results at indices which were never dispatched, invalidating the ranking once."""
+        self.data_manager.set_results(indices, targets, success).unwrap()
+        self._state.set_dirty()
+
     def set_ranks(self, ranks: Optional[Sequence[Index]]):
-        if ranks is None:
+        if ranks is None or ranks is Nothing:
             return
         self._state.reset(ranks)
+        self.data_manager.record_ranks(ranks)
+        if self.preempt_rank > 0 and self._dispatched:
+            self._preempt(np.asarray(ranks, dtype=int))
+        self._prefetch()
+
+    def _preempt(self, ranks: np.ndarray):
+        running = np.isin(ranks, np.fromiter(self._dispatched, dtype=int, count=len(self._dispatched)))
+        position = np.flatnonzero(running)
+        # Available indices ranked ahead of each running one.
+        ahead = np.cumsum(~running)[position]
+        self._state.preempted = ranks[position[ahead >= self.preempt_rank]].tolist()
+
+    def preempted(self) -> Sequence[Index]:
+        preempted, self._state.preempted = self._state.preempted, []
+        return preempted
+
+    def set_cancelled(self, index: Index) -> None:
+        self._dispatched.pop(index, None)
+        self.data_manager.cancel(index)
+
+    def _prefetch(self):
+        """Lets the data manager load parameters of the next 'lookahead' indices in advance."""
+        if self.lookahead > 0:
+            self.data_manager.prefetch(self._state.upcoming(self.lookahead))
 
     def needs_new_ranking(self) -> bool:
         return self._state.is_dirty()
@@ -76,15 +156,156 @@ class SerialScheduler(ami.abc.SchedulerInterface):
         unknown_x = self.data_manager.unknown()
         known_x, known_y = self.data_manager.known()
         assert len(unknown_x) == len(indices)
-        return indices, SurrogateInput(known_x, known_y, unknown_x)
+        if self.preempt_rank > 0 and self._dispatched:
+            # Running indices are ranked as well, to find out which ones to preempt.
+            running = np.fromiter(self._dispatched, dtype=int, count=len(self._dispatched))
+            indices = np.concatenate((np.asarray(indices, dtype=int), running))
+            unknown_x = np.concatenate((np.asarray(unknown_x), np.asarray(self.data_manager.features(running))))
+        return indices, SurrogateInput(known_x, known_y, unknown_x,
+                                       cost_x=list(self._runtimes), cost_y=list(self._runtimes.values()))
+
+    def set_remaining(self, remaining: int) -> None:
+        self._state.remaining = remaining
 
     def next(self) -> Index:
-        return self._state.next()
+        index = self._next_available()
+        self._prefetch()
+        return index
+
+    def _next_available(self) -> Index:
+        """The next available index in ranked order, except for the last 'makespan_horizon' jobs of the budget.
+
+        Those are picked among the next 'remaining + makespan_slack' available candidates: the 'makespan_slack' most
+        expensive ones are skipped, i.e. never dispatched before the budget runs out, and the 'remaining' others are
+        dispatched longest first, so that stragglers start early and short jobs fill the tail. A slack of 0 only
+        reorders the ranked candidates; a larger slack trades better ranked but expensive candidates for a shorter makespan.
+        """
+        if self._in_tail():
+            window = self._state.window(self._state.remaining + self.makespan_slack, self.data_manager.is_available)
+            if window:
+                by_cost = sorted(window, key=lambda i: self.job_costs[i], reverse=True)
+                # Not consumed: dispatched indices are no longer available and skipped later on.
+                return by_cost[max(len(window) - self._state.remaining, 0)]
+        # Rankings are computed while jobs keep being dispatched: skip indices that started or finished since.
+        index = self._state.next()
+        while not self.data_manager.is_available(index):
+            index = self._state.next()
+        return index
+
+    def _in_tail(self) -> bool:
+        remaining = self._state.remaining
+        return len(self.job_costs) > 0 and remaining is not None and 0 < remaining <= self.makespan_horizon
 
     def parameters(self, index: Index) -> SerializedOpaque:
+        self._dispatched[index] = perf_counter()
         return self.data_manager.parameters(index).unwrap()
 
 
+@dataclass(slots=True)
+class FidelityCosts:
+    """Running estimate of the wall time of each fidelity, falling back on nominal costs."""
+    nominal: Sequence[float] = ()
+    total: Optional[np.ndarray] = None
+    count: Optional[np.ndarray] = None
+
+    def __post_init__(self):
+        self.total = np.zeros(len(self.nominal), dtype=float)
+        self.count = np.zeros(len(self.nominal), dtype=int)
+
+    def record(self, fidelity: int, elapsed: float):
+        self.total[fidelity] += elapsed
+        self.count[fidelity] += 1
+
+    def estimate(self) -> np.ndarray:
+        nominal = np.asarray(self.nominal, dtype=float)
+        observed = self.count > 0
+        if not np.any(observed):
+            return nominal
+        mean = self.total[observed] / self.count[observed]
+        # Unobserved fidelities are scaled from observed ones using nominal cost ratios.
+        scale = np.median(mean / nominal[observed])
+        costs = nominal * scale
+        costs[observed] = mean
+        return costs
+
+
+@dataclass(slots=True, frozen=True)
+class MultiFidelityScheduler(SerialScheduler):
+    """Serial scheduler deciding, per job, at which fidelity the next best index is calculated.
+
+    The information gained on the reference target by a calculation at fidelity 'f' is the mutual
+    information of two Gaussian variables with correlation 'rho_f': '-log(1 - rho_f^2 / (1 + noise)) / 2',
+    where 'rho_f' is estimated from indices known at both 'f' and the reference fidelity ('prior_correlation'
+    is used until 'min_pairs' such indices exist) and 'noise' is the relative noise of the reference calculation.
+    The fidelity maximising information gained per second of calculation is launched.
+
+    'costs' are the nominal costs of each fidelity, replaced by measured wall times as jobs complete.
+    Preempted calculations (see 'preempt_rank') are cancelled at the fidelity they were running at,
+    results at other fidelities are kept.
+    The data manager must be a 'ami.data_manager.MultiFidelityDataManager' (or quack like one).
+    """
+    costs: Sequence[float] = ()
+    prior_correlation: float = 0.8
+    noise: float = 0.01
+    min_pairs: int = 5
+    _costs: FidelityCosts = field(init=False, default=None)
+    _pending: MutableMapping[Index, int] = field(init=False, default_factory=dict)
+    _running: MutableMapping[Index, Tuple[int, float]] = field(init=False, default_factory=dict)
+
+    def __post_init__(self):
+        assert len(self.costs) == self.data_manager.n_fidelities
+        object.__setattr__(self, "_costs", FidelityCosts(self.costs))
+        SerialScheduler.__post_init__(self)
+
+    def correlation(self, fidelity: int) -> float:
+        low, ref = self.data_manager.paired(fidelity)
+        if len(ref) < max(self.min_pairs, 2) or np.std(low) == 0.0 or np.std(ref) == 0.0:
+            return self.prior_correlation
+        return float(np.corrcoef(low, ref)[0, 1])
+
+    def information_gain(self) -> np.ndarray:
+        top = self.data_manager.n_fidelities - 1
+        rho = np.array([self.correlation(f) for f in range(top)] + [1.0])
+        return -0.5 * np.log(1.0 - rho ** 2 / (1.0 + self.noise))
+
+    def choose_fidelity(self, index: Index) -> int:
+        top = self.data_manager.n_fidelities - 1
+        candidates = [f for f in range(top) if not self.data_manager.is_done(index, f)] + [top]
+        if len(candidates) == 1:
+            return top
+        score = self.information_gain() / self._costs.estimate()
+        return max(candidates, key=lambda f: score[f])
+
+    def set_result(self, index: Index, value: Option[SerializedOpaque]):
+        fidelity, start = self._running.pop(index)
+        elapsed = perf_counter() - start
+        self._costs.record(fidelity, elapsed)
+        self._dispatched.pop(index, None)
+        if fidelity == self.data_manager.n_fidelities - 1 and value is not Nothing:
+            # Runtimes passed to rankers are those of reference calculations.
+            self._runtimes[index] = elapsed
+        self.data_manager.set_result(index, value, fidelity)
+        self._state.set_dirty()
+
+    def set_cancelled(self, index: Index) -> None:
+        fidelity, _ = self._running.pop(index)
+        self._dispatched.pop(index, None)
+        self.data_manager.cancel(index, fidelity)
+
+    def next(self) -> Index:
+        index = self._next_available()
+        self._pending[index] = self.choose_fidelity(index)
+        self._prefetch()
+        return index
+
+    def parameters(self, index: Index) -> SerializedOpaque:
+        fidelity = self._pending.pop(index)
+        self._running[index] = (fidelity, perf_counter())
+        # Running indices, whatever their fidelity, for preemption.
+        self._dispatched[index] = self._running[index][1]
+        return self.data_manager.parameters(index, fidelity).unwrap()
+
+
 @dataclass(slots=True, frozen=True)
 class SerialSchedulerFactory(DataclassFactory, ami.abc.SchedulerFactoryInterface):
     """Defines a 'Scheduler' factory/builder"""
@@ -105,3 +326,10 @@ class SerialSchedulerFactory(DataclassFactory, ami.abc.SchedulerFactoryInterface
 
     def set_initial_ranker(self, ranker: ami.abc.ranker.RankerInterface) -> None:
         self.set("initial_ranker", ranker)
+
+
+@dataclass(slots=True, frozen=True)
+class MultiFidelitySchedulerFactory(SerialSchedulerFactory):
+    """Builds a 'MultiFidelityScheduler', nominal fidelity costs are set with 'set("costs", ...)'."""
+
+    dataclass = MultiFidelityScheduler
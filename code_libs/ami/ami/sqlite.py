@@ -0,0 +1,329 @@
+"""Durable data manager backed by an embedded SQLite database in WAL mode.
+
+One row per sample holds its state (same codes as 'ami.data_manager.CompactStateMachine'), target and timings;
+the latest ranking is stored as a blob of 'int64' indices. In WAL mode, other processes (dashboards, sibling
+campaigns) can read the database at any time without blocking the scheduler, e.g. with 'connect_read_only'.
+"""
+
+import argparse
+import sqlite3
+import time
+from dataclasses import dataclass, field, MISSING
+from pathlib import Path
+from typing import Sequence, Collection, Tuple, Mapping, Optional, Union
+
+import numpy as np
+
+import ami.abc
+from ami.abc import Index, Target, Feature
+from ami.abc.calculator import OpaqueParameters
+from ami.data_manager import FileStreamerTruthProvider, AVAILABLE, RUNNING, SUCCEEDED, FAILED
+from ami.option import Option, Some, Nothing
+from ami.result import Result, Ok
+
+SCHEMA = (
+    """CREATE TABLE IF NOT EXISTS samples (
+        idx INTEGER PRIMARY KEY,
+        status INTEGER NOT NULL DEFAULT 0,
+        target REAL,
+        started REAL,
+        finished REAL
+    )""",
+    "CREATE INDEX IF NOT EXISTS samples_status ON samples (status, idx)",
+    "CREATE TABLE IF NOT EXISTS rankings (id INTEGER PRIMARY KEY, created REAL, ranks BLOB)",
+)
+
+
+def connect(path: Union[str, Path]) -> sqlite3.Connection:
+    """Opens (or creates) a campaign database for writing."""
+    connection = sqlite3.connect(path)
+    connection.execute("PRAGMA journal_mode=WAL")
+    # Durable at each checkpoint, a power loss may only drop the latest transactions.
+    connection.execute("PRAGMA synchronous=NORMAL")
+    for statement in SCHEMA:
+        connection.execute(statement)
+    connection.commit()
+    return connection
+
+
+def connect_read_only(path: Union[str, Path]) -> sqlite3.Connection:
+    """Opens a campaign database for reading only, safe to use while a campaign is running."""
+    return sqlite3.connect(f"file:{Path(path).absolute()}?mode=ro", uri=True)
+
+
+def counts(connection: sqlite3.Connection) -> Mapping[str, int]:
+    """Returns the number of 'available', 'running', 'done' (including failures) and 'failed' samples."""
+    by_status = dict(connection.execute("SELECT status, COUNT(*) FROM samples GROUP BY status").fetchall())
+    done = by_status.get(SUCCEEDED, 0) + by_status.get(FAILED, 0)
+    return {"available": by_status.get(AVAILABLE, 0), "running": by_status.get(RUNNING, 0), "done": done,
+            "failed": by_status.get(FAILED, 0)}
+
+
+def _indices(cursor: sqlite3.Cursor) -> np.ndarray:
+    return np.fromiter((row[0] for row in cursor), dtype=int)
+
+
+@dataclass(slots=True)
+class SqliteStateMachine(ami.abc.StateMachineInterface):
+    """State machine stored in the 'samples' table.
+
+    Updates are grouped into transactions: a commit happens once 'batch' updates are pending, 'interval' seconds
+    passed since the last commit (checked on updates), on 'flush' or on 'close'. Updates still pending when
+    the connection is closed otherwise are rolled back.
+    Samples found running when the database is opened were interrupted: they are made available again
+    and listed in 'interrupted'.
+    """
+    connection: sqlite3.Connection
+    size: int = 0
+    batch: int = 1
+    interval: float = 1.0
+    interrupted: Tuple[Index, ...] = ()
+    _pending: int = 0
+    _last_commit: float = field(default_factory=time.monotonic)
+    _closed: bool = False
+
+    @classmethod
+    def from_size(cls, path: Union[str, Path], size: int, **kwargs):
+        connection = connect(path)
+        (rows,) = connection.execute("SELECT COUNT(*) FROM samples").fetchone()
+        if rows == 0:
+            connection.executemany("INSERT INTO samples (idx) VALUES (?)", ((i,) for i in range(size)))
+        elif rows != size:
+            raise ValueError(f"'{path}' holds {rows} samples, expected {size}.")
+        interrupted = tuple(_indices(connection.execute(
+            "SELECT idx FROM samples WHERE status = ? ORDER BY idx", (RUNNING,))).tolist())
+        connection.execute("UPDATE samples SET status = ?, started = NULL WHERE status = ?", (AVAILABLE, RUNNING))
+        connection.commit()
+        return cls(connection=connection, size=size, interrupted=interrupted, **kwargs)
+
+    def _changed(self, n: int = 1) -> None:
+        self._pending += n
+        if self._pending >= self.batch or time.monotonic() - self._last_commit >= self.interval:
+            self.flush()
+
+    def flush(self) -> None:
+        self.connection.commit()
+        self._pending = 0
+        self._last_commit = time.monotonic()
+
+    def close(self) -> None:
+        """Commits pending updates and closes the connection."""
+        if self._closed:
+            return
+        self.flush()
+        self.connection.close()
+        self._closed = True
+
+    def __del__(self):
+        self.close()
+
+    def select(self, index: Index) -> None:
+        cursor = self.connection.execute(
+            "UPDATE samples SET status = ?, started = ? WHERE idx = ? AND status = ?",
+            (RUNNING, time.time(), int(index), AVAILABLE))
+        if cursor.rowcount != 1:
+            raise RuntimeError(f"Tried to select unselectable item at index '{index}'.")
+        self._changed()
+
+    def finish(self, index: Index, success: bool, target: Optional[Target] = None) -> None:
+        """Same as 'set', also storing 'target'."""
+        cursor = self.connection.execute(
+            "UPDATE samples SET status = ?, target = ?, finished = ? WHERE idx = ? AND status = ?",
+            (SUCCEEDED if success else FAILED, target, time.time(), int(index), RUNNING))
+        if cursor.rowcount != 1:
+            raise RuntimeError(f"Tried to set unsettable item at index '{index}'.")
+        self._changed()
+
+    def set(self, index: Index, success: bool) -> None:
+        self.finish(index, success)
+
+    def reset(self, index: Index) -> None:
+        self.connection.execute(
+            "UPDATE samples SET status = ?, target = NULL, started = NULL, finished = NULL WHERE idx = ?",
+            (AVAILABLE, int(index)))
+        self._changed()
+
+    def select_many(self, indices: Sequence[Index]) -> None:
+        now = time.time()
+        with self.connection:
+            cursor = self.connection.executemany(
+                "UPDATE samples SET status = ?, started = ? WHERE idx = ? AND status = ?",
+                ((RUNNING, now, int(i), AVAILABLE) for i in indices))
+            if cursor.rowcount != len(indices):
+                # Rolls the whole batch back.
+                raise RuntimeError(f"Tried to select unselectable items among indices '{indices}'.")
+
+    def finish_many(self, indices: Sequence[Index], success: Collection[bool],
+                    targets: Optional[Sequence[Optional[Target]]] = None) -> None:
+        """Same as 'set_many', also storing 'targets'."""
+        success = np.broadcast_to(np.asarray(success, dtype=bool), np.shape(indices))
+        targets = [None] * len(success) if targets is None else targets
+        now = time.time()
+        with self.connection:
+            cursor = self.connection.executemany(
+                "UPDATE samples SET status = ?, target = ?, finished = ? WHERE idx = ? AND status = ?",
+                ((SUCCEEDED if ok else FAILED, t, now, int(i), RUNNING) for i, ok, t in zip(indices, success, targets)))
+            if cursor.rowcount != len(success):
+                raise RuntimeError(f"Tried to set unsettable items among indices '{indices}'.")
+        self._pending = 0
+        self._last_commit = time.monotonic()
+
+    def set_many(self, indices: Sequence[Index], success: Collection[bool]) -> None:
+        self.finish_many(indices, success)
+
+    def _mask(self, query: str, *params) -> np.ndarray:
+        mask = np.zeros(self.size, dtype=bool)
+        mask[_indices(self.connection.execute(query, params))] = True
+        return mask
+
+    def list_done(self, include_failures=False) -> Collection[bool]:
+        return self._mask("SELECT idx FROM samples WHERE status IN (?, ?)",
+                          SUCCEEDED, FAILED if include_failures else SUCCEEDED)
+
+    def list_available(self) -> Collection[bool]:
+        return self._mask("SELECT idx FROM samples WHERE status = ?", AVAILABLE)
+
+    def is_available(self, index: Index) -> bool:
+        row = self.connection.execute("SELECT status FROM samples WHERE idx = ?", (int(index),)).fetchone()
+        return row is not None and row[0] == AVAILABLE
+
+    def available_indices(self) -> Sequence[Index]:
+        return _indices(self.connection.execute("SELECT idx FROM samples WHERE status = ? ORDER BY idx", (AVAILABLE,)))
+
+    def done_indices(self, include_failures=False) -> Sequence[Index]:
+        return _indices(self.connection.execute(
+            "SELECT idx FROM samples WHERE status IN (?, ?) ORDER BY idx",
+            (SUCCEEDED, FAILED if include_failures else SUCCEEDED)))
+
+    def counts(self) -> Mapping[str, int]:
+        return counts(self.connection)
+
+    def __len__(self) -> int:
+        return self.size
+
+
+@dataclass(slots=True, frozen=True)
+class SqliteDataManager(ami.abc.DataManagerInterface):
+    """Data manager keeping state, targets, timings and the latest ranking in a SQLite database.
+
+    Features are the indices themselves. Reopening an existing database resumes the campaign.
+    """
+    state: SqliteStateMachine = MISSING
+    truth: ami.abc.TruthProviderInterface = MISSING
+
+    @classmethod
+    def from_indexed_list_in_file(cls,
+                                  path: Union[str, Path],
+                                  calc_schema: ami.abc.SchemaInterface,
+                                  surrogate_schema: ami.abc.SchemaInterface,
+                                  db_filename: Union[str, Path] = 'AMI.sqlite',
+                                  metadata: Optional[Mapping[str, Sequence]] = None,
+                                  pass_paths: bool = False,
+                                  prefetch_workers: int = 0,
+                                  validation_workers: int = 32,
+                                  cache_dir: Optional[Union[str, Path]] = None,
+                                  batch: int = 1
+                                  ):
+        """'batch' is the number of results committed together, see 'SqliteStateMachine'.
+        See 'FileStreamerTruthProvider.from_list_in_file' for 'validation_workers' and 'cache_dir'.
+        """
+        path = Path(path)
+        assert path.exists()
+        truth = FileStreamerTruthProvider.from_list_in_file(path, calc_schema, metadata, pass_paths, prefetch_workers,
+                                                            validation_workers, cache_dir)
+        state = SqliteStateMachine.from_size(db_filename, len(truth), batch=batch)
+        manager = cls(state=state, truth=truth)
+        manager.exclude(truth.missing)
+        return manager
+
+    def available_for_calculation(self) -> Sequence[Index]:
+        return self.state.available_indices()
+
+    def is_available(self, index: Index) -> bool:
+        return self.state.is_available(index)
+
+    def exclude(self, indices: Sequence[Index]) -> None:
+        """Marks 'indices' as failed before any calculation, e.g. for invalid inputs. Skips unavailable indices."""
+        indices = [i for i in indices if self.state.is_available(i)]
+        if indices:
+            self.state.select_many(indices)
+            self.state.finish_many(indices, False)
+
+    def set_result(self, index: Index, value: Option[Target]) -> Result[..., Exception]:
+        match value:
+            case Some(v):
+                self.state.finish(index, True, float(v))
+            case Nothing:
+                self.state.finish(index, False)
+        return Ok(())
+
+    def set_results(self, indices: Sequence[Index], targets: Sequence[Target],
+                    success: Collection[bool] = True) -> Result[int, Exception]:
+        indices = np.asarray(indices, dtype=int)
+        targets = np.asarray(targets, dtype=float)
+        success = np.broadcast_to(np.asarray(success, dtype=bool), indices.shape)
+        keep = np.zeros(len(indices), dtype=bool)
+        _, first = np.unique(indices, return_index=True)
+        keep[first] = True
+        keep &= self.state.list_available()[indices]
+        indices, targets, success = indices[keep], targets[keep], success[keep]
+        self.state.select_many(indices)
+        self.state.finish_many(indices, success, [float(t) if ok else None for t, ok in zip(targets, success)])
+        return Ok(len(indices))
+
+    def record_ranks(self, ranks: Sequence[Index]) -> None:
+        with self.state.connection:
+            self.state.connection.execute("DELETE FROM rankings")
+            self.state.connection.execute(
+                "INSERT INTO rankings (created, ranks) VALUES (?, ?)",
+                (time.time(), np.asarray(ranks, dtype="<i8").tobytes()))
+
+    def ranks(self) -> np.ndarray:
+        """Returns the latest recorded ranking, best first."""
+        row = self.state.connection.execute("SELECT ranks FROM rankings ORDER BY id DESC LIMIT 1").fetchone()
+        return np.empty(0, dtype=int) if row is None else np.frombuffer(row[0], dtype="<i8").astype(int)
+
+    def unknown(self) -> Sequence[Feature]:
+        return self.state.available_indices()
+
+    def known(self) -> Tuple[Sequence[Feature], Sequence[Target]]:
+        rows = self.state.connection.execute(
+            "SELECT idx, target FROM samples WHERE status = ? ORDER BY idx", (SUCCEEDED,)).fetchall()
+        if not rows:
+            return np.empty(0, dtype=int), np.empty(0, dtype=float)
+        indices, targets = zip(*rows)
+        return np.asarray(indices, dtype=int), np.asarray(targets, dtype=float)
+
+    def interrupted(self) -> Sequence[Index]:
+        return self.state.interrupted
+
+    def cancel(self, index: Index) -> None:
+        self.state.reset(index)
+
+    def flush(self) -> None:
+        self.state.flush()
+
+    def close(self) -> None:
+        self.state.close()
+
+    def __len__(self) -> int:
+        return len(self.state)
+
+    def parameters(self, index: Index) -> Option[OpaqueParameters]:
+        return self.truth.parameters(index, self.state)
+
+    def prefetch(self, indices: Sequence[Index]) -> None:
+        self.truth.prefetch(indices)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Reports the progress of a campaign database, read-only.")
+    parser.add_argument('database', type=str, help='Campaign database.')
+    parser.add_argument('--top', type=int, help='Also lists the best known targets.', default=0)
+    args = parser.parse_args()
+
+    with connect_read_only(args.database) as db:
+        print(", ".join(f"{k}: {v}" for k, v in counts(db).items()))
+        query = "SELECT idx, target FROM samples WHERE status = ? ORDER BY target DESC LIMIT ?"
+        for idx, target in db.execute(query, (SUCCEEDED, args.top)):
+            print(f"{idx:d},{target}")
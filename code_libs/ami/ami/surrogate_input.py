@@ -7,3 +7,6 @@ class SurrogateInput:
     known_x: Sequence[Any]
     known_y: Sequence[Any]
     unknown_x: Sequence[Any]
+    # Observed wall times (in seconds) of calculations at 'cost_x', for cost-aware rankers.
+    cost_x: Sequence[Any] = ()
+    cost_y: Sequence[float] = ()
@@ -0,0 +1,63 @@
+"""Thread budget of surrogate work (fitting and ranking) running next to truth calculations.
+
+Native thread pools are limited for the duration of a task: BLAS and OpenMP through 'threadpoolctl',
+joblib (e.g. scikit-learn 'n_jobs=None') through 'joblib.parallel_config' and TensorFlow intra/inter-op threads.
+Each of them is only configured if installed. TensorFlow thread pools cannot be resized once initialised:
+they are sized once per process, with the largest share surrogate work may get.
+"""
+
+import sys
+from contextlib import contextmanager, ExitStack
+from dataclasses import dataclass
+from typing import Optional, Iterator
+
+
+@dataclass(frozen=True, slots=True)
+class ThreadBudget:
+    """Divides 'cores' between running truth calculations, using 'cores_per_job' each, and surrogate work.
+
+    'reserved' cores are kept for surrogate work, which also gets the cores left idle by calculations.
+    """
+    cores: int
+    cores_per_job: int = 1
+    reserved: int = 0
+
+    def surrogate(self, running: int) -> int:
+        """Number of threads surrogate work may use while 'running' calculations are in flight."""
+        shared = max(self.cores - self.reserved - running * self.cores_per_job, 0)
+        return max(self.reserved + shared, 1)
+
+
+def _configure_tensorflow(threads: int) -> None:
+    tf = sys.modules.get("tensorflow")
+    if tf is None:
+        return
+    try:
+        tf.config.threading.set_intra_op_parallelism_threads(threads)
+        tf.config.threading.set_inter_op_parallelism_threads(min(threads, 2))
+    except RuntimeError:
+        # Already initialised in this process.
+        pass
+
+
+@contextmanager
+def limit(threads: Optional[int], tensorflow_threads: Optional[int] = None) -> Iterator[None]:
+    """Limits native thread pools to 'threads' within the context, TensorFlow to 'tensorflow_threads' if given.
+    Does nothing if 'threads' is 'None'.
+    """
+    if threads is None:
+        yield
+        return
+    _configure_tensorflow(threads if tensorflow_threads is None else tensorflow_threads)
+    with ExitStack() as stack:
+        try:
+            from threadpoolctl import threadpool_limits
+            stack.enter_context(threadpool_limits(limits=threads))
+        except ImportError:
+            pass
+        try:
+            from joblib import parallel_config
+            stack.enter_context(parallel_config(n_jobs=threads))
+        except ImportError:
+            pass
+        yield
@@ -0,0 +1,138 @@
+"""Spans of wall time across a campaign, exported as a Chrome trace (chrome://tracing or https://ui.perfetto.dev).
+
+Tracing is enabled with 'enable(folder)', or by setting 'AMI_TRACE' to the folder, which worker processes inherit.
+Each process appends complete events ('"ph": "X"') to its own file in the folder, one JSON object per line:
+spans survive workers which never exit cleanly. 'export' merges them into a single trace and 'summary'
+tabulates the time spent per span name. When disabled, 'span' returns a shared no-op context manager
+and 'record' returns straight away.
+"""
+
+import json
+import os
+import threading
+from contextlib import nullcontext
+from pathlib import Path
+from time import time
+from typing import Optional, Union, List, Dict, Any, TextIO, ContextManager
+
+ENV = "AMI_TRACE"
+
+_folder: Optional[Path] = Path(os.environ[ENV]) if os.environ.get(ENV) else None
+_file: Optional[TextIO] = None
+_pid: Optional[int] = None
+_lock = threading.Lock()
+_NULL = nullcontext()
+
+
+def enable(folder: Union[str, Path]) -> Path:
+    """Records spans of this process and of processes started from now on to 'folder'.
+
+    Events of earlier runs left in 'folder' are discarded.
+    """
+    global _folder
+    folder = Path(folder)
+    folder.mkdir(parents=True, exist_ok=True)
+    for path in folder.glob("trace-*.jsonl"):
+        path.unlink()
+    _folder = folder
+    os.environ[ENV] = str(folder)
+    return folder
+
+
+def enabled() -> bool:
+    return _folder is not None
+
+
+def folder() -> Optional[Path]:
+    return _folder
+
+
+def _writer() -> TextIO:
+    global _file, _pid
+    pid = os.getpid()
+    if _pid != pid:
+        # First span of this process, or a forked child inheriting the parent's file.
+        _folder.mkdir(parents=True, exist_ok=True)
+        _file, _pid = open(_folder / f"trace-{pid}.jsonl", "a"), pid
+    return _file
+
+
+def record(name: str, start: float, end: float, category: str = "ami", **args: Any) -> None:
+    """Records a span from 'start' to 'end', in seconds since the epoch (see 'time.time')."""
+    if _folder is None:
+        return
+    event = {"name": name, "cat": category, "ph": "X", "ts": start * 1e6, "dur": (end - start) * 1e6,
+             "pid": os.getpid(), "tid": threading.get_native_id(), "args": args}
+    line = json.dumps(event, default=str)
+    with _lock:
+        f = _writer()
+        f.write(line + "\n")
+        f.flush()
+
+
+class _Span:
+    __slots__ = ("name", "category", "args", "start")
+
+    def __init__(self, name: str, category: str, args: Dict[str, Any]):
+        self.name, self.category, self.args = name, category, args
+
+    def __enter__(self) -> "_Span":
+        self.start = time()
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb) -> None:
+        if exc_type is not None:
+            self.args["error"] = exc_type.__name__
+        record(self.name, self.start, time(), self.category, **self.args)
+
+
+def span(name: str, category: str = "ami", **args: Any) -> ContextManager:
+    """Records the wall time spent within the context, with 'args' shown alongside the span."""
+    if _folder is None:
+        return _NULL
+    return _Span(name, category, args)
+
+
+def events(folder: Optional[Union[str, Path]] = None) -> List[Dict[str, Any]]:
+    """Events recorded so far by all processes, sorted by start time."""
+    folder = _folder if folder is None else Path(folder)
+    found = []
+    for path in sorted(folder.glob("trace-*.jsonl")):
+        with open(path) as f:
+            # The last line may be partial if a process was killed while writing.
+            for line in f:
+                try:
+                    found.append(json.loads(line))
+                except json.JSONDecodeError:
+                    pass
+    return sorted(found, key=lambda e: e["ts"])
+
+
+def export(path: Union[str, Path], folder: Optional[Union[str, Path]] = None) -> Path:
+    """Writes events of all processes to 'path' as a Chrome trace, also read by Perfetto."""
+    path = Path(path)
+    with open(path, "w") as f:
+        json.dump({"traceEvents": events(folder), "displayTimeUnit": "ms"}, f)
+    return path
+
+
+def summary(folder: Optional[Union[str, Path]] = None) -> str:
+    """Table of the number of spans and of the total, mean and maximum wall time per span name."""
+    totals: Dict[str, List[float]] = {}
+    for event in events(folder):
+        totals.setdefault(event["name"], []).append(event["dur"] / 1e6)
+    width = max([len(name) for name in totals] + [4])
+    lines = [f"{'span':<{width}} {'count':>7} {'total (s)':>11} {'mean (s)':>10} {'max (s)':>10}"]
+    for name, durations in sorted(totals.items(), key=lambda item: -sum(item[1])):
+        lines.append(f"{name:<{width}} {len(durations):>7d} {sum(durations):>11.3f} "
+                     f"{sum(durations) / len(durations):>10.4f} {max(durations):>10.4f}")
+    return "\n".join(lines)
+
+
+def finish() -> None:
+    """Exports the trace to 'trace.json' in the trace folder and prints the summary, if enabled."""
+    if _folder is None:
+        return
+    path = export(_folder / "trace.json")
+    print(summary())
+    print(f"Trace written to '{path}'.")
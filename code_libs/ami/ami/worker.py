@@ -1,7 +1,11 @@
-from dataclasses import dataclass
-from typing import Sequence, Iterator, Optional
+import os
+from dataclasses import dataclass, field, replace
+from typing import Sequence, Iterator, Optional, FrozenSet
 
 import ami.abc
+import ami.cancel
+import ami.threads
+import ami.trace
 from ami.abc import SchemaInterface, Feature, Target, CalculatorInterface, RankerInterface
 from ami.abc.ranker import Index
 from ami.factory import DataclassFactory
@@ -12,19 +16,56 @@ from ami.serialized_opaque import SerializedOpaque
 class SharedMemorySingleThreadWorker(ami.abc.WorkerInterface):
     truth: ami.abc.CalculatorInterface
     ranker: ami.abc.RankerInterface
+    cpus: FrozenSet[int] = field(default_factory=frozenset)
+    ranker_cpus: FrozenSet[int] = field(default_factory=frozenset)
+    cancel_token: Optional[str] = None
+    # Threads of surrogate work, see 'ami.threads'.
+    threads: Optional[int] = None
+    tensorflow_threads: Optional[int] = None
+
+    @staticmethod
+    def _pin(cpus: FrozenSet[int]) -> None:
+        # Pins the executing process, child processes (e.g. external codes) inherit it.
+        if cpus:
+            os.sched_setaffinity(0, cpus)
 
     def calculate(self, inp: SerializedOpaque) -> SerializedOpaque:
-        return self.truth.calculate(inp)
+        self._pin(self.cpus)
+        with ami.cancel.scope(self.cancel_token), ami.trace.span("calculate", "worker"):
+            return self.truth.calculate(inp)
 
     def rank(self, x: Sequence[Feature]) -> Optional[Iterator[Index]]:
-        return self.ranker.rank(x)
+        with ami.threads.limit(self.threads, self.tensorflow_threads), ami.trace.span("rank", "worker", n=len(x)):
+            return self.ranker.rank(x)
 
     def fit(self, x: Sequence[Feature], y: Sequence[Target]) -> None:
-        return self.ranker.fit(x, y)
+        self._pin(self.ranker_cpus)
+        with ami.threads.limit(self.threads, self.tensorflow_threads), ami.trace.span("fit", "worker", n=len(x)):
+            return self.ranker.fit(x, y)
+
+    def fit_cost(self, x: Sequence[Feature], runtime: Sequence[float]) -> None:
+        with ami.threads.limit(self.threads, self.tensorflow_threads), ami.trace.span("fit_cost", "worker", n=len(x)):
+            return self.ranker.fit_cost(x, runtime)
 
     def schema(self) -> SchemaInterface:
         pass
 
+    def with_ranker(self, ranker: RankerInterface) -> "SharedMemorySingleThreadWorker":
+        """Same worker (and cores) fitting and ranking with 'ranker' instead."""
+        return replace(self, ranker=ranker)
+
+    def with_truth(self, truth: CalculatorInterface) -> "SharedMemorySingleThreadWorker":
+        """Same worker (and cores) calculating with 'truth' instead."""
+        return replace(self, truth=truth)
+
+    def with_threads(self, threads: int, tensorflow_threads: Optional[int] = None) -> "SharedMemorySingleThreadWorker":
+        """Same worker fitting and ranking with at most 'threads' threads, see 'ami.threads.limit'."""
+        return replace(self, threads=threads, tensorflow_threads=tensorflow_threads)
+
+    def with_cancel_token(self, token: str) -> "SharedMemorySingleThreadWorker":
+        """Same worker calculating until 'token' is created, see 'ami.cancel'."""
+        return replace(self, cancel_token=token)
+
 
 @dataclass(frozen=True, slots=True)
 class ShareMemorySingleThreadWorkerFactory(DataclassFactory, ami.abc.WorkerFactoryInterface):
@@ -35,3 +76,7 @@ class ShareMemorySingleThreadWorkerFactory(DataclassFactory, ami.abc.WorkerFacto
 
     def set_truth(self, truth: CalculatorInterface) -> None:
         self.set("truth", truth)
+
+    def set_affinity(self, cpus: FrozenSet[int], ranker_cpus: FrozenSet[int]) -> None:
+        self.set("cpus", frozenset(cpus))
+        self.set("ranker_cpus", frozenset(ranker_cpus))
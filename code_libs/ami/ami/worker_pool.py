@@ -1,12 +1,21 @@
+import pickle
 from concurrent.futures import ProcessPoolExecutor, Future, Executor
 from contextlib import ExitStack
 from dataclasses import dataclass, field, fields
+from itertools import count
+from pathlib import Path
 from queue import Queue
-from typing import Set, MutableMapping, Optional, Sequence
+from tempfile import TemporaryDirectory
+from time import time
+from typing import Set, MutableMapping, Optional, Sequence, List, FrozenSet, Tuple, Iterator
 
 import ami.abc
+import ami.cancel
+import ami.trace
+from ami.elastic import ElasticCapacity
+from ami.threads import ThreadBudget
 from ami.abc import WorkerFactoryInterface
-from ami.abc import WorkerInterface, WorkerExecutorInterface
+from ami.abc import WorkerInterface, WorkerExecutorInterface, RankerInterface, CalculatorInterface
 from ami.factory import DataclassFactory
 from ami.serialized_opaque import SerializedOpaque
 from ami.surrogate_input import SurrogateInput
@@ -14,51 +23,196 @@ from ami.surrogate_input import SurrogateInput
 Index = int
 
 
+def parse_cpu_list(cpulist: str) -> Set[int]:
+    """Parses a kernel cpu list such as '0-3,8,10-11'."""
+    cpus = set()
+    for part in cpulist.strip().split(","):
+        if not part:
+            continue
+        if "-" in part:
+            lo, hi = part.split("-")
+            cpus.update(range(int(lo), int(hi) + 1))
+        else:
+            cpus.add(int(part))
+    return cpus
+
+
+def numa_nodes(cpus: Set[int]) -> List[Set[int]]:
+    """Returns the subsets of 'cpus' belonging to each NUMA node, a single group if unknown."""
+    nodes = []
+    for path in sorted(Path("/sys/devices/system/node").glob("node[0-9]*/cpulist")):
+        node = parse_cpu_list(path.read_text()) & cpus
+        if node:
+            nodes.append(node)
+    return nodes if nodes else [set(cpus)]
+
+
+def slot_core_sets(groups: Sequence[Set[int]], n_slots: int, n_reserved: int) -> Tuple[List[FrozenSet[int]], FrozenSet[int]]:
+    """Splits groups of cores (e.g. NUMA nodes) into 'n_slots' dedicated core sets plus 'n_reserved' reserved cores.
+
+    A core set never spans two groups. Reserved cores are taken from the end of the last groups.
+    If there are fewer cores than slots, cores are shared between slots.
+    """
+    groups = [sorted(g) for g in groups if g]
+    reserved = []
+    for g in reversed(groups):
+        while g and len(reserved) < n_reserved and sum(map(len, groups)) > 1:
+            reserved.append(g.pop())
+    groups = [g for g in groups if g]
+    per_slot = max(1, sum(map(len, groups)) // max(n_slots, 1))
+    slots = []
+    remaining = [list(g) for g in groups]
+    for i in range(n_slots):
+        # Fill from the group with most free cores, wrap around when all are used.
+        g = max(range(len(remaining)), key=lambda j: len(remaining[j]))
+        if not remaining[g]:
+            slots.append(slots[i % len(slots)])
+            continue
+        take, remaining[g] = remaining[g][:per_slot], remaining[g][per_slot:]
+        slots.append(frozenset(take))
+    return slots, frozenset(reserved)
+
+
 def fit_and_rank(worker, inp: SurrogateInput) -> Optional[Sequence[Index]]:
     worker.fit(inp.known_x, inp.known_y)
+    if len(inp.cost_x) > 0:
+        worker.fit_cost(inp.cost_x, inp.cost_y)
     return worker.rank(inp.unknown_x)
 
 
+def _call_pickled(payload: bytes):
+    with ami.trace.span("unpickle", "executor", bytes=len(payload)):
+        fn, args = pickle.loads(payload)
+    return fn(*args)
+
+
 @dataclass(frozen=True, slots=True)
 class SharedMemoryExecutor(WorkerExecutorInterface):
     pool: Executor
     idle: Queue[WorkerInterface]
     busy: MutableMapping[Future, WorkerInterface] = field(default_factory=dict)
-
-    def submit_fit_and_rank(self, inp: SurrogateInput) -> Future:
+    # Folder of cancellation tokens, jobs cannot be cancelled once started without it.
+    tokens: Optional[Path] = None
+    _tokens: MutableMapping[Future, Path] = field(default_factory=dict)
+    _count: Iterator[int] = field(default_factory=count)
+    # Shares cores between running jobs and fitting/ranking if set.
+    budget: Optional[ThreadBudget] = None
+    _fits: Set[Future] = field(default_factory=set)
+    # Resizes the pool while running if set.
+    elastic: Optional[ElasticCapacity] = None
+
+    def capacity(self, running: int) -> Optional[int]:
+        if self.elastic is None:
+            return None
+        return self.elastic.current(running - len(self._fits))
+
+    def _submit(self, fn, *args) -> Future:
+        if not ami.trace.enabled():
+            return self.pool.submit(fn, *args)
+        # Pickled here rather than in the executor's feeder thread, to be timed.
+        start = time()
+        payload = pickle.dumps((fn, args), protocol=pickle.HIGHEST_PROTOCOL)
+        ami.trace.record("pickle", start, time(), "executor", bytes=len(payload))
+        return self.pool.submit(_call_pickled, payload)
+
+    def submit_fit_and_rank(self, inp: SurrogateInput, ranker: Optional[RankerInterface] = None) -> Future:
 
         w = self.idle.get()
-        future = self.pool.submit(fit_and_rank, w, inp)
+        job = w if ranker is None else w.with_ranker(ranker)
+        if self.budget is not None:
+            running = len(self.busy) - len(self._fits)
+            job = job.with_threads(self.budget.surrogate(running), self.budget.surrogate(0))
+        future = self._submit(fit_and_rank, job, inp)
         self.busy[future] = w
+        self._fits.add(future)
         return future
 
-    def submit_job(self, inp: SerializedOpaque) -> Future:
+    def submit_job(self, inp: SerializedOpaque, truth: Optional[CalculatorInterface] = None) -> Future:
         w = self.idle.get()
-
-        future = self.pool.submit(w.calculate, inp)
+        job = w if truth is None else w.with_truth(truth)
+        token = None
+        if self.tokens is not None:
+            token = self.tokens / f"{next(self._count)}"
+            job = job.with_cancel_token(str(token))
+        future = self._submit(job.calculate, inp)
         self.busy[future] = w
+        if token is not None:
+            self._tokens[future] = token
         return future
 
+    def cancel(self, future: Future) -> bool:
+        if future.cancel():
+            return True
+        token = self._tokens.get(future)
+        if token is None or future.done():
+            return False
+        ami.cancel.cancel(token)
+        return True
+
     def release(self, future: Future):
-        q = self.busy[future]
+        q = self.busy.pop(future)
         self.idle.put(q)
+        self._fits.discard(future)
+        token = self._tokens.pop(future, None)
+        if token is not None:
+            token.unlink(missing_ok=True)
 
 
 @dataclass(slots=True, frozen=True)
 class SingleNodeWorkerPool(ami.abc.WorkerPoolInterface):
+    """Pool of 'ncpus' workers on the current node.
+
+    With 'pin', each worker slot gets a dedicated set of cores (taken from the current affinity,
+    without spanning NUMA nodes if 'numa') and truth calculations are pinned to it.
+    'surrogate_cpus' cores are reserved for fitting and ranking, which otherwise use all cores.
+    With 'thread_budget', fitting and ranking are limited to the cores not used by running jobs
+    ('job_threads' each, or the cores of their slot with 'pin'), see 'ami.threads'.
+    With 'elastic', the pool is resized while running: processes, workers and core sets are prepared
+    for 'elastic.max_slots' slots, of which 'elastic.slots' are kept busy, see 'ami.elastic'.
+    """
     ncpus: int
     worker_factory: ami.abc.WorkerFactoryInterface
+    pin: bool = False
+    numa: bool = False
+    surrogate_cpus: int = 0
+    thread_budget: bool = False
+    job_threads: int = 1
+    elastic: Optional[ElasticCapacity] = None
     stack: ExitStack = field(default_factory=ExitStack, init=False)
 
     def __enter__(self) -> SharedMemoryExecutor:
-        pool = self.stack.enter_context(ProcessPoolExecutor(max_workers=self.ncpus))
-        # # Could implement CPU pinning with affinity
-        # affinity = self.cpu_affinity()
-        # work_numbers = sorted(affinity)[:self.ncpus]
+        tokens = Path(self.stack.enter_context(TemporaryDirectory(prefix="ami-cancel-")))
+        pool = self.stack.enter_context(ProcessPoolExecutor(max_workers=self.max_slots()))
         q = Queue()
-        for _ in range(self.ncpus):
+        for cpus, ranker_cpus in self.core_sets():
+            self.worker_factory.set_affinity(cpus, ranker_cpus)
             q.put(self.worker_factory.build().unwrap())
-        return SharedMemoryExecutor(pool, idle=q)
+        return SharedMemoryExecutor(pool, idle=q, tokens=tokens, budget=self.budget(), elastic=self.elastic)
+
+    def max_slots(self) -> int:
+        return self.ncpus if self.elastic is None else max(self.ncpus, self.elastic.max_slots)
+
+    def budget(self) -> Optional[ThreadBudget]:
+        if not self.thread_budget:
+            return None
+        cores = len(self.cpu_affinity())
+        if not self.pin:
+            return ThreadBudget(cores=cores, cores_per_job=self.job_threads)
+        if self.surrogate_cpus > 0:
+            # Fitting and ranking are pinned to reserved cores.
+            _, reserved = self.core_sets()[0]
+            return ThreadBudget(cores=len(reserved), cores_per_job=0, reserved=len(reserved))
+        return ThreadBudget(cores=cores, cores_per_job=max(1, cores // self.max_slots()))
+
+    def core_sets(self) -> List[Tuple[FrozenSet[int], FrozenSet[int]]]:
+        """(truth cores, ranker cores) of each slot, empty sets meaning no pinning."""
+        if not self.pin:
+            return [(frozenset(), frozenset())] * self.max_slots()
+        affinity = self.cpu_affinity()
+        groups = numa_nodes(affinity) if self.numa else [affinity]
+        slots, reserved = slot_core_sets(groups, self.max_slots(), self.surrogate_cpus)
+        ranker_cpus = reserved if reserved else frozenset(affinity)
+        return [(cpus, ranker_cpus) for cpus in slots]
 
     def __exit__(self, exc_type, exc_val, exc_tb):
         self.stack.close()
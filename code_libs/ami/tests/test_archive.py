@@ -0,0 +1,71 @@
+import pytest
+
+from ami.archive import pack, IndexedArchive
+from ami.data_manager import InMemoryDataManager
+
+
+# -----------------------------------------------------------------------------------------------------------------------------
+
+
+@pytest.fixture
+def files(tmp_path):
+    contents = {
+        'repetitive.cif': b'_cell_length_a 10.0\n' * 200,  # shrinks once compressed
+        'tiny.cif': b'x',  # grows once compressed: stored as is
+        'empty.cif': b'',
+    }
+    paths = []
+    for name, content in contents.items():
+        path = tmp_path / name
+        path.write_bytes(content)
+        paths.append(path)
+    return paths, list(contents.values())
+
+# -----------------------------------------------------------------------------------------------------------------------------
+
+
+@pytest.mark.parametrize('compress', [False, True])
+def test_round_trip(tmp_path, files, compress):
+    paths, contents = files
+    assert pack(paths, tmp_path / 'cifs.arc', compress=compress) == 3
+
+    archive = IndexedArchive.open(tmp_path / 'cifs.arc')
+    assert len(archive) == 3
+    assert [archive[i] for i in range(3)] == contents
+    assert archive.names() == [str(p) for p in paths]
+    assert archive.index['compressed'].tolist() == [compress, False, False]
+    assert archive.index['size'].tolist() == [len(c) for c in contents]
+    if compress:
+        assert archive.index['length'][0] < archive.index['size'][0]
+    archive.close()
+
+
+def test_empty(tmp_path):
+    assert pack([], tmp_path / 'empty.arc') == 0
+    archive = IndexedArchive.open(tmp_path / 'empty.arc')
+    assert len(archive) == 0
+    assert archive.names() == []
+
+
+def test_not_an_archive(tmp_path, files):
+    paths, _ = files
+    with pytest.raises(ValueError):
+        IndexedArchive.open(paths[0])
+
+    pack(paths, tmp_path / 'cifs.arc')
+    data = (tmp_path / 'cifs.arc').read_bytes()
+    (tmp_path / 'truncated.arc').write_bytes(data[:-3])
+    with pytest.raises(ValueError):
+        IndexedArchive.open(tmp_path / 'truncated.arc')
+
+
+def test_empty_entries_excluded(tmp_path, files):
+    paths, _ = files
+    pack(paths, tmp_path / 'cifs.arc')
+    data = InMemoryDataManager.from_archive(tmp_path / 'cifs.arc', calc_schema=None, surrogate_schema=None,
+                                            csv_filename=tmp_path / 'AMI.out')
+    assert data.truth.missing == (2,)
+    assert data.available_for_calculation().tolist() == [0, 1]
+    assert data.parameters(0).unwrap()['cif_content'] == paths[0].read_bytes()
+
+# -----------------------------------------------------------------------------------------------------------------------------
@@ -0,0 +1,103 @@
+import os
+import signal
+from queue import Queue
+
+import pytest
+
+from ami.elastic import ElasticCapacity
+from ami.worker_pool import SharedMemoryExecutor
+
+
+# -----------------------------------------------------------------------------------------------------------------------------
+
+
+@pytest.fixture
+def restore_signals():
+    handlers = signal.getsignal(signal.SIGUSR1), signal.getsignal(signal.SIGUSR2)
+    yield
+    signal.signal(signal.SIGUSR1, handlers[0])
+    signal.signal(signal.SIGUSR2, handlers[1])
+
+
+@pytest.fixture
+def load(monkeypatch):
+    """Sets the one minute load average seen by 'ElasticCapacity'."""
+    value = [0.0]
+    monkeypatch.setattr(os, 'getloadavg', lambda: (value[0], 0.0, 0.0))
+    return value
+
+
+def touch(path, content, mtime):
+    path.write_text(content)
+    os.utime(path, (mtime, mtime))
+
+# -----------------------------------------------------------------------------------------------------------------------------
+
+
+def test_clamped():
+    assert ElasticCapacity(slots=10, max_slots=4).slots == 4
+    assert ElasticCapacity(slots=0, max_slots=4, min_slots=2).slots == 2
+
+
+def test_signals(restore_signals):
+    capacity = ElasticCapacity(slots=2, max_slots=3, interval=3600.0)
+    capacity.install_signals()
+    assert capacity.current(0) == 2
+    os.kill(os.getpid(), signal.SIGUSR1)
+    assert capacity.current(0) == 3, 'Applied at once, whatever the interval.'
+    os.kill(os.getpid(), signal.SIGUSR1)
+    assert capacity.current(0) == 3
+    for _ in range(3):
+        os.kill(os.getpid(), signal.SIGUSR2)
+    assert capacity.current(2) == 1, 'Drained below the running jobs, down to the minimum.'
+
+
+def test_control_file(tmp_path):
+    path = tmp_path / 'slots'
+    capacity = ElasticCapacity(slots=2, max_slots=8, control_file=path, interval=0.0)
+    assert capacity.current(0) == 2, 'Missing control file.'
+
+    touch(path, '5\n', 1000)
+    assert capacity.current(0) == 5
+    touch(path, '1', 2000)
+    assert capacity.current(4) == 1, 'Drained below the running jobs.'
+    touch(path, '20', 3000)
+    assert capacity.current(1) == 8
+    touch(path, '', 4000)
+    assert capacity.current(8) == 8, 'Being written: tried again at the next check.'
+    touch(path, '3', 4000)
+    assert capacity.current(8) == 8, 'Only read once modified.'
+    touch(path, '3', 5000)
+    assert capacity.current(8) == 3
+
+
+def test_load_average(load):
+    capacity = ElasticCapacity(slots=1, max_slots=8, load_average=True, cores=16, cores_per_job=2, interval=0.0)
+    load[0] = 4.0
+    assert capacity.current(2) == 8, 'The campaign\'s own jobs do not count.'
+    load[0] = 10.0
+    assert capacity.current(2) == 5
+    load[0] = 24.0
+    assert capacity.current(6) == 2, 'Drained below the running jobs as other processes load the node.'
+    load[0] = 40.0
+    assert capacity.current(6) == 1
+
+
+def test_interval(load):
+    capacity = ElasticCapacity(slots=1, max_slots=8, load_average=True, cores=4, interval=3600.0)
+    assert capacity.current(0) == 4
+    load[0] = 3.0
+    assert capacity.current(0) == 4, 'Not checked again before the interval.'
+
+
+def test_executor_capacity(load):
+    executor = SharedMemoryExecutor(pool=None, idle=Queue())
+    assert executor.capacity(3) is None, 'Not resized.'
+
+    elastic = ElasticCapacity(slots=1, max_slots=8, load_average=True, cores=8, interval=0.0)
+    executor = SharedMemoryExecutor(pool=None, idle=Queue(), elastic=elastic)
+    executor._fits.add(object())
+    load[0] = 6.0
+    assert executor.capacity(4) == 5, 'Fitting and ranking is not a job.'
+
+# -----------------------------------------------------------------------------------------------------------------------------
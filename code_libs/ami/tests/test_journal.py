@@ -0,0 +1,96 @@
+import time
+
+import numpy as np
+
+from ami.data_manager import ResultsLog
+from ami.journal import JournalPersistence, read_journal, in_flight, export_csv
+from ami.journal import MAGIC, RECORD, RUNNING, SUCCEEDED, FAILED, CANCELLED
+
+
+# -----------------------------------------------------------------------------------------------------------------------------
+
+
+def test_round_trip(tmp_path):
+    path = tmp_path / 'AMI.jnl'
+    journal = JournalPersistence.from_filename(path)
+    journal.started(3)
+    journal.append_valid_result(3, 1.5)
+    journal.started(5)
+    journal.append_invalid_result(5)
+    journal.started(7)
+    journal.cancelled(7)
+    journal.append_results([1, 2], [0.5, 9.0], [True, False])
+    journal.close()
+
+    records = read_journal(path)
+    assert records['index'].tolist() == [3, 3, 5, 5, 7, 7, 1, 2]
+    assert records['status'].tolist() == [RUNNING, SUCCEEDED, RUNNING, FAILED, RUNNING, CANCELLED, SUCCEEDED, FAILED]
+    assert records['value'][1] == 1.5 and records['value'][6] == 0.5
+    assert np.isnan(records['value'][[0, 3, 7]]).all()
+    assert (records['finished'] >= records['started']).all()
+    assert records['started'][1] == records['started'][0], 'A result is timed from its dispatch.'
+
+
+def test_partial_record_dropped_on_append(tmp_path):
+    path = tmp_path / 'AMI.jnl'
+    journal = JournalPersistence.from_filename(path)
+    journal.append_valid_result(0, 1.0)
+    journal.close()
+    with open(path, 'ab') as f:
+        f.write(b'\x01' * (RECORD.itemsize // 2))  # cut short by a crash
+    assert len(read_journal(path)) == 1
+
+    journal = JournalPersistence.from_filename(path, append=True)
+    journal.append_valid_result(1, 2.0)
+    journal.close()
+    assert path.stat().st_size == len(MAGIC) + 2 * RECORD.itemsize
+    records = read_journal(path)
+    assert records['index'].tolist() == [0, 1]
+    assert records['value'].tolist() == [1.0, 2.0]
+
+
+def test_in_flight():
+    records = np.zeros(6, dtype=RECORD)
+    records['index'] = [0, 1, 0, 2, 3, 3]
+    records['status'] = [RUNNING, RUNNING, SUCCEEDED, RUNNING, RUNNING, CANCELLED]
+    assert sorted(in_flight(records).tolist()) == [1, 2]
+
+
+def test_export_csv(tmp_path):
+    records = np.zeros(4, dtype=RECORD)
+    records['index'] = [4, 4, 6, 8]
+    records['status'] = [RUNNING, SUCCEEDED, FAILED, CANCELLED]
+    records['value'] = [np.nan, 2.5, np.nan, np.nan]
+    path = tmp_path / 'AMI.out'
+    export_csv(records, path)
+    assert path.read_text() == '#AMI0.0.1\n4,2.5\n#6,\n'
+    log = ResultsLog.from_csv(path)
+    assert log.indices.tolist() == [4, 6]
+    assert log.succeeded.tolist() == [True, False]
+
+
+def test_group_written_on_flush(tmp_path):
+    path = tmp_path / 'AMI.jnl'
+    journal = JournalPersistence.from_filename(path, group=10, interval=3600.0)
+    journal.append_valid_result(0, 1.0)
+    assert len(read_journal(path)) == 0, 'Buffered until the group is full.'
+    journal.flush()
+    assert len(read_journal(path)) == 1
+    journal.close()
+
+
+def test_group_written_after_interval(tmp_path):
+    path = tmp_path / 'AMI.jnl'
+    journal = JournalPersistence.from_filename(path, group=10, interval=0.05)
+    time.sleep(0.1)
+    journal.append_valid_result(0, 1.0)  # the interval elapsed since the file was created
+    journal.append_valid_result(1, 2.0)
+    assert len(read_journal(path)) == 1
+    # No other result comes: the pending one is written once the interval elapses.
+    deadline = time.monotonic() + 5.0
+    while len(read_journal(path)) < 2 and time.monotonic() < deadline:
+        time.sleep(0.01)
+    assert read_journal(path)['index'].tolist() == [0, 1]
+    journal.close()
+
+# -----------------------------------------------------------------------------------------------------------------------------
@@ -0,0 +1,199 @@
+from concurrent.futures import Future
+
+from ami.mp.multiplex import Campaign, MultiplexRunner
+from ami.option import Some, Nothing
+from ami.surrogate_input import SurrogateInput
+
+
+# -----------------------------------------------------------------------------------------------------------------------------
+
+
+class FakeExecutor:
+    """Hands out futures, completed straight away with 'immediate', else by the tests."""
+
+    def __init__(self, immediate=False):
+        self.immediate = immediate
+        self.submitted = []
+        self.ranked = []
+        self.released = []
+
+    def _future(self, value):
+        future = Future()
+        if self.immediate:
+            future.set_result(value)
+        return future
+
+    def capacity(self, running):
+        return None
+
+    def submit_job(self, inp, truth=None):
+        future = self._future(float(inp['subdir']))
+        self.submitted.append((truth, inp['subdir']))
+        return future
+
+    def submit_fit_and_rank(self, inp, ranker=None):
+        self.ranked.append(ranker)
+        # Best first: reverses the candidates.
+        return self._future(list(range(len(inp.unknown_x)))[::-1])
+
+    def release(self, future):
+        self.released.append(future)
+
+
+class FakePool:
+    def __init__(self, n, executor):
+        self.n = n
+        self.executor = executor
+
+    def __enter__(self):
+        return self.executor
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        pass
+
+    def __len__(self):
+        return self.n
+
+
+class FakeScheduler:
+    """Serves indices in the order of the latest ranking, records results."""
+
+    def __init__(self, rank_first=False):
+        self.order = []
+        self.results = []
+        self.rank_first = rank_first
+
+    def needs_new_ranking(self):
+        return self.rank_first
+
+    def ranker_inputs(self):
+        self.rank_first = False
+        return [3, 4], SurrogateInput([], [], [3, 4])
+
+    def set_ranks(self, ranks):
+        self.order = list(ranks)
+
+    def set_remaining(self, remaining):
+        pass
+
+    def next(self):
+        return self.order.pop(0)
+
+    def parameters(self, index):
+        return {'subdir': str(index)}
+
+    def set_result(self, index, value):
+        self.results.append((index, value))
+
+
+class FakeData:
+    def __init__(self):
+        self.flushed = 0
+
+    def flush(self):
+        self.flushed += 1
+
+
+class Counter(FakeScheduler):
+    """Serves 0, 1, 2, ... whatever the results."""
+
+    def __init__(self):
+        super().__init__()
+        self.index = 0
+
+    def next(self):
+        index, self.index = self.index, self.index + 1
+        return index
+
+
+def complete(future, value):
+    if isinstance(value, Exception):
+        future.set_exception(value)
+    else:
+        future.set_result(value)
+    return future
+
+# -----------------------------------------------------------------------------------------------------------------------------
+
+
+def test_fair_share():
+    pool = FakeExecutor()
+    a = Campaign(scheduler=Counter(), ranker=None, budget=10, weight=1.0, truth='a')
+    b = Campaign(scheduler=Counter(), ranker=None, budget=10, weight=2.0, truth='b')
+    runner = MultiplexRunner(campaigns=[a, b], worker_pool=None)
+    futures = [runner._schedule(pool) for _ in range(6)]
+    # Slots in use relative to weight: 'b' holds twice as many as 'a'.
+    assert [truth for truth, _ in pool.submitted] == ['a', 'b', 'b', 'a', 'b', 'b']
+    assert (a.running, b.running) == (2, 4)
+
+    runner._report(pool, complete(futures[1], 1.0))
+    assert b.scheduler.results == [(0, Some(1.0))]
+    assert b.running == 3
+    runner._schedule(pool)
+    assert pool.submitted[-1] == ('b', '4'), 'The freed slot goes back to the campaign below its share.'
+
+
+def test_exhausted_campaigns():
+    pool = FakeExecutor()
+    a = Campaign(scheduler=Counter(), ranker=None, budget=1, truth='a')
+    b = Campaign(scheduler=Counter(), ranker=None, budget=2, truth='b')
+    runner = MultiplexRunner(campaigns=[a, b], worker_pool=None)
+    assert all(runner._schedule(pool) is not None for _ in range(3))
+    assert runner._schedule(pool) is None
+    assert [truth for truth, _ in pool.submitted] == ['a', 'b', 'b']
+
+
+def test_shared_keys():
+    pool = FakeExecutor()
+    truth = object()
+    a = Campaign(scheduler=Counter(), ranker=None, budget=1, truth=truth, keys=range(5))
+    b = Campaign(scheduler=Counter(), ranker=None, budget=2, truth=truth, keys=range(5))
+    c = Campaign(scheduler=Counter(), ranker=None, budget=0, truth=truth, keys=range(5))
+    runner = MultiplexRunner(campaigns=[a, b, c], worker_pool=None)
+
+    first = runner._schedule(pool)
+    second = runner._schedule(pool)
+    assert [index for _, index in pool.submitted] == ['0', '1'], "'b' waits for the calculation of '0' by 'a'."
+    assert b.dispatched == 2 and b.running == 1
+
+    runner._report(pool, complete(first, 5.0))
+    assert a.scheduler.results == [(0, Some(5.0))]
+    assert b.scheduler.results == [(0, Some(5.0))]
+
+    # 'c' starts late: it gets '0' from the results of 'a' and waits for the calculation of '1' by 'b'.
+    c.budget = 2
+    assert runner._schedule(pool) is None
+    assert c.scheduler.results == [(0, Some(5.0))]
+    assert c.dispatched == 2 and c.running == 0
+    assert len(pool.submitted) == 2
+
+    runner._report(pool, complete(second, RuntimeError()))
+    assert b.scheduler.results[-1] == (1, Nothing)
+    assert c.scheduler.results[-1] == (1, Nothing)
+    assert pool.released == [first, second]
+
+
+def test_private_keys():
+    pool = FakeExecutor()
+    truth = object()
+    a = Campaign(scheduler=Counter(), ranker=None, budget=1, truth=truth)
+    b = Campaign(scheduler=Counter(), ranker=None, budget=1, truth=truth)
+    runner = MultiplexRunner(campaigns=[a, b], worker_pool=None)
+    runner._schedule(pool)
+    runner._schedule(pool)
+    assert [index for _, index in pool.submitted] == ['0', '0'], 'Campaigns without keys share nothing.'
+
+
+def test_run():
+    executor = FakeExecutor(immediate=True)
+    a = Campaign(scheduler=FakeScheduler(rank_first=True), ranker='ranker a', budget=2, data=FakeData())
+    b = Campaign(scheduler=Counter(), ranker='ranker b', budget=3, data=FakeData())
+    MultiplexRunner(campaigns=[a, b], worker_pool=FakePool(2, executor)).run()
+
+    assert executor.ranked == ['ranker a']
+    assert a.scheduler.results == [(4, Some(4.0)), (3, Some(3.0))], "'a' follows its ranking."
+    assert b.scheduler.results == [(0, Some(0.0)), (1, Some(1.0)), (2, Some(2.0))]
+    assert a.running == b.running == 0
+    assert a.data.flushed == b.data.flushed == 1, 'Results are flushed once done.'
+
+# -----------------------------------------------------------------------------------------------------------------------------
@@ -0,0 +1,61 @@
+from pathlib import Path
+
+import pytest
+
+from ami.archive import pack, IndexedArchive
+from ami.data_manager import FileStreamerTruthProvider, InMemoryStateMachine
+from ami.path_list import parse_path_list, read_path_list
+
+
+# -----------------------------------------------------------------------------------------------------------------------------
+
+
+def test_parse():
+    assert parse_path_list(b'a.cif\n  b.cif \r\nc.cif') == [Path('a.cif'), Path('b.cif'), Path('c.cif')]
+    assert parse_path_list('a.cif\n\n \n') == [Path('a.cif')], 'Trailing blank lines are ignored.'
+    assert parse_path_list('') == []
+
+
+def test_blank_line_rejected(tmp_path):
+    path = tmp_path / 'list.txt'
+    path.write_text('a.cif\n\nb.cif\n')
+    with pytest.raises(ValueError, match='Line 2'):
+        read_path_list(path)
+
+
+def test_same_indices_everywhere(tmp_path):
+    paths = []
+    for i in range(3):
+        paths.append(tmp_path / f'{i}.cif')
+        paths[-1].write_text(f'cif {i}')
+    path = tmp_path / 'list.txt'
+    path.write_text(''.join(f'{p}\n' for p in paths) + '\n\n')
+
+    truth = FileStreamerTruthProvider.from_list_in_file(path, schema=None)
+    assert truth.filenames == paths
+    assert truth.missing == ()
+
+    pack(read_path_list(path), tmp_path / 'cifs.arc')
+    archive = IndexedArchive.open(tmp_path / 'cifs.arc')
+    assert [archive[i] for i in range(len(archive))] == [p.read_bytes() for p in truth.filenames]
+
+
+def test_deleted_after_validation(tmp_path):
+    paths = [tmp_path / f'{i}.cif' for i in range(2)]
+    for p in paths:
+        p.write_text('cif')
+    path = tmp_path / 'list.txt'
+    path.write_text(''.join(f'{p}\n' for p in paths))
+    FileStreamerTruthProvider.from_list_in_file(path, schema=None, cache_dir=tmp_path / 'cache')
+
+    paths[1].unlink()
+    truth = FileStreamerTruthProvider.from_list_in_file(path, schema=None, cache_dir=tmp_path / 'cache')
+    assert truth.missing == (), 'The cache is keyed by the list: deleted files go unnoticed.'
+    state = InMemoryStateMachine.from_size(2)
+    with pytest.raises(OSError):
+        truth.parameters(1, state)
+
+    (tmp_path / 'cache' / 'list.txt.validated.npz').unlink()
+    assert FileStreamerTruthProvider.from_list_in_file(path, schema=None, cache_dir=tmp_path / 'cache').missing == (1,)
+
+# -----------------------------------------------------------------------------------------------------------------------------
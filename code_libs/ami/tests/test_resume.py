@@ -0,0 +1,106 @@
+import numpy as np
+import pytest
+
+from ami.data_manager import InMemoryDataManager, ResultsLog, results_log_path
+from ami.option import Some, Nothing
+from ami.scheduler import SerialScheduler
+
+
+# -----------------------------------------------------------------------------------------------------------------------------
+
+
+class InOrder:
+    """Ranks candidates in the order they are given."""
+
+    def fit(self, x, y):
+        pass
+
+    def rank(self, x):
+        return np.arange(len(x))
+
+
+@pytest.fixture
+def cif_list(tmp_path):
+    paths = []
+    for i in range(6):
+        paths.append(tmp_path / f'{i}.cif')
+        paths[-1].write_text(f'cif {i}')
+    path = tmp_path / 'list.txt'
+    path.write_text(''.join(f'{p}\n' for p in paths))
+    return path
+
+
+def open_data(cif_list, journal, resume):
+    return InMemoryDataManager.from_indexed_list_in_file(cif_list, calc_schema=None, surrogate_schema=None,
+                                                         csv_filename=cif_list.parent / 'AMI.out',
+                                                         journal=journal, resume=resume)
+
+
+def run(data, index, value):
+    data.parameters(index).unwrap()
+    data.set_result(index, value)
+
+# -----------------------------------------------------------------------------------------------------------------------------
+
+
+@pytest.mark.parametrize('journal', [False, True])
+def test_resume(cif_list, journal):
+    data = open_data(cif_list, journal, resume=False)
+    run(data, 0, Some(1.5))
+    run(data, 1, Nothing)
+    data.parameters(2).unwrap()  # interrupted by a crash
+    data.parameters(3).unwrap()
+    data.cancel(3)  # preempted
+    data.close()
+
+    log = ResultsLog.read(results_log_path(cif_list.parent / 'AMI.out', journal))
+    assert log.indices.tolist() == [0, 1]
+    assert log.values[0] == 1.5 and np.isnan(log.values[1])
+    assert log.succeeded.tolist() == [True, False]
+    assert log.in_flight.tolist() == [2], 'Cancelled calculations are not in flight.'
+
+    data = open_data(cif_list, journal, resume=True)
+    assert data.interrupted() == (2,)
+    assert data.available_for_calculation().tolist() == [2, 3, 4, 5]
+    x, y = data.known()
+    assert y.tolist() == [1.5]
+
+    scheduler = SerialScheduler(data_manager=data, worker_pool=None, initial_ranker=InOrder(), surrogate_schema=None,
+                                truth_schema=None, threshold=10, rerank_on_start=True)
+    assert scheduler.needs_new_ranking(), 'Resumed results are ranked by the actual ranker first.'
+    assert scheduler.next() == 2, 'Interrupted calculations are resubmitted first.'
+    scheduler.parameters(2)
+    scheduler.set_result(2, Some(2.5))
+    data.close()
+
+    data = open_data(cif_list, journal, resume=True)
+    assert data.interrupted() == ()
+    assert sorted(data.known()[1].tolist()) == [1.5, 2.5]
+    assert data.available_for_calculation().tolist() == [3, 4, 5]
+    data.close()
+
+
+def test_csv_truncated_mid_line(cif_list):
+    out = cif_list.parent / 'AMI.out'
+    out.write_text('#AMI0.0.1\n0,1.5\n#started,1\n#started,2\n2,2.')
+
+    log = ResultsLog.from_csv(out)
+    assert log.indices.tolist() == [0]
+    assert sorted(log.in_flight.tolist()) == [1, 2], 'A partial result is not a result.'
+
+    data = open_data(cif_list, journal=False, resume=True)
+    assert data.interrupted() == (1, 2)
+    run(data, 3, Some(3.0))
+    data.close()
+    assert out.read_text() == '#AMI0.0.1\n0,1.5\n#started,1\n#started,2\n#started,3\n3,3.0\n', \
+        'The partial line is dropped, not appended to.'
+
+
+def test_csv_cancelled(tmp_path):
+    out = tmp_path / 'AMI.out'
+    out.write_text('#AMI0.0.1\n#started,3\n#cancelled,3\n#started,4\n#cancelled,4\n#started,4\n#5,\n')
+    log = ResultsLog.from_csv(out)
+    assert log.in_flight.tolist() == [4], 'Dispatched again once cancelled.'
+    assert log.indices.tolist() == [5] and log.succeeded.tolist() == [False]
+
+# -----------------------------------------------------------------------------------------------------------------------------
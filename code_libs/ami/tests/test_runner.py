@@ -0,0 +1,182 @@
+from concurrent.futures import Future
+
+import pytest
+
+from ami.cancel import Cancelled
+from ami.mp.runner import RunnerContextHelper
+from ami.option import Some, Nothing
+
+
+# -----------------------------------------------------------------------------------------------------------------------------
+
+
+class FakeExecutor:
+    """Hands out futures completed by the tests, records submissions and cancellations."""
+
+    def __init__(self):
+        self.submitted = []
+        self.cancelled = []
+        self.released = []
+
+    def submit_job(self, inp, truth=None):
+        future = Future()
+        self.submitted.append((future, inp))
+        return future
+
+    def submit_fit_and_rank(self, inp, ranker=None):
+        raise AssertionError('No ranking expected.')
+
+    def cancel(self, future):
+        self.cancelled.append(future)
+        return True
+
+    def release(self, future):
+        self.released.append(future)
+
+
+class FakeScheduler:
+    """Serves indices in order, records what the runner reports back."""
+
+    def __init__(self, preempted=(), unreadable=()):
+        self.index = 0
+        self.results = []
+        self.cancelled = []
+        self._preempted = tuple(preempted)
+        self.unreadable = set(unreadable)
+
+    def needs_new_ranking(self):
+        return False
+
+    def set_remaining(self, remaining):
+        pass
+
+    def next(self):
+        index, self.index = self.index, self.index + 1
+        return index
+
+    def parameters(self, index):
+        if index in self.unreadable:
+            raise FileNotFoundError(index)
+        return {'subdir': str(index)}
+
+    def set_result(self, index, value):
+        self.results.append((index, value))
+
+    def set_cancelled(self, index):
+        self.cancelled.append(index)
+
+    def preempted(self):
+        return self._preempted
+
+
+def running_with_duplicate(scheduler):
+    """Context running index 0 twice: the original job and its speculative duplicate."""
+    pool = FakeExecutor()
+    ctx = RunnerContextHelper(1, pool, scheduler, speculate=50.0)
+    original = ctx.schedule()
+    ctx.runtimes.extend([0.0] * ctx.min_runtimes)
+    ctx.started[original] -= 1.0  # running for longer than every past job
+    duplicate = ctx.straggler()
+    assert duplicate is not None
+    assert pool.submitted[1][1] == {'subdir': '0', 'seed': 1}
+    assert ctx.straggler() is None, 'An index is only duplicated once.'
+    return ctx, pool, original, duplicate
+
+
+def report(ctx, future, value):
+    if isinstance(value, Exception):
+        future.set_exception(value)
+    else:
+        future.set_result(value)
+    ctx.report(future)
+
+# -----------------------------------------------------------------------------------------------------------------------------
+
+
+def test_first_copy_wins():
+    scheduler = FakeScheduler()
+    ctx, pool, original, duplicate = running_with_duplicate(scheduler)
+
+    report(ctx, duplicate, 2.0)
+    assert scheduler.results == [(0, Some(2.0))]
+    assert pool.cancelled == [original], 'The other copy is cancelled.'
+
+    report(ctx, original, Cancelled())
+    assert scheduler.results == [(0, Some(2.0))], 'The index is reported once.'
+    assert scheduler.cancelled == []
+    assert ctx.counter == 0
+    assert not ctx.copies and not ctx.settled and not ctx.cancelled and not ctx.map
+
+
+def test_all_copies_fail():
+    scheduler = FakeScheduler()
+    ctx, pool, original, duplicate = running_with_duplicate(scheduler)
+
+    report(ctx, duplicate, RuntimeError())
+    assert scheduler.results == [], 'The other copy may still succeed.'
+    assert pool.cancelled == []
+
+    report(ctx, original, RuntimeError())
+    assert scheduler.results == [(0, Nothing)]
+    assert not ctx.copies and not ctx.settled
+
+
+@pytest.mark.parametrize('first', ['original', 'duplicate'])
+def test_preempted_copies(first):
+    scheduler = FakeScheduler(preempted=[0])
+    ctx, pool, original, duplicate = running_with_duplicate(scheduler)
+
+    ctx.preempt()
+    assert set(pool.cancelled) == {original, duplicate}
+
+    futures = [original, duplicate] if first == 'original' else [duplicate, original]
+    for future in futures:
+        report(ctx, future, Cancelled())
+    assert scheduler.cancelled == [0], 'The index goes back to the candidates once.'
+    assert scheduler.results == []
+    assert ctx.counter == 1, 'The budget is refunded once.'
+    assert not ctx.copies and not ctx.settled and not ctx.cancelled
+
+
+def test_preempted_job():
+    scheduler = FakeScheduler(preempted=[0])
+    pool = FakeExecutor()
+    ctx = RunnerContextHelper(1, pool, scheduler)
+    future = ctx.schedule()
+    assert ctx.counter == 0
+
+    ctx.preempt()
+    assert pool.cancelled == [future]
+
+    report(ctx, future, Cancelled())
+    assert scheduler.cancelled == [0], 'The index goes back to the candidates.'
+    assert scheduler.results == []
+    assert ctx.counter == 1, 'The budget is refunded.'
+    assert not ctx.cancelled and not ctx.map
+
+
+def test_cancelled_job_completing_anyway():
+    scheduler = FakeScheduler(preempted=[0])
+    pool = FakeExecutor()
+    ctx = RunnerContextHelper(1, pool, scheduler)
+    future = ctx.schedule()
+
+    ctx.preempt()
+    assert pool.cancelled == [future]
+
+    report(ctx, future, 3.0)
+    assert scheduler.results == [(0, Some(3.0))], 'A result is never thrown away.'
+    assert scheduler.cancelled == []
+    assert ctx.counter == 0
+
+
+def test_unreadable_inputs():
+    scheduler = FakeScheduler(unreadable=[0, 1])
+    pool = FakeExecutor()
+    ctx = RunnerContextHelper(2, pool, scheduler)
+    future = ctx.schedule()
+    assert scheduler.results == [(0, Nothing), (1, Nothing)], 'Unreadable inputs fail their index only.'
+    assert pool.submitted == [(future, {'subdir': '2'})]
+    assert ctx.counter == 1, 'Failed inputs are not charged to the budget.'
+
+# -----------------------------------------------------------------------------------------------------------------------------
@@ -0,0 +1,108 @@
+from io import StringIO
+
+import numpy as np
+
+import pytest
+
+from ami.data_manager import CsvPersistence, MultiFidelityDataManager, MultiFidelityStateMachine
+from ami.data_manager import IndexedMultiFidelityTargetSurrogateProvider, IndexedSingleFloatTargetSurrogateProvider
+from ami.data_manager import InMemoryDataManager, InMemoryStateMachine
+from ami.option import Some
+from ami.scheduler import MultiFidelityScheduler, SerialScheduler
+
+
+# -----------------------------------------------------------------------------------------------------------------------------
+
+
+class FakeTruth:
+    """Parameters are the index itself."""
+
+    def __init__(self, size):
+        self.size = size
+
+    def parameters(self, index, state):
+        state.select(index)
+        return Some({'subdir': str(index)})
+
+    def prefetch(self, indices):
+        pass
+
+    def __len__(self):
+        return self.size
+
+
+class InOrder:
+    """Ranks candidates in the order they are given."""
+
+    def fit(self, x, y):
+        pass
+
+    def rank(self, x):
+        return np.arange(len(x))
+
+
+def multi_fidelity(size, **kwargs):
+    data = MultiFidelityDataManager(
+        state=MultiFidelityStateMachine.from_size(size, 2),
+        surrogate=IndexedMultiFidelityTargetSurrogateProvider.from_size_and_schema(size, 2),
+        truth=FakeTruth(size),
+        io=(CsvPersistence(StringIO()), CsvPersistence(StringIO()))
+    )
+    scheduler = MultiFidelityScheduler(data_manager=data, worker_pool=None, initial_ranker=InOrder(),
+                                       surrogate_schema=None, truth_schema=None, costs=(1.0, 10.0), **kwargs)
+    return scheduler, data
+
+# -----------------------------------------------------------------------------------------------------------------------------
+
+
+def test_multi_fidelity_preemption():
+    scheduler, data = multi_fidelity(6, preempt_rank=2)
+
+    assert scheduler.next() == 0
+    assert scheduler.parameters(0)['fidelity'] == 0, 'The cheap fidelity comes first.'
+    scheduler.set_result(0, Some(1.0))
+    assert scheduler.ranker_inputs()[1].cost_x == [], 'Only reference runtimes are passed to rankers.'
+
+    scheduler.set_ranks([0, 1, 2, 3, 4, 5])
+    assert scheduler.next() == 0
+    assert scheduler.parameters(0)['fidelity'] == 1
+    indices, _ = scheduler.ranker_inputs()
+    assert 0 in indices, 'Running indices are ranked to be preempted.'
+
+    scheduler.set_ranks([1, 2, 0, 3, 4, 5])
+    assert scheduler.preempted() == [0]
+    scheduler.set_cancelled(0)
+    assert data.is_available(0)
+    assert data.is_done(0, 0), 'The cheap result is kept.'
+    assert '#cancelled,0' in data.io[1].writer.getvalue()
+    assert '#cancelled,0' not in data.io[0].writer.getvalue()
+
+    scheduler.set_ranks([0, 1, 2, 3, 4, 5])
+    assert scheduler.next() == 0
+    assert scheduler.parameters(0)['fidelity'] == 1
+    scheduler.set_result(0, Some(2.0))
+    assert scheduler.ranker_inputs()[1].cost_x == [0]
+    assert not data.is_available(0)
+
+
+
+@pytest.mark.parametrize('slack, order', [
+    (0, [0, 2, 3, 1]),  # the next 3 ranked candidates, longest first
+    (2, [0, 3, 5, 1]),  # 2 and 4, the most expensive of the next 5 candidates, are skipped
+])
+def test_makespan_tail(slack, order):
+    size = 8
+    data = InMemoryDataManager(state=InMemoryStateMachine.from_size(size),
+                               surrogate=IndexedSingleFloatTargetSurrogateProvider.from_size_and_schema(size),
+                               truth=FakeTruth(size), io=CsvPersistence(StringIO()))
+    scheduler = SerialScheduler(data_manager=data, worker_pool=None, initial_ranker=InOrder(), surrogate_schema=None,
+                                truth_schema=None, job_costs=[5, 1, 9, 3, 7, 2, 8, 4], makespan_horizon=3,
+                                makespan_slack=slack)
+    dispatched = []
+    for remaining in range(4, 0, -1):
+        scheduler.set_remaining(remaining)
+        dispatched.append(scheduler.next())
+        scheduler.parameters(dispatched[-1])
+    assert dispatched == order
+
+# -----------------------------------------------------------------------------------------------------------------------------
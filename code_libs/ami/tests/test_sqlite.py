@@ -0,0 +1,97 @@
+import pytest
+
+from ami.data_manager import AVAILABLE, RUNNING, SUCCEEDED
+from ami.option import Some, Nothing
+from ami.sqlite import SqliteStateMachine, SqliteDataManager, connect_read_only, counts
+
+
+# -----------------------------------------------------------------------------------------------------------------------------
+
+
+def statuses(path):
+    connection = connect_read_only(path)
+    try:
+        return dict(connection.execute("SELECT idx, status FROM samples").fetchall())
+    finally:
+        connection.close()
+
+
+# -----------------------------------------------------------------------------------------------------------------------------
+
+
+def test_running_rows_resumed(tmp_path):
+    path = tmp_path / 'AMI.sqlite'
+    state = SqliteStateMachine.from_size(path, 5)
+    state.select(1)
+    state.select(3)
+    state.finish(3, True, 2.0)
+    state.select(4)
+    # Crash: the connection goes away with rows still running.
+    state.connection.close()
+    object.__setattr__(state, '_closed', True)
+
+    state = SqliteStateMachine.from_size(path, 5)
+    assert state.interrupted == (1, 4)
+    assert state.available_indices().tolist() == [0, 1, 2, 4]
+    assert state.done_indices().tolist() == [3]
+    state.close()
+
+
+def test_size_mismatch(tmp_path):
+    path = tmp_path / 'AMI.sqlite'
+    SqliteStateMachine.from_size(path, 5).close()
+    with pytest.raises(ValueError):
+        SqliteStateMachine.from_size(path, 6)
+
+
+def test_invalid_transitions(tmp_path):
+    state = SqliteStateMachine.from_size(tmp_path / 'AMI.sqlite', 3)
+    with pytest.raises(RuntimeError):
+        state.finish(0, True, 1.0)  # never selected
+    state.select(0)
+    with pytest.raises(RuntimeError):
+        state.select(0)
+    state.finish(0, True, 1.0)
+    with pytest.raises(RuntimeError):
+        state.finish(0, False)
+    with pytest.raises(RuntimeError):
+        state.select(7)  # no such row
+    with pytest.raises(RuntimeError):
+        state.select_many([1, 0])
+    assert state.is_available(1), 'A failed bulk selection is rolled back.'
+    state.close()
+
+
+def test_batched_updates(tmp_path):
+    path = tmp_path / 'AMI.sqlite'
+    state = SqliteStateMachine.from_size(path, 4, batch=3, interval=3600.0)
+    state.select(0)
+    state.select(1)
+    assert statuses(path)[0] == AVAILABLE, 'Not committed before the batch is full.'
+    state.finish(0, True, 1.0)
+    assert statuses(path)[0] == SUCCEEDED and statuses(path)[1] == RUNNING
+    state.select(2)
+    state.close()
+    assert statuses(path)[2] == RUNNING, 'Pending updates are committed on close.'
+    state.close()
+
+
+def test_data_manager_closed(tmp_path):
+    path = tmp_path / 'AMI.sqlite'
+    data = SqliteDataManager(state=SqliteStateMachine.from_size(path, 4, batch=10, interval=3600.0), truth=None)
+    for index, value in ((0, Some(1.0)), (2, Nothing)):
+        data.state.select(index)
+        data.set_result(index, value)
+    data.state.select(3)
+    data.cancel(3)
+    data.close()
+
+    state = SqliteStateMachine.from_size(path, 4)
+    assert state.interrupted == ()
+    assert counts(state.connection) == {'available': 2, 'running': 0, 'done': 2, 'failed': 1}
+    data = SqliteDataManager(state=state, truth=None)
+    indices, targets = data.known()
+    assert indices.tolist() == [0] and targets.tolist() == [1.0]
+    data.close()
+
+# -----------------------------------------------------------------------------------------------------------------------------
@@ -0,0 +1,155 @@
+import numpy as np
+import pytest
+
+from ami.data_manager import InMemoryStateMachine, CompactStateMachine, compact_state_and_surrogate
+from ami.data_manager import AVAILABLE, SUCCEEDED, FAILED, TARGET_RECORD
+from ami.option import Some, Nothing
+
+
+# -----------------------------------------------------------------------------------------------------------------------------
+
+
+class MaskModel:
+    """Plain boolean masks, everything recomputed on request: the reference for incremental bookkeeping."""
+
+    def __init__(self, size):
+        self.available = np.ones(size, dtype=bool)
+        self.done = np.zeros(size, dtype=bool)
+        self.failed = np.zeros(size, dtype=bool)
+
+    def select(self, index):
+        self.available[index] = False
+
+    def set(self, index, success):
+        self.done[index] = True
+        self.failed[index] = not success
+
+    def reset(self, index):
+        self.available[index] = True
+        self.done[index] = self.failed[index] = False
+
+    def running(self):
+        return ~self.available & ~self.done
+
+
+def check(state, model):
+    assert np.array_equal(state.available_indices(), np.flatnonzero(model.available))
+    assert np.array_equal(state.done_indices(), np.flatnonzero(model.done & ~model.failed))
+    assert np.array_equal(state.done_indices(include_failures=True), np.flatnonzero(model.done))
+    assert np.array_equal(state.list_available(), model.available)
+    assert np.array_equal(state.list_done(), model.done & ~model.failed)
+    assert np.array_equal(state.list_done(include_failures=True), model.done)
+    assert list(state.running_indices()) == np.flatnonzero(model.running()).tolist()
+    assert state.counts() == {'available': int(model.available.sum()), 'running': int(model.running().sum()),
+                              'done': int(model.done.sum()), 'failed': int(model.failed.sum())}
+
+# -----------------------------------------------------------------------------------------------------------------------------
+
+
+@pytest.mark.parametrize('machine', [InMemoryStateMachine, CompactStateMachine])
+@pytest.mark.parametrize('seed', range(5))
+def test_incremental_bookkeeping(machine, seed):
+    rng = np.random.default_rng(seed)
+    size = 50
+    state, model = machine.from_size(size), MaskModel(size)
+    for step in range(2000):
+        op = rng.integers(5)
+        if op == 0 and model.available.any():
+            index = int(rng.choice(np.flatnonzero(model.available)))
+            state.select(index)
+            model.select(index)
+        elif op == 1 and model.running().any():
+            index = int(rng.choice(np.flatnonzero(model.running())))
+            success = bool(rng.integers(2))
+            state.set(index, success)
+            model.set(index, success)
+        elif op == 2:
+            # Any state, including indices taken since available indices were last rebuilt.
+            index = int(rng.integers(size))
+            state.reset(index)
+            model.reset(index)
+        elif op == 3 and model.available.sum() >= 3:
+            indices = rng.choice(np.flatnonzero(model.available), size=3, replace=False)
+            state.select_many(indices)
+            for index in indices:
+                model.select(index)
+            if rng.integers(2):
+                success = rng.integers(2, size=3).astype(bool)
+                state.set_many(indices, success)
+                for index, ok in zip(indices, success):
+                    model.set(index, bool(ok))
+        elif op == 4:
+            check(state, model)
+        assert state.is_available(step % size) == model.available[step % size]
+    check(state, model)
+
+
+def test_reset_with_pending_removal():
+    state = InMemoryStateMachine.from_size(5)
+    state.available_indices()
+    state.select(2)  # removal pending until available indices are requested
+    state.reset(2)
+    assert state.available_indices().tolist() == [0, 1, 2, 3, 4]
+    state.select(3)
+    assert state.available_indices().tolist() == [0, 1, 2, 4]
+    state.set(3, False)
+    state.reset(3)
+    state.reset(3)
+    assert state.available_indices().tolist() == [0, 1, 2, 3, 4]
+
+
+def test_read_only_views():
+    state = InMemoryStateMachine.from_size(4)
+    available = state.available_indices()
+    mask = state.list_available()
+    with pytest.raises(ValueError):
+        available[0] = 3
+    with pytest.raises(ValueError):
+        mask[0] = False
+
+    state.select(1)
+    assert available.tolist() == [0, 1, 2, 3], 'Indices already handed out are replaced, not modified.'
+    assert state.available_indices().tolist() == [0, 2, 3]
+    assert mask.tolist() == [True, False, True, True], 'Masks follow transitions.'
+
+
+def test_state_file(tmp_path):
+    path = tmp_path / 'state.npy'
+    state = CompactStateMachine.from_size(5, path)
+    state.select(0)
+    state.set(0, True)
+    state.select(1)  # running when the process dies
+    state.select(2)
+    state.set(2, False)
+    state.flush()
+    del state
+
+    state = CompactStateMachine.from_size(5, path)
+    assert state.codes.tolist() == [SUCCEEDED, AVAILABLE, FAILED, AVAILABLE, AVAILABLE]
+    assert state.available_indices().tolist() == [1, 3, 4]
+    assert state.counts() == {'available': 3, 'running': 0, 'done': 2, 'failed': 1}
+    with pytest.raises(ValueError):
+        CompactStateMachine.from_size(6, path)
+
+
+def test_targets_file(tmp_path):
+    path = tmp_path / 'state.npy'
+    _, surrogate = compact_state_and_surrogate(5, state_file=path)
+    surrogate.set_target(0, Some(1.5))
+    surrogate.set_target(1, Nothing)
+    surrogate.set_targets([3, 4], [2.5, 3.5])
+    surrogate.writer.close()
+    targets = tmp_path / 'state.npy.targets'
+    with targets.open(mode='ab') as fd:
+        fd.write(b'\x00' * (TARGET_RECORD.itemsize // 2))  # cut short by a crash
+
+    _, surrogate = compact_state_and_surrogate(5, state_file=path)
+    assert surrogate.targets == {0: 1.5, 3: 2.5, 4: 3.5}
+    surrogate.set_target(2, Some(4.5))
+    surrogate.writer.close()
+    assert targets.stat().st_size == 4 * TARGET_RECORD.itemsize, 'The partial record is dropped, not appended to.'
+    _, surrogate = compact_state_and_surrogate(5, state_file=path)
+    assert surrogate.targets == {0: 1.5, 2: 4.5, 3: 2.5, 4: 3.5}
+    surrogate.writer.close()
+
+# -----------------------------------------------------------------------------------------------------------------------------
@@ -70,4 +70,33 @@ class EiRanking:
         improvement = mu - y_max
         scaled_mu = np.divide(improvement, std)
         alpha = improvement * norm.cdf(scaled_mu) + std * norm.pdf(scaled_mu)
-        return alpha
\ No newline at end of file
+        return alpha
+
+
+class EiPerCostRanking(EiRanking):
+    """Expected Improvement per unit of cost (e.g. predicted CPU-second).
+    Favours cheap entries whose expected improvement is comparable to that of much more expensive ones.
+    """
+
+    def score_points(self, mu, std, y_max, cost):
+        """
+        Parameters
+        ----------
+        mu : Predicted values for all entries in `X`
+            Assumes shape is (len(X), )
+
+        std : Standard deviation for predicted values
+            Assumes shape is (len(X), )
+
+        y_max : float
+            Largest value experimentally sampled so far
+
+        cost : Predicted cost of evaluating each entry in `X`, strictly positive
+            Assumes shape is (len(X), )
+
+        Returns
+        -------
+        NDArray[np.float_]
+            Shape (len(X), )
+        """
+        return super().score_points(mu, std, y_max) / cost
@@ -0,0 +1,82 @@
+import numpy as np
+from numpy.typing import NDArray
+
+
+# ------------------------------------------------------------------------------------------------------------------------------------
+
+
+class RuntimeRegressor:
+    """Online ridge regression of log runtimes on per-entry cost features (e.g. log of simulated atoms).
+
+    The model only keeps sufficient statistics (`X^T X` and `X^T y`) so observations can be added one batch at a time
+    at a cost independent of the number of observations seen so far.
+    Coefficients are shrunk towards `prior` rather than zero, so that a sensible cost proxy is predicted before any runtime is observed
+    (by default, runtime proportional to the exponential of the first feature, i.e. to the simulated atoms if it is their log).
+    """
+
+    def __init__(self, n_features: int, alpha: float = 1.0, prior: NDArray[np.float_] = None) -> None:
+        """
+        Parameters
+        ----------
+        n_features : int
+            Number of cost features, an intercept is added on top of them.
+
+        alpha : float (default = 1.0)
+            Ridge penalty, the weight of the prior relative to observations.
+
+        prior : NDArray[np.float_] (default = None)
+            Prior coefficients, intercept first. Defaults to a unit coefficient on the first feature only.
+        """
+        self.n_features = int(n_features)
+        self.alpha = float(alpha)
+        if prior is None:
+            prior = np.zeros(self.n_features + 1)
+            if self.n_features > 0:
+                prior[1] = 1.0
+        self.prior = np.asarray(prior, dtype=float)
+        self.reset()
+
+    def reset(self) -> None:
+        """Forgets all observations."""
+        self._xtx = np.zeros((self.n_features + 1, self.n_features + 1))
+        self._xty = np.zeros(self.n_features + 1)
+        self.n_seen = 0
+        self.coef_ = self.prior.copy()
+
+    @staticmethod
+    def _design(X: NDArray[NDArray[np.float_]]) -> NDArray[NDArray[np.float_]]:
+        X = np.atleast_2d(np.asarray(X, dtype=float))
+        return np.hstack((np.ones((len(X), 1)), X))
+
+    def partial_fit(self, X: NDArray[NDArray[np.float_]], runtime: NDArray[np.float_]) -> None:
+        """Adds observed runtimes and updates coefficients.
+
+        Parameters
+        ----------
+        X : NDArray[NDArray[np.float_]]
+            Cost features of each observation, shape (n, n_features).
+
+        runtime : NDArray[np.float_]
+            Observed runtimes in seconds, shape (n, ). Non positive runtimes are ignored.
+        """
+        runtime = np.asarray(runtime, dtype=float)
+        valid = runtime > 0
+        A = self._design(X)[valid]
+        y = np.log(runtime[valid])
+        self._xtx += A.T @ A
+        self._xty += A.T @ y
+        self.n_seen += len(y)
+        penalty = self.alpha * np.eye(len(self.prior))
+        self.coef_ = np.linalg.solve(self._xtx + penalty, self._xty + penalty @ self.prior)
+
+    def fit(self, X: NDArray[NDArray[np.float_]], runtime: NDArray[np.float_]) -> None:
+        """Same as `partial_fit` after forgetting previous observations."""
+        self.reset()
+        self.partial_fit(X, runtime)
+
+    def predict(self, X: NDArray[NDArray[np.float_]]) -> NDArray[np.float_]:
+        """Predicted runtimes in seconds (geometric mean), shape (len(X), )."""
+        return np.exp(self._design(X) @ self.coef_)
+
+
+# ------------------------------------------------------------------------------------------------------------------------------------
@@ -4,6 +4,8 @@ import numpy as np
 from numpy.typing import NDArray
 import h5py
 
+from surrogate.trace import span
+
 
 # -----------------------------------------------------------------------------------------------------------------------------
 
@@ -43,7 +45,7 @@ class Hdf5Dataset:
         """
         k = np.asarray(k).ravel()
         
-        with h5py.File(self.hdf5_loc, 'r') as f:
+        with span("hdf5_read", "surrogate", rows=len(k)), h5py.File(self.hdf5_loc, 'r') as f:
             X_ = f[self.data_key]
             
             if isinstance(k[0], slice):  # first index since convert to array above
@@ -4,6 +4,7 @@ import gpflow
 from sklearn.ensemble import RandomForestRegressor
 
 from surrogate.data import Hdf5Dataset
+from surrogate.trace import span
 
 
 # ------------------------------------------------------------------------------------------------------------------------------------
@@ -63,7 +64,8 @@ class DenseGaussianProcessregressor:
         
         self.model = self.build_model(X, y_val)
         opt = gpflow.optimizers.Scipy()
-        opt.minimize(self.model.training_loss, self.model.trainable_variables)  
+        with span("gpflow_optimise", "surrogate", n=len(X)):
+            opt.minimize(self.model.training_loss, self.model.trainable_variables)  
         self._model_built = True
 
     def sample_y(self, n_samples=1):
@@ -76,7 +78,109 @@ class DenseGaussianProcessregressor:
     def predict(self):
         # returns predicted values and the standard deviation of the those values
         if self._model_built:
-            mu, var = self.model.predict_y(self.data_set[:])
+            X = self.data_set[:]
+            with span("predict_y", "surrogate", n=len(X)):
+                mu, var = self.model.predict_y(X)
+            mu, var = mu.numpy().ravel(), var.numpy().ravel()
+            return mu, np.sqrt(var)
+        else:
+            raise ValueError('Model not yet fit to data.')
+
+
+# ------------------------------------------------------------------------------------------------------------------------------------
+
+
+class DenseMultiFidelityGaussianProcessRegressor(DenseGaussianProcessregressor):
+    """Gaussian process modelling the correlation between several fidelities of the same target.
+    Uses an intrinsic coregionalisation kernel: the RBF kernel over features is multiplied by a
+    coregionalisation matrix `B = W W^T + diag(kappa)` over fidelities, which is learnt when fitting.
+    Predictions are always made at the highest (reference) fidelity.
+    """
+    
+    def __init__(self, data_set: Hdf5Dataset, n_fidelities: int = 2, rank: int = 1) -> None:
+        super().__init__(data_set)
+        self.n_fidelities = int(n_fidelities)
+        self.rank = int(rank)
+        
+    def _augment(self, X: NDArray[NDArray[np.float_]], fidelity: NDArray[np.int_]) -> NDArray[NDArray[np.float_]]:
+        return np.column_stack((X, np.asarray(fidelity, dtype=float)))
+        
+    def build_model(self, X: NDArray[NDArray[np.float_]], y: NDArray[np.float_]) -> gpflow.models.GPR:
+        """Initialise and return the gpflow model (will be optimised when `fit` is called).
+
+        Parameters
+        ----------
+        X : NDArray[NDArray[np.float_]]
+            Feature matrix to fit model to, the last column being the fidelity of each entry.
+            
+        y : NDArray[np.float_]
+            Target values for passed entries.
+
+        Returns
+        -------
+        gpflow.models.GPR
+        """
+        n_features = X.shape[1] - 1
+        coregion = gpflow.kernels.Coregion(output_dim=self.n_fidelities, rank=self.rank, active_dims=[n_features])
+        coregion.W.assign(np.random.RandomState(0).uniform(0.5, 1.0, size=(self.n_fidelities, self.rank)))
+        rbf = gpflow.kernels.RBF(lengthscales=np.ones(n_features), active_dims=list(range(n_features)))
+        model = gpflow.models.GPR(
+        data=(X, y), 
+        kernel=rbf * coregion,
+        mean_function=gpflow.mean_functions.Constant()
+        )
+        return model
+        
+    def fit(self, X_ind: NDArray[NDArray[np.int_]], y_val: NDArray[np.float_]) -> None:
+        """Fit the backend gpflow model to the passed data.
+
+        Parameters
+        ----------
+        X_ind : NDArray[NDArray[np.int_]]
+            (index, fidelity) pairs of data points to use when fitting, shape (n, 2).
+            
+        y_val : NDArray[np.float_]
+            Target values for each entry. 
+            
+        Returns
+        -------
+        None
+        """
+        X_ind = np.asarray(X_ind, dtype=int).reshape(-1, 2)
+        X = self._augment(self.data_set[X_ind[:, 0]], X_ind[:, 1])
+        y_val = np.asarray(y_val, dtype=float).reshape(-1, 1)
+        
+        self.model = self.build_model(X, y_val)
+        opt = gpflow.optimizers.Scipy()
+        with span("gpflow_optimise", "surrogate", n=len(X)):
+            opt.minimize(self.model.training_loss, self.model.trainable_variables)  
+        self._model_built = True
+        
+    def _reference_features(self) -> NDArray[NDArray[np.float_]]:
+        X = self.data_set[:]
+        return self._augment(X, np.full(len(X), self.n_fidelities - 1))
+
+    def correlation(self) -> NDArray[NDArray[np.float_]]:
+        """Correlation matrix between fidelities learnt by the coregionalisation kernel."""
+        if not self._model_built:
+            raise ValueError('Model not yet fit to data.')
+        B = self.model.kernel.kernels[1].output_covariance().numpy()
+        d = np.sqrt(np.diag(B))
+        return B / np.outer(d, d)
+
+    def sample_y(self, n_samples=1):
+        if self._model_built:
+            posterior = self.model.predict_f_samples(self._reference_features(), num_samples=int(n_samples))
+            return posterior.numpy().T[0]
+        else:
+            raise ValueError('Model not yet fit to data.')
+        
+    def predict(self):
+        # returns predicted values at the reference fidelity and the standard deviation of the those values
+        if self._model_built:
+            X = self._reference_features()
+            with span("predict_y", "surrogate", n=len(X)):
+                mu, var = self.model.predict_y(X)
             mu, var = mu.numpy().ravel(), var.numpy().ravel()
             return mu, np.sqrt(var)
         else:
@@ -110,12 +214,14 @@ class DenseRandomForestRegressor:
         """
         X = self.data_set[X_ind]
         self.model = RandomForestRegressor()
-        self.model.fit(X, np.ravel(y_val))
+        with span("forest_fit", "surrogate", n=len(X)):
+            self.model.fit(X, np.ravel(y_val))
         
     def predict(self):
         # returns predicted values and the standard deviation of the those values
         X = self.data_set[:]
-        ensemble_predictions = np.vstack([m.predict(X) for m in self.model.estimators_])
+        with span("forest_predict", "surrogate", n=len(X)):
+            ensemble_predictions = np.vstack([m.predict(X) for m in self.model.estimators_])
         mu = ensemble_predictions.mean(0)
         std = ensemble_predictions.std(0)
         return mu, std
@@ -0,0 +1,47 @@
+import pytest
+import numpy as np
+
+from surrogate.acquisition import EiRanking, EiPerCostRanking
+from surrogate.cost import RuntimeRegressor
+
+
+# -----------------------------------------------------------------------------------------------------------------------------
+
+RAND = np.random.RandomState(1)
+
+# -----------------------------------------------------------------------------------------------------------------------------
+
+
+def test_RuntimeRegressor_prior():
+    model = RuntimeRegressor(n_features=2)
+    X = np.log([[10.0, 1.0], [1000.0, 1.0]])
+    runtime = model.predict(X)
+    assert runtime.shape == (2, )
+    assert np.allclose(runtime[1] / runtime[0], 100.0), 'Runtime proportional to the first feature before any observation.'
+
+
+@pytest.mark.parametrize('batches', [1, 4])
+def test_RuntimeRegressor_learns(batches):
+    X = RAND.uniform(0, 5, size=(200, 2))
+    runtime = np.exp(0.5 + 2.0 * X[:, 0] - 1.0 * X[:, 1])
+
+    model = RuntimeRegressor(n_features=2, alpha=1e-6)
+    for X_batch, runtime_batch in zip(np.array_split(X, batches), np.array_split(runtime, batches)):
+        model.partial_fit(X_batch, runtime_batch)
+
+    assert model.n_seen == len(X)
+    assert np.allclose(model.coef_, [0.5, 2.0, -1.0], atol=1e-3)
+    assert np.allclose(model.predict(X), runtime, rtol=1e-2)
+
+
+def test_EiPerCostRanking():
+    mu, std = np.array([1.0, 1.0, 2.0]), np.array([0.5, 0.5, 0.5])
+    cost = np.array([1.0, 10.0, 100.0])
+    ei = EiRanking().score_points(mu, std, 1.0)
+    scores = EiPerCostRanking().score_points(mu, std, 1.0, cost)
+
+    assert np.allclose(scores, ei / cost)
+    assert np.argmax(ei) == 2 and np.argmax(scores) == 0, 'Cheap entries are preferred at comparable improvement.'
+
+
+# -----------------------------------------------------------------------------------------------------------------------------
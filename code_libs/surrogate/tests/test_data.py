@@ -2,7 +2,7 @@ import pytest
 import numpy as np
 
 from surrogate.data import Hdf5Dataset
-from surrogate.dense import DenseGaussianProcessregressor
+from surrogate.dense import DenseGaussianProcessregressor, DenseMultiFidelityGaussianProcessRegressor
 
 # -----------------------------------------------------------------------------------------------------------------------------
 
@@ -56,3 +56,30 @@ def test_hdf5_with_dense_models(n):
     
 
 # -----------------------------------------------------------------------------------------------------------------------------
+
+
+@pytest.mark.parametrize("n", [2, 10]) 
+def test_hdf5_with_multi_fidelity_model(n):
+    X = Hdf5Dataset(F'tests/data/COF_p.hdf5', 'X')
+    y = Hdf5Dataset(F'tests/data/COF_p.hdf5', 'y')[:].ravel()
+    
+    model = DenseMultiFidelityGaussianProcessRegressor(data_set=X, n_fidelities=2)
+    
+    train_indices = RAND.choice(len(X), size=n, replace=False)
+    low = np.column_stack((train_indices, np.zeros(n, dtype=int)))
+    high = np.column_stack((train_indices[:n // 2], np.ones(n // 2, dtype=int)))
+    X_train = np.vstack((low, high))
+    y_train = np.concatenate((0.9 * y[train_indices], y[train_indices[:n // 2]]))
+    
+    model.fit(X_train, y_train)
+    
+    mu, std = model.predict()
+    assert mu.shape == std.shape == (len(X),)
+    assert model.sample_y(n_samples=3).shape == (len(X), 3)
+    
+    corr = model.correlation()
+    assert corr.shape == (2, 2)
+    assert np.allclose(np.diag(corr), 1.0)
+    
+
+# -----------------------------------------------------------------------------------------------------------------------------
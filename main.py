@@ -1,36 +1,91 @@
 import argparse
+from pathlib import Path
 from uuid import uuid4
 
 import pandas as pd
 
 from ami.mp.configuration import Configuration
-from ami.data_manager import InMemoryDataManager
-from ami.scheduler import SerialSchedulerFactory
+from ami.mp.multiplex import MultiplexConfiguration, CampaignConfiguration
+from ami.data_manager import InMemoryDataManager, MultiFidelityDataManager
+from ami.sqlite import SqliteDataManager
+from ami.scheduler import SerialSchedulerFactory, MultiFidelitySchedulerFactory
 from ami.worker import ShareMemorySingleThreadWorkerFactory
 from ami.worker_pool import SingleNodeWorkerPoolFactory
-from ami.option import Some
+from ami.elastic import ElasticCapacity
+from ami.archive import IndexedArchive
 
-from surrogate.acquisition import EiRanking
-from surrogate.dense import DenseGaussianProcessregressor, DenseRandomForestRegressor
+from surrogate.acquisition import EiRanking, EiPerCostRanking
+from surrogate.cost import RuntimeRegressor
+from surrogate.dense import DenseGaussianProcessregressor, DenseRandomForestRegressor, DenseMultiFidelityGaussianProcessRegressor
 from surrogate.data import Hdf5Dataset
 
-from ranking_models import ExpectedImprovementRanker, RandomRanker
-from raspa import XeKrSeparation
+from ranking_models import ExpectedImprovementRanker, RandomRanker, MultiFidelityExpectedImprovementRanker, \
+    CostAwareExpectedImprovementRanker
+from raspa import XeKrSeparation, MultiFidelityXeKrSeparation, SimulationLimits
+from cif_metadata import CifMetadata
+from workdir import ScratchWorkdir
 
 
 # ---------------------------------------------------------------------------------------
 # collect args
 
 parser = argparse.ArgumentParser()
+# a single data source: multi-fidelity file list, SQLite database or CIF archive
+source = parser.add_mutually_exclusive_group()
 parser.add_argument('-n', type=int, help='Total number of MOFs to screen.', default=344)
-parser.add_argument('-r', type=str, help='Ranker to use')
+parser.add_argument('-r', type=str, help='Ranker to use, several comma separated rankers share the same workers.')
+source.add_argument('-f', action='store_true', help='Mix short (low fidelity) and full RASPA simulations.')
+parser.add_argument('--metadata', type=str, help='CIF metadata table, computed from the CIF list if missing.', default=None)
+parser.add_argument('--scratch', type=str, help='Run simulations in node-local scratch ("auto" for /dev/shm or $TMPDIR).', default=None)
+parser.add_argument('--archive', action='store_true', help='With --scratch, keep outputs in a single zip archive.')
+parser.add_argument('--timeout', type=float, help='Wall time limit of a simulation, in hours.', default=None)
+parser.add_argument('--max-memory', type=float, help='Memory limit of a simulation, in GB.', default=None)
+parser.add_argument('--pin', action='store_true', help='Pin each simulation slot to dedicated cores.')
+parser.add_argument('--numa', action='store_true', help='With --pin, keep each slot within a NUMA node.')
+parser.add_argument('--surrogate-cpus', type=int, help='With --pin, cores reserved for surrogate fitting.', default=0)
+parser.add_argument('--cif-paths', action='store_true', help='Send CIF paths to workers instead of CIF contents.')
+parser.add_argument('--prefetch', type=int, help='Number of upcoming CIFs read in the background.', default=0)
+parser.add_argument('--validation-workers', type=int, help='Threads checking that listed CIFs exist (0: no check).', default=32)
+parser.add_argument('--validation-cache', type=str, help='Folder caching the check of the CIF list, instead of next to it.', default=None)
+parser.add_argument('--compact', action='store_true', help='Compact state and sparse targets, for very large libraries.')
+parser.add_argument('--state-file', type=str, help='Memory-map the compact state from this file, reused by later runs.', default=None)
+parser.add_argument('--journal', action='store_true', help='Log results to a binary journal instead of CSV.')
+parser.add_argument('--journal-group', type=int, help='With --journal, write results in groups of N.', default=1)
+parser.add_argument('--journal-interval', type=float, help='With --journal, write pending results at least every S seconds.', default=1.0)
+parser.add_argument('--fsync-interval', type=float, help='With --journal, force results to disk at most every S seconds (0: every write).', default=None)
+parser.add_argument('--resume', type=str, help='Resumes the run with this run code from its results log.', default=None)
+source.add_argument('--database', type=str, help='Keep the campaign in this SQLite database, resumed if it exists.', default=None)
+parser.add_argument('--cost-aware', action='store_true', help='With --metadata, rank by expected improvement per predicted CPU second.')
+parser.add_argument('--makespan', type=int, help='With --metadata, pack the last N simulations longest first.', default=0)
+parser.add_argument('--preempt', type=int, help='Cancel running simulations with at least N better candidates after a re-rank.', default=0)
+parser.add_argument('--checkpoint', type=int, help='RASPA checkpoint interval in cycles, interrupted simulations continue from it.', default=0)
+parser.add_argument('--replicas', type=int, help='Split production cycles of a simulation over this many concurrent RASPA runs.', default=1)
+parser.add_argument('--speculate', type=float, help='Duplicate simulations running longer than this percentile of past runtimes.', default=None)
+parser.add_argument('--thread-budget', action='store_true', help='Let surrogate fitting use the cores left idle by simulations.')
+parser.add_argument('--slots', type=int, help='Number of concurrent simulations.', default=1)
+parser.add_argument('--max-slots', type=int, help='Resize slots while running up to this number, SIGUSR1/SIGUSR2 add/remove one.', default=None)
+parser.add_argument('--control-file', type=str, help='With --max-slots, set the number of slots by writing it to this file.', default=None)
+parser.add_argument('--load-policy', action='store_true', help='With --max-slots, follow the cores left idle by other processes.')
+parser.add_argument('--trace', type=str, help='Record where wall time goes to this folder, as a Chrome/Perfetto trace.', default=None)
+source.add_argument('--cif-archive', type=str, help='Read CIFs from an archive packed with `python -m ami.archive`.', default=None)
 args = parser.parse_args()
+if args.cif_archive is not None and (args.cif_paths or args.prefetch > 0):
+    # CIFs are read from the memory-mapped archive, there are no files to pass nor to prefetch
+    parser.error("--cif-paths and --prefetch cannot be combined with --cif-archive.")
+if args.database is not None and (args.journal or args.compact or args.state_file is not None):
+    # state and results are kept in the database itself
+    parser.error("--journal, --compact and --state-file cannot be combined with --database.")
+if args.cost_aware and (args.f or args.metadata is None):
+    parser.error("--cost-aware requires --metadata and a single fidelity ranker (not -f).")
+if args.r is not None and ',' in args.r and (args.f or args.preempt > 0 or args.speculate is not None):
+    # campaigns sharing workers are run by `MultiplexRunner`, which neither cancels nor duplicates jobs
+    parser.error("several rankers cannot be combined with -f, --preempt or --speculate.")
 
 code = uuid4().hex[::4]
-pool_size = 1
+pool_size = args.slots
 n_tasks = args.n
-ranker_choice = args.r
-run_code = F'{ranker_choice}_{code}'
+ranker_choice, *other_rankers = args.r.split(',') if args.r is not None else [None]
+run_code = F'{ranker_choice}_{code}' if args.resume is None else args.resume
 
 # ---------------------------------------------------------------------------------------
 # set up ML code
@@ -46,41 +101,222 @@ gp_ranker = ExpectedImprovementRanker(
     )
 
 rf_ranker = ExpectedImprovementRanker(
-    model=DenseRandomForestRegressor(dataset=hdf5_dataset),
+    model=DenseRandomForestRegressor(data_set=hdf5_dataset),
     acquisitor=EiRanking()
 )
 
-surrogate_ranker = {'gp': gp_ranker, 'rf': rf_ranker}[ranker_choice]
+mf_ranker = MultiFidelityExpectedImprovementRanker(
+    model=DenseMultiFidelityGaussianProcessRegressor(data_set=hdf5_dataset, n_fidelities=2),
+    acquisitor=EiRanking()
+)
+
+rankers = {'gp': gp_ranker, 'rf': rf_ranker}
+surrogate_ranker = mf_ranker if args.f else rankers[ranker_choice]
+
+# # ---------------------------------------------------------------------------------------
+# CIF metadata: parses every CIF once, up front and in parallel
+cif_list = "Ex7_05_cif_list_2.txt"
+metadata, supercells = None, None
+if args.metadata is not None:
+    if Path(args.metadata).exists():
+        metadata = CifMetadata.load(args.metadata)
+    elif args.cif_archive is not None:
+        # indexed like the archive entries, which the data manager reads
+        metadata = CifMetadata.from_archive(args.cif_archive)
+        metadata.save(args.metadata)
+    else:
+        metadata = CifMetadata.from_list_in_file(cif_list)
+        metadata.save(args.metadata)
+    if args.cif_archive is not None and len(metadata) != len(IndexedArchive.open(args.cif_archive)):
+        parser.error(F"--metadata {args.metadata} does not describe the entries of --cif-archive {args.cif_archive}.")
+    supercells = {"supercell": metadata.supercells}
+    if args.cost_aware:
+        # runtime model learnt from observed wall times, starting from runtimes proportional to simulated atoms,
+        # for every ranker (including those of extra campaigns)
+        rankers = {
+            name: CostAwareExpectedImprovementRanker(
+                model=ranker.model,
+                acquisitor=EiPerCostRanking(),
+                cost_model=RuntimeRegressor(n_features=2),
+                features=metadata.cost_features()
+            )
+            for name, ranker in rankers.items()
+        }
+        surrogate_ranker = rankers[ranker_choice]
 
 # # ---------------------------------------------------------------------------------------
 # Set up AMI code
-calc = XeKrSeparation.from_template_folder(F"internal_workdir_{run_code}", "raspa_template")
 init_ranker = RandomRanker()
 pool = SingleNodeWorkerPoolFactory()
 pool.set("ncpus", pool_size)
+pool.set("pin", args.pin)
+pool.set("numa", args.numa)
+pool.set("surrogate_cpus", args.surrogate_cpus)
+pool.set("thread_budget", args.thread_budget)
+pool.set("job_threads", args.replicas)
+if args.max_slots is not None:
+    # running simulations are never killed when shrinking, their slots are drained
+    elastic = ElasticCapacity(
+        slots=pool_size,
+        max_slots=args.max_slots,
+        control_file=Path(args.control_file) if args.control_file is not None else None,
+        load_average=args.load_policy,
+        cores_per_job=args.replicas
+    )
+    elastic.install_signals()
+    pool.set("elastic", elastic)
+
+scratch = None
+if args.scratch is not None:
+    scratch = ScratchWorkdir.from_paths(
+        root=None if args.scratch == "auto" else args.scratch,
+        archive=F'ami_outputs_{run_code}.zip' if args.archive else None,
+        keep=("Output/System_0/*.data",) if args.replicas <= 1 else ("replica_*/Output/System_0/*.data",),
+        resume=(("CrashRestart/*", "replica_*/CrashRestart/*") if args.checkpoint > 0 else ()) +
+               (("equilibration/Restart/System_0/*",) if args.replicas > 1 else ())
+    )
+
+journal_options = dict(group=args.journal_group, interval=args.journal_interval, fsync_interval=args.fsync_interval)
+
+limits = SimulationLimits(
+    wall_time=None if args.timeout is None else args.timeout * 3600,
+    memory=None if args.max_memory is None else int(args.max_memory * 1024 ** 3)
+)
+
+if args.f:
+    calc = MultiFidelityXeKrSeparation.from_template_folder(F"internal_workdir_{run_code}", "raspa_template",
+                                                              shared=True, scratch=scratch, limits=limits,
+                                                              checkpoint_every=args.checkpoint, replicas=args.replicas)
+else:
+    calc = XeKrSeparation.from_template_folder(F"internal_workdir_{run_code}", "raspa_template",
+                                               shared=True, scratch=scratch, limits=limits,
+                                               checkpoint_every=args.checkpoint, replicas=args.replicas)
+
+
+def campaign_file(path, name):
+    """`path` for the main campaign, with `_<name>` added to its stem for the extra campaign of ranker `name`."""
+    if path is None or name is None:
+        return path
+    path = Path(path)
+    return path.with_name(F'{path.stem}_{name}{path.suffix}')
+
+
+def campaign_setup(name, ranker):
+    """Scheduler factory and data manager of the main campaign (`name` is None) or of the extra campaign of a ranker.
+    Every campaign gets the same setup, with its own logs (resumed along with the main one) and database.
+    """
+    log_code = run_code if name is None else F'{run_code}_{name}'
+    if args.f:
+        scheduler = MultiFidelitySchedulerFactory()
+        scheduler.set("costs", calc.costs())
+        scheduler.set("lookahead", args.prefetch)
+        data = MultiFidelityDataManager.from_indexed_list_in_file(cif_list,
+                                                                 calc_schema=calc.schema(),
+                                                                 surrogate_schema=ranker.schema(),
+                                                                 n_fidelities=2,
+                                                                 csv_filename=F'ami_output_{log_code}.txt',
+                                                                 metadata=supercells,
+                                                                 pass_paths=args.cif_paths,
+                                                                 prefetch_workers=1 if args.prefetch > 0 else 0,
+                                                                 validation_workers=args.validation_workers,
+                                                                 cache_dir=args.validation_cache,
+                                                                 journal=args.journal,
+                                                                 **journal_options,
+                                                                 resume=args.resume is not None
+                                                                 )
+    elif args.cif_archive is not None:
+        scheduler = SerialSchedulerFactory()
+        data = InMemoryDataManager.from_archive(args.cif_archive,
+                                                calc_schema=calc.schema(),
+                                                surrogate_schema=ranker.schema(),
+                                                csv_filename=F'ami_output_{log_code}.txt',
+                                                metadata=supercells,
+                                                compact=args.compact,
+                                                state_file=campaign_file(args.state_file, name),
+                                                journal=args.journal,
+                                                **journal_options,
+                                                resume=args.resume is not None
+                                                )
+    elif args.database is not None:
+        scheduler = SerialSchedulerFactory()
+        scheduler.set("lookahead", args.prefetch)
+        data = SqliteDataManager.from_indexed_list_in_file(cif_list,
+                                                           calc_schema=calc.schema(),
+                                                           surrogate_schema=ranker.schema(),
+                                                           db_filename=campaign_file(args.database, name),
+                                                           metadata=supercells,
+                                                           pass_paths=args.cif_paths,
+                                                           prefetch_workers=1 if args.prefetch > 0 else 0,
+                                                           validation_workers=args.validation_workers,
+                                                           cache_dir=args.validation_cache
+                                                           )
+    else:
+        scheduler = SerialSchedulerFactory()
+        scheduler.set("lookahead", args.prefetch)
+        data = InMemoryDataManager.from_indexed_list_in_file(cif_list,
+                                                             calc_schema=calc.schema(),
+                                                             surrogate_schema=ranker.schema(),
+                                                             csv_filename=F'ami_output_{log_code}.txt',
+                                                             metadata=supercells,
+                                                             pass_paths=args.cif_paths,
+                                                             prefetch_workers=1 if args.prefetch > 0 else 0,
+                                                             validation_workers=args.validation_workers,
+                                                             cache_dir=args.validation_cache,
+                                                             compact=args.compact,
+                                                             state_file=campaign_file(args.state_file, name),
+                                                             journal=args.journal,
+                                                             **journal_options,
+                                                             resume=args.resume is not None
+                                                             )
+
+    scheduler.set("rerank_on_start", args.resume is not None)
+    scheduler.set("preempt_rank", args.preempt)
+    if metadata is not None and args.makespan > 0:
+        # large supercells are started early so that the campaign does not wait on a straggler
+        scheduler.set("job_costs", metadata.simulated_atoms())
+        scheduler.set("makespan_horizon", args.makespan)
+        scheduler.set("makespan_slack", pool_size)
+
+    # frameworks which could not be parsed are failed straight away
+    if metadata is not None:
+        data.exclude(metadata.invalid())
+
+    # incorporating data from initial sample for consistency, in one pass (already there when resuming)
+    data.set_results(X_init, y_init)
+    return scheduler, data
+
+
+scheduler, data = campaign_setup(None, surrogate_ranker)
 
 config = Configuration(
-    scheduler=SerialSchedulerFactory(),
+    scheduler=scheduler,
     worker=ShareMemorySingleThreadWorkerFactory(),
-    data=InMemoryDataManager.from_indexed_list_in_file("Ex7_05_cif_list_2.txt",
-                                                       calc_schema=calc.schema(),
-                                                       surrogate_schema=surrogate_ranker.schema(),
-                                                       csv_filename=F'ami_output_{run_code}.txt'
-                                                       ),
+    data=data,
     truth=calc,
     pool=pool,
     initial_ranker=init_ranker,
     ranker=surrogate_ranker,
+    speculate=args.speculate,
+    trace=Path(args.trace) if args.trace is not None else None
 )
 
-# incorporating data from initial sample for consistency
-for x_, y_ in zip(X_init, y_init):
-    config.data.set_result(x_, Some(y_))
-
 # # ---------------------------------------------------------------------------------------
 # Run screening
-runner = config.build()
-runner.run(n_tasks)
+if not other_rankers:
+    runner = config.build()
+    runner.run(n_tasks)
+else:
+    # one campaign per ranker over the same workers, frameworks picked by several rankers are simulated once
+    campaigns = [CampaignConfiguration(scheduler=scheduler, data=data, initial_ranker=init_ranker,
+                                       ranker=surrogate_ranker, budget=n_tasks, keys=range(len(data)))]
+    for name in other_rankers:
+        campaign_scheduler, campaign_data = campaign_setup(name, rankers[name])
+        campaigns.append(CampaignConfiguration(scheduler=campaign_scheduler, data=campaign_data,
+                                               initial_ranker=RandomRanker(), ranker=rankers[name],
+                                               budget=n_tasks, keys=range(len(campaign_data))))
+    runner = MultiplexConfiguration(worker=ShareMemorySingleThreadWorkerFactory(), pool=pool, truth=calc,
+                                    campaigns=campaigns, trace=Path(args.trace) if args.trace is not None else None).build()
+    runner.run()
 
 
 # # ---------------------------------------------------------------------------------------
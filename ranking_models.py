@@ -4,6 +4,7 @@ import numpy as np
 from numpy.typing import NDArray
 
 import ami.abc
+import ami.trace
 from ami.abc import SchemaInterface, RankerInterface, Feature, Target
 from ami.abc.ranker import Index
 from ami.schema import Schema
@@ -66,9 +67,11 @@ class SurrogateModelRanker(ami.abc.RankerInterface):
         NDArray[np.float_]
             ranked highest to lowest, element 0 is largest ranked, element -1 is lowest ranked.
         """
-        alpha = self.determine_alpha()
+        with ami.trace.span("acquisition", "ranker"):
+            alpha = self.determine_alpha()
         alpha_x = alpha[x]
-        rankings = np.argsort(alpha_x)[::-1]
+        with ami.trace.span("argsort", "ranker", n=len(alpha_x)):
+            rankings = np.argsort(alpha_x)[::-1]
         return rankings  # index of largest alpha is first
     
     def schema(self) -> SchemaInterface:
@@ -135,3 +138,58 @@ class ExpectedImprovementRanker(SurrogateModelRanker):
         
     
 # ---------------------------------------------------------------------------------------
+
+
+class CostAwareExpectedImprovementRanker(ExpectedImprovementRanker):
+    """Expected improvement per predicted second of calculation.
+    Runtimes are predicted by `cost_model` from per-index cost `features` (e.g. `CifMetadata.cost_features`),
+    refitted on observed wall times before every ranking.
+    """
+    
+    def __init__(self, model, acquisitor, cost_model, features) -> None:
+        super().__init__(model, acquisitor)
+        self.cost_model = cost_model
+        self.features = np.asarray(features, dtype=float)
+        
+    def fit_cost(self, x: Sequence[Feature], runtime: Sequence[float]) -> None:
+        self.cost_model.fit(self.features[np.asarray(x, dtype=int)], runtime)
+    
+    def determine_alpha(self) -> NDArray:
+        """Determine the alpha (ranking values) for all entries in the full dataset.
+
+        Parameters
+        ----------
+        None
+
+        Returns
+        -------
+        NDArray
+            alpha values for each entry in the full dataset, non sorted.
+        """
+        mu, std = self.model.predict()
+        alpha = self.acquisitor.score_points(mu, std, self._ymax, self.cost_model.predict(self.features))
+        return alpha
+        
+    
+# ---------------------------------------------------------------------------------------
+
+
+class MultiFidelityExpectedImprovementRanker(ExpectedImprovementRanker):
+    """Expected improvement at the reference fidelity of a multi fidelity model.
+    Known features are (index, fidelity) pairs whereas ranked features are plain indices.
+    """
+    
+    def fit(self, x: Sequence[Feature], y: Sequence[Target]) -> None:
+        x, y = np.asarray(x, dtype=int).reshape(-1, 2), np.asarray(y)
+        self.model.fit(x, y)
+        reference = x[:, 1] == self.model.n_fidelities - 1
+        self._ymax = np.max(y[reference]) if np.any(reference) else np.max(y)
+        
+    def schema(self) -> SchemaInterface:
+        return Schema(
+            input_schema=[('index', int), ('fidelity', int)],
+            output_schema=[('target', float)]
+        )
+    
+    
+# ---------------------------------------------------------------------------------------
@@ -1,18 +1,27 @@
+import os
+import resource
+import shutil
+import signal
 from dataclasses import dataclass, fields, field
 from io import BytesIO
 from pathlib import Path
-from subprocess import run
-from typing import Union
+from subprocess import Popen, TimeoutExpired
+from time import perf_counter, time
+from typing import Union, ClassVar, Tuple, Sequence, Optional, Dict
 
 import numpy as np
 from ase.io import read
 
 import ami.abc
+import ami.cancel
+import ami.trace
 from ami.abc import SchemaInterface
 from ami.schema import Schema
 
 from ami.serialized_opaque import SerializedOpaque
 
+from workdir import ScratchWorkdir
+
 def find_minimum_image(cell, cutoff):
     ncutoff = cutoff + 1e-8 * cutoff
     V = np.abs(np.linalg.det(cell))
@@ -29,8 +38,78 @@ def find_minimum_image(cell, cutoff):
     return na, nb, nc
 
 
+# shared definition folders already staged by this process
+_STAGED = set()
+
+
+@dataclass(frozen=True, slots=True)
+class SimulationLimits:
+    """Resource limits of a single `simulate` process.
+
+    `wall_time` (seconds) is enforced by the calculator: the process group is sent SIGTERM,
+    then SIGKILL if still alive `grace` seconds later.
+    `cpu_time` (seconds) and `memory` (bytes of address space) are enforced by the kernel through rlimits.
+    `None` means unlimited.
+    Every `poll` seconds, the calculator checks whether the job was cancelled (see `ami.cancel`).
+    """
+    wall_time: Optional[float] = None
+    cpu_time: Optional[int] = None
+    memory: Optional[int] = None
+    grace: float = 10.0
+    poll: float = 1.0
+
+    def apply(self):
+        """Sets rlimits, called in the child process before `simulate` starts."""
+        if self.cpu_time is not None:
+            resource.setrlimit(resource.RLIMIT_CPU, (int(self.cpu_time), int(self.cpu_time)))
+        if self.memory is not None:
+            resource.setrlimit(resource.RLIMIT_AS, (int(self.memory), int(self.memory)))
+
+
+@dataclass(frozen=True, slots=True)
+class SimulationStats:
+    returncode: int
+    timed_out: bool
+    wall_time: float
+    cpu_time: float
+    cancelled: bool = False
+
+    @property
+    def failed(self) -> bool:
+        return self.timed_out or self.cancelled or self.returncode != 0
+
+
+def terminate(proc: Popen, grace: float) -> None:
+    """Terminates the process group of 'proc', escalating to SIGKILL after 'grace' seconds."""
+    for sig in (signal.SIGTERM, signal.SIGKILL):
+        try:
+            os.killpg(proc.pid, sig)
+        except ProcessLookupError:
+            break
+        try:
+            proc.wait(timeout=grace)
+            break
+        except TimeoutExpired:
+            continue
+    proc.wait()
+
+
 @dataclass(frozen=True, slots=True)
 class XeKrSeparation(ami.abc.CalculatorInterface):
+    """GCMC calculation of the Xe/Kr selectivity of a framework using RASPA.
+
+    With `shared`, the definition files common to all frameworks are written once in `<workdir>/shared`
+    and symlinked into job directories, so only `simulation.input` and `simulation.cif` are written per job.
+    With `scratch`, simulations run in node-local scratch folders and only their outputs are kept.
+    Simulations are constrained by `limits`; runs which time out or exit with an error are failures.
+    Cancelled runs (see `ami.cancel`) are stopped and raise `ami.cancel.Cancelled`.
+    With `checkpoint_every`, RASPA writes a binary restart file every `checkpoint_every` cycles: a job whose folder
+    holds one (e.g. after preemption, a timeout or a crash) continues from it with the remaining cycles.
+    With `replicas` > 1, one equilibration run is continued by `replicas` concurrent, independently seeded runs
+    sharing the production cycles, whose loadings and error bars are averaged: the result comes about `replicas` times
+    sooner provided the slot has as many cores (see `ami.worker_pool.SingleNodeWorkerPool`).
+    Statistics of every run are appended to `<workdir>/simulation_stats.csv`.
+    """
     workdir: Path
 
     force_field: str
@@ -40,50 +119,198 @@ class XeKrSeparation(ami.abc.CalculatorInterface):
     krypton: str
     input_template: str
 
+    cycles: int = 1000
+    init_cycles: int = 1000
+    shared: bool = False
+    checkpoint_every: int = 0
+    replicas: int = 1
+    scratch: Optional[ScratchWorkdir] = None
+    limits: SimulationLimits = SimulationLimits()
+
+    templates: ClassVar[Tuple[str, ...]] = (
+        "force_field", "force_field_mixing_rules", "pseudo_atoms", "xenon", "krypton", "input_template"
+    )
+    # Written by RASPA with `ContinueAfterCrash`, relative to the job folder.
+    checkpoint: ClassVar[str] = "CrashRestart/binary_restart.dat"
+
     @classmethod
-    def from_template_folder(cls, workdir: Union[str, Path], path: Union[str, Path]):
-        print()
+    def from_template_folder(cls, workdir: Union[str, Path], path: Union[str, Path], **kwargs):
         path = Path(path)
         data = {}
-        for f in fields(cls):
-            if f.name == "workdir":
+        for name in cls.templates:
+            data[name] = (path / f'{name}.def').read_text("utf8")
+        return cls(workdir=Path(workdir), **data, **kwargs)
+
+    def stage(self) -> Path:
+        """Writes the shared definition files once, returns the folder containing them."""
+        shared = (Path(self.workdir) / "shared").absolute()
+        if shared in _STAGED:
+            return shared
+        shared.mkdir(parents=True, exist_ok=True)
+        for name in self.templates:
+            if name == "input_template":
                 continue
-            data[f.name] = (path / f'{f.name}.def').read_text("utf8")
-        return cls(workdir=Path(workdir), **data)
+            target = shared / f'{name}.def'
+            data = getattr(self, name)
+            if not target.exists() or target.read_text() != data:
+                # Other workers may be staging concurrently: atomic replace.
+                tmp = shared / f'.{name}.def.{os.getpid()}'
+                tmp.write_text(data)
+                os.replace(tmp, target)
+        _STAGED.add(shared)
+        return shared
 
-    def write(self, cif_bytes: bytes, subdir: str):
+    def write_definitions(self, w: Path):
+        if not self.shared:
+            for name in self.templates:
+                if name != "input_template":
+                    (w / f'{name}.def').write_text(getattr(self, name))
+            return
+        shared = self.stage()
+        for name in self.templates:
+            if name == "input_template":
+                continue
+            link = w / f'{name}.def'
+            if not link.is_symlink():
+                if link.exists():
+                    link.unlink()
+                link.symlink_to(shared / f'{name}.def')
+
+    def write(self, cif_bytes: Optional[bytes], subdir: str, supercell: Optional[Sequence[int]] = None,
+              cif_path: Optional[str] = None, seed: Optional[int] = None):
+        """Writes simulation inputs, the CIF being given either as bytes or as a path readable by the worker.
+        Without `seed`, RASPA seeds its random number generator from the time.
+        """
         w = Path(self.workdir)/subdir
         w.mkdir(parents=True, exist_ok=True)
-        atoms = read(BytesIO(cif_bytes), format="cif")
-        cell = np.array(atoms.cell)
 
         cutoff = 16.0
-        na, nb, nc = find_minimum_image(cell, cutoff)
+        if supercell is None:
+            with ami.trace.span("read_cif", "raspa"):
+                atoms = read(BytesIO(cif_bytes) if cif_path is None else cif_path, format="cif")
+            cell = np.array(atoms.cell)
+            supercell = find_minimum_image(cell, cutoff)
+        # else precomputed, see `cif_metadata.CifMetadata`
+
+        if cif_path is None:
+            (w / "simulation.cif").write_bytes(cif_bytes)
+        else:
+            shutil.copyfile(cif_path, w / "simulation.cif")
 
-        for f in fields(self.__class__):
-            name = f.name
-            if (name != "input_template") and (name != "workdir"):
-                data = getattr(self, name)
-                (w / f'{name}.def').write_text(data)
-            else:
-                tpl = self.input_template
-                data = tpl.format(cutoff=cutoff, na=na, nb=nb, nc=nc)
-                (w / "simulation.input").write_text(data)
+        if self.replicas <= 1:
+            self.write_input(w, supercell, cutoff, cycles=self.cycles, init_cycles=self.init_cycles, seed=seed)
+            return
 
-        (w / "simulation.cif").write_bytes(cif_bytes)
+        # One equilibration, continued by replicas each running their share of production cycles.
+        base = (self.replicas + 1) * (seed or 0)
+        self.write_input(w / "equilibration", supercell, cutoff, cycles=0, init_cycles=self.init_cycles, seed=base + 1)
+        for r in range(self.replicas):
+            self.write_input(w / f"replica_{r}", supercell, cutoff, cycles=-(-self.cycles // self.replicas),
+                             init_cycles=0, restart=True, seed=base + r + 2)
+
+    def write_input(self, w: Path, supercell: Sequence[int], cutoff: float, cycles: int, init_cycles: int,
+                    restart: bool = False, seed: Optional[int] = None):
+        """Writes the inputs of a single RASPA run in `w`, copying `simulation.cif` from the parent folder if missing."""
+        w.mkdir(parents=True, exist_ok=True)
+        self.write_definitions(w)
+        na, nb, nc = (int(n) for n in supercell)
+        tpl = self.input_template
+        data = tpl.format(cutoff=cutoff, na=na, nb=nb, nc=nc, cycles=cycles, init_cycles=init_cycles,
+                          continue_after_crash="yes" if self.checkpoint_every > 0 else "no",
+                          # Only read by RASPA with `ContinueAfterCrash`, must not be 0 anyway.
+                          checkpoint_every=max(self.checkpoint_every, 1),
+                          restart="yes" if restart else "no",
+                          # Replicas started together must not share the (time based) default seed.
+                          random_seed="" if seed is None else f"RandomSeed                    {seed:d}")
+        (w / "simulation.input").write_text(data)
+        if not (w / "simulation.cif").exists():
+            shutil.copyfile(w.parent / "simulation.cif", w / "simulation.cif")
+
+        if self.resumable(w):
+            # RASPA continues from the checkpoint, outputs included.
+            return
 
         # Remove existing data if relevant
         for out_path in w.glob("Output/System_0/*.data"):
             out_path.unlink()
 
-    def run_external(self, subdir: str):
-        run(["simulate", "simulation.input"], cwd=self.workdir/subdir)
+    def resumable(self, w: Path) -> bool:
+        """`True` if the job folder `w` holds a checkpoint to continue from."""
+        return self.checkpoint_every > 0 and (w / self.checkpoint).is_file()
 
-    def parse_output(self, subdir: str):
-        base_path = list((self.workdir/subdir).glob("Output/System_0/*.data"))[0]
+    def runs(self, subdir: str) -> Tuple[str, ...]:
+        """Subfolders of the RASPA runs producing the results of the job in `subdir`."""
+        if self.replicas <= 1:
+            return subdir,
+        return tuple(str(Path(subdir) / f"replica_{r}") for r in range(self.replicas))
+
+    def share_equilibration(self, subdir: str) -> None:
+        """Starts every replica from the final configuration of the equilibration run."""
+        w = Path(self.workdir) / subdir
+        for r in range(self.replicas):
+            initial = w / f"replica_{r}" / "RestartInitial"
+            shutil.rmtree(initial, ignore_errors=True)
+            shutil.copytree(w / "equilibration" / "Restart", initial)
 
+    def run_external(self, *subdirs: str) -> SimulationStats:
+        """Runs `simulate` in each of `subdirs` concurrently, the wall time limit applying to all of them."""
+        limits = self.limits
+        cpu_start = resource.getrusage(resource.RUSAGE_CHILDREN)
+        start = perf_counter()
+        # New session: the whole process group can be reaped on timeout.
+        procs = [Popen(["simulate", "simulation.input"], cwd=self.workdir/subdir,
+                       start_new_session=True, preexec_fn=limits.apply) for subdir in subdirs]
+        timed_out, cancelled = False, False
+        try:
+            while running := [proc for proc in procs if proc.poll() is None]:
+                if any(proc.returncode for proc in procs if proc.returncode is not None):
+                    # A failed run fails the job, others are not waited for.
+                    break
+                if ami.cancel.cancelled():
+                    cancelled = True
+                    break
+                left = None if limits.wall_time is None else limits.wall_time - (perf_counter() - start)
+                if left is not None and left <= 0:
+                    timed_out = True
+                    break
+                try:
+                    running[0].wait(timeout=limits.poll if left is None else min(limits.poll, left))
+                except TimeoutExpired:
+                    pass
+        finally:
+            for proc in procs:
+                if proc.poll() is None:
+                    terminate(proc, limits.grace)
+        cpu_end = resource.getrusage(resource.RUSAGE_CHILDREN)
+        cpu_time = (cpu_end.ru_utime + cpu_end.ru_stime) - (cpu_start.ru_utime + cpu_start.ru_stime)
+        returncode = next((proc.returncode for proc in procs if proc.returncode), 0)
+        return SimulationStats(returncode, timed_out, perf_counter() - start, cpu_time, cancelled)
+
+    def record(self, subdir: str, stats: SimulationStats) -> None:
+        path = Path(self.workdir) / "simulation_stats.csv"
+        path.parent.mkdir(parents=True, exist_ok=True)
+        if not path.exists():
+            # Header written aside then linked into place: the file never exists without it,
+            # even if workers are recording concurrently.
+            tmp = path.with_name(f".{path.name}.{os.getpid()}")
+            tmp.write_text("#subdir,returncode,timed_out,wall_time,cpu_time,finished,cancelled\n")
+            try:
+                os.link(tmp, path)
+            except FileExistsError:
+                pass
+            finally:
+                tmp.unlink()
+        line = (f"{subdir},{stats.returncode:d},{stats.timed_out:d},{stats.wall_time:.3f},{stats.cpu_time:.3f},"
+                f"{time():.3f},{stats.cancelled:d}\n")
+        # Single short write in append mode, safe with concurrent workers.
+        with path.open(mode="a") as fd:
+            fd.write(line)
+
+    @staticmethod
+    def parse_data(path: Path) -> Dict[str, Tuple[float, float]]:
+        """Average absolute loading and its error bar of each component in a RASPA output file."""
         components = {}
-        with base_path.open(mode="r") as fd:
+        with path.open(mode="r") as fd:
             for line in fd:
                 if "Number of molecules:" in line:
                     break
@@ -91,22 +318,119 @@ class XeKrSeparation(ami.abc.CalculatorInterface):
                 if line.startswith("Component"):
                     name = line.split()[-1][1:-1]
                 if "Average loading absolute   " in line:
-                    res = float(line.split(" +/-")[0].split()[-1])
-                    components[name] = res
+                    value, error = line.split(" +/-")
+                    components[name] = (float(value.split()[-1]), float(error.split()[0]))
         return components
 
+    def parse_loadings(self, subdir: str) -> Dict[str, Tuple[float, float]]:
+        """Loading and error bar of each component, averaged over replicas (which run as many cycles each)."""
+        runs = [self.parse_data(list((self.workdir/run).glob("Output/System_0/*.data"))[0]) for run in self.runs(subdir)]
+        loadings = {}
+        for name in runs[0]:
+            values, errors = np.array([run[name] for run in runs]).T
+            loadings[name] = (float(np.mean(values)), float(np.sqrt(np.sum(errors ** 2)) / len(runs)))
+        return loadings
+
+    def parse_output(self, subdir: str):
+        return {name: value for name, (value, _) in self.parse_loadings(subdir).items()}
+
+    @staticmethod
+    def job_folder(parameters: SerializedOpaque) -> str:
+        """Folder of a job, relative to `workdir`. Copies run with another `seed` (e.g. speculative duplicates)
+        get their own folder so that they never clash with the original.
+        """
+        seed = parameters.get("seed")
+        return parameters["subdir"] if not seed else f"{parameters['subdir']}_{seed:d}"
+
     def calculate(self, parameters: SerializedOpaque) -> SerializedOpaque:
-        subdir = parameters["subdir"]
-        cif_bytes = parameters["cif_content"]
-        self.write(cif_bytes, subdir=subdir)
-        self.run_external(subdir=subdir)
-        components = self.parse_output(subdir=subdir)
+        if self.scratch is None:
+            return self._calculate(parameters, self.job_folder(parameters))
+        with self.scratch.job(Path(self.workdir) / self.job_folder(parameters)) as scratch:
+            # `workdir / scratch` is `scratch` as the latter is absolute.
+            return self._calculate(parameters, str(scratch))
+
+    def _calculate(self, parameters: SerializedOpaque, subdir: str) -> SerializedOpaque:
+        name = self.job_folder(parameters)
+        cif_path = parameters.get("cif_path")
+        cif_bytes = parameters["cif_content"] if cif_path is None else None
+        with ami.trace.span("write", "raspa", job=name):
+            self.write(cif_bytes, subdir=subdir, supercell=parameters.get("supercell"), cif_path=cif_path,
+                       seed=parameters.get("seed"))
+        if self.replicas > 1 and not self.equilibrated(subdir):
+            with ami.trace.span("simulate", "raspa", job=f"{name}/equilibration", runs=1):
+                stats = self.run_external(str(Path(subdir) / "equilibration"))
+            self.record(f"{name}/equilibration", stats)
+            self.check(name, stats)
+        if self.replicas > 1:
+            self.share_equilibration(subdir)
+        runs = self.runs(subdir)
+        with ami.trace.span("simulate", "raspa", job=name, runs=len(runs)):
+            stats = self.run_external(*runs)
+        self.record(name, stats)
+        self.check(name, stats)
+        with ami.trace.span("parse_output", "raspa", job=name):
+            components = self.parse_output(subdir=subdir)
+        # Done: a later run of the same job must start afresh.
+        for run in runs:
+            shutil.rmtree(Path(self.workdir) / run / Path(self.checkpoint).parent, ignore_errors=True)
+        shutil.rmtree(Path(self.workdir) / subdir / "equilibration" / "Restart", ignore_errors=True)
         absorbed_Xe = components["xenon"]
         absorbed_Kr = components["krypton"]
         return np.log(1 + (4 * absorbed_Xe)) - np.log(1 + absorbed_Kr)
 
+    def equilibrated(self, subdir: str) -> bool:
+        """`True` if the shared equilibration of replicas already completed, RASPA writing restart files at the end."""
+        return any((Path(self.workdir) / subdir / "equilibration" / "Restart" / "System_0").glob("*"))
+
+    @staticmethod
+    def check(subdir: str, stats: SimulationStats) -> None:
+        if stats.cancelled:
+            raise ami.cancel.Cancelled(f"Simulation '{subdir}' was cancelled.")
+        if stats.failed:
+            reason = "timed out" if stats.timed_out else f"exited with code {stats.returncode}"
+            raise RuntimeError(f"Simulation '{subdir}' {reason}.")
+
     def schema(self) -> SchemaInterface:
         return Schema(
             input_schema=[('cif_content', bytes), ('subdir', str)],
             output_schema=[('selectivity', float)]
         )
+
+
+@dataclass(frozen=True, slots=True)
+class MultiFidelityXeKrSeparation(ami.abc.CalculatorInterface):
+    """Runs `XeKrSeparation` at one of several fidelities, from cheapest to most accurate.
+
+    The fidelity is read from the `fidelity` parameter, the last one being the reference (full length) simulation.
+    Each fidelity runs in its own working directory so that results of the same framework never clash.
+    """
+    fidelities: Tuple[XeKrSeparation, ...]
+
+    @classmethod
+    def from_template_folder(cls,
+                             workdir: Union[str, Path],
+                             path: Union[str, Path],
+                             cycles: Sequence[Tuple[int, int]] = ((200, 200), (1000, 1000)),
+                             **kwargs
+                             ):
+        """`cycles` is a sequence of (initialisation cycles, production cycles), one per fidelity."""
+        workdir = Path(workdir)
+        fidelities = tuple(
+            XeKrSeparation.from_template_folder(workdir / f"fidelity_{i}", path, init_cycles=init, cycles=prod, **kwargs)
+            for i, (init, prod) in enumerate(cycles)
+        )
+        return cls(fidelities=fidelities)
+
+    def costs(self) -> Tuple[float, ...]:
+        """Nominal cost of each fidelity, proportional to the total number of Monte Carlo cycles."""
+        return tuple(float(f.init_cycles + f.cycles) for f in self.fidelities)
+
+    def calculate(self, parameters: SerializedOpaque) -> SerializedOpaque:
+        fidelity = parameters.get("fidelity", len(self.fidelities) - 1)
+        return self.fidelities[fidelity].calculate(parameters)
+
+    def schema(self) -> SchemaInterface:
+        return Schema(
+            input_schema=[('cif_content', bytes), ('subdir', str), ('fidelity', int)],
+            output_schema=[('selectivity', float)]
+        )
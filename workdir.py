@@ -0,0 +1,90 @@
+import fcntl
+import os
+import shutil
+import tempfile
+import zipfile
+from contextlib import contextmanager
+from dataclasses import dataclass
+from pathlib import Path
+from typing import Optional, Tuple, Iterator, Union
+
+
+def default_scratch() -> Path:
+    """Node-local scratch: `/dev/shm` when usable, else `$TMPDIR` (or the system temporary folder)."""
+    shm = Path("/dev/shm")
+    if shm.is_dir() and os.access(shm, os.W_OK):
+        return shm
+    return Path(tempfile.gettempdir())
+
+
+@dataclass(frozen=True, slots=True)
+class ScratchWorkdir:
+    """Runs each job in a fresh node-local scratch folder and only keeps the outputs that matter.
+
+    Files matching `keep` (relative to the job folder) are either copied back into the job folder
+    or, if `archive` is set, appended (compressed) to a single zip archive shared by the whole campaign.
+    Archive entries are named `<workdir name>/<subdir>/<file>`.
+    Everything else is deleted when the job finishes, successfully or not.
+    Files matching `resume` (e.g. checkpoints) are copied into the scratch folder before the job starts
+    and mirrored back into the job folder (never archived) when it finishes, so that an interrupted job can continue.
+    """
+    root: Optional[Path] = None
+    keep: Tuple[str, ...] = ("Output/System_0/*.data",)
+    archive: Optional[Path] = None
+    resume: Tuple[str, ...] = ()
+
+    @classmethod
+    def from_paths(cls, root: Optional[Union[str, Path]] = None, archive: Optional[Union[str, Path]] = None, **kwargs):
+        return cls(
+            root=None if root is None else Path(root),
+            archive=None if archive is None else Path(archive).absolute(),
+            **kwargs
+        )
+
+    @contextmanager
+    def job(self, jobdir: Path) -> Iterator[Path]:
+        """Yields a scratch folder standing in for 'jobdir', collects outputs and cleans up on exit."""
+        root = default_scratch() if self.root is None else self.root
+        root.mkdir(parents=True, exist_ok=True)
+        scratch = Path(tempfile.mkdtemp(prefix=f"ami_{jobdir.name}_", dir=root))
+        try:
+            self.mirror(jobdir, scratch)
+            yield scratch
+        finally:
+            try:
+                self.mirror(scratch, jobdir)
+                self.collect(scratch, jobdir)
+            finally:
+                shutil.rmtree(scratch, ignore_errors=True)
+
+    def mirror(self, source: Path, dest: Path) -> None:
+        """Replaces files matching `resume` in `dest` by those in `source`."""
+        for pattern in self.resume:
+            for path in dest.glob(pattern):
+                if path.is_file():
+                    path.unlink()
+            for path in source.glob(pattern):
+                if path.is_file():
+                    target = dest / path.relative_to(source)
+                    target.parent.mkdir(parents=True, exist_ok=True)
+                    shutil.copyfile(path, target)
+
+    def collect(self, scratch: Path, jobdir: Path) -> None:
+        kept = [p for pattern in self.keep for p in scratch.glob(pattern) if p.is_file()]
+        if self.archive is None:
+            for path in kept:
+                dest = jobdir / path.relative_to(scratch)
+                dest.parent.mkdir(parents=True, exist_ok=True)
+                shutil.copyfile(path, dest)
+            return
+        prefix = Path(*jobdir.parts[-2:])
+        self.archive.parent.mkdir(parents=True, exist_ok=True)
+        # Several workers append to the same archive: serialise through an exclusive lock.
+        with open(self.archive.with_name(self.archive.name + ".lock"), "w") as lock:
+            fcntl.flock(lock, fcntl.LOCK_EX)
+            try:
+                with zipfile.ZipFile(self.archive, mode="a", compression=zipfile.ZIP_DEFLATED) as zf:
+                    for path in kept:
+                        zf.write(path, arcname=str(prefix / path.relative_to(scratch)))
+            finally:
+                fcntl.flock(lock, fcntl.LOCK_UN)